@@ -0,0 +1,128 @@
+"""Background actuator for theme and blue-light changes.
+
+Applying a theme or blue-light level means registry edits, gsettings,
+redshift, osascript or DDC brightness round trips, each of which can take
+seconds. ThemeActuator moves that work off the request thread: callers record
+the state they want and return immediately, and a single worker applies the
+latest desired state. Requests that arrive while the worker is busy are
+coalesced (only the newest value is applied) and values that already match
+what is on screen are skipped.
+
+A backend is any object with apply_theme(theme) and apply_blue_light(level)
+methods that return True on success. FakeThemeBackend records calls instead
+of touching the OS, for headless Linux and tests.
+"""
+import threading
+import time
+from metrics import timer, ACTUATOR_LATENCY
+
+
+class FakeThemeBackend:
+    """Stand-in backend that records calls, optionally simulating slow hardware"""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = []
+
+    def apply_theme(self, theme):
+        time.sleep(self.delay)
+        self.calls.append(("theme", theme))
+        return True
+
+    def apply_blue_light(self, level):
+        time.sleep(self.delay)
+        self.calls.append(("blue_light", level))
+        return True
+
+
+class ThemeActuator:
+    """Single worker thread that applies the newest desired theme state"""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.cond = threading.Condition()
+        self.desired = {"theme": None, "blue_light": None}
+        self.applied = {"theme": None, "blue_light": None}
+        self.requested_version = 0
+        self.applied_version = 0
+        self.last_ok = None
+        self.requests = 0
+        self.backend_calls = 0
+        self.skipped = 0
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def request(self, theme=None, blue_light=None):
+        """Record the desired state and wake the worker; never blocks on the OS"""
+        with self.cond:
+            if theme is not None:
+                self.desired["theme"] = theme
+            if blue_light is not None:
+                self.desired["blue_light"] = blue_light
+            self.requests += 1
+            self.requested_version += 1
+            self.cond.notify_all()
+            return self._status()
+
+    def wait(self, timeout=None):
+        """Block until everything requested so far has been applied"""
+        with self.cond:
+            target = self.requested_version
+            return self.cond.wait_for(lambda: self.applied_version >= target, timeout)
+
+    def status(self):
+        with self.cond:
+            return self._status()
+
+    def _status(self):
+        if self.applied_version < self.requested_version:
+            state = "pending"
+        elif self.last_ok is False:
+            state = "failed"
+        else:
+            state = "applied"
+        return {
+            "status": state,
+            "requested_version": self.requested_version,
+            "applied_version": self.applied_version,
+            "desired": dict(self.desired),
+            "applied": dict(self.applied),
+            "requests": self.requests,
+            "backend_calls": self.backend_calls,
+            "skipped": self.skipped
+        }
+
+    def _run(self):
+        while True:
+            with self.cond:
+                self.cond.wait_for(lambda: self.applied_version < self.requested_version)
+                version = self.requested_version
+                target = dict(self.desired)
+                current = dict(self.applied)
+
+            ok = True
+            # Blue light first, then the theme
+            for key, apply in (("blue_light", self.backend.apply_blue_light),
+                               ("theme", self.backend.apply_theme)):
+                if target[key] is None:
+                    continue
+                if target[key] == current[key]:
+                    with self.cond:
+                        self.skipped += 1
+                    continue
+                try:
+                    with timer(ACTUATOR_LATENCY, actuator=key):
+                        success = bool(apply(target[key]))
+                except Exception as e:
+                    print(f"Actuator {key} error: {e}")
+                    success = False
+                with self.cond:
+                    self.backend_calls += 1
+                    # Forget the applied value on failure so the next request retries
+                    self.applied[key] = target[key] if success else None
+                ok = ok and success
+
+            with self.cond:
+                self.applied_version = version
+                self.last_ok = ok
+                self.cond.notify_all()
@@ -1,9 +1,14 @@
 from flask import Flask, request, jsonify
 from flask_cors import CORS 
-import cv2, numpy as np, screen_brightness_control as sbc
+import threading
+from luminance import estimate_luminance
+from providers import cv2
+from display_manager import get_display_manager
+from metrics import instrument_app, timer, FRAME_STAGE_LATENCY
 
 app = Flask(__name__)
 CORS(app) 
+instrument_app(app, "brightness")
 def compute_screen_brightness(avg_pixel_brightness, theme_mode="Dark"):
     if avg_pixel_brightness < 25:
         return 0
@@ -14,6 +19,84 @@ def compute_screen_brightness(avg_pixel_brightness, theme_mode="Dark"):
         return (rounded // 2) if theme_mode == "Dark" else max(0, (rounded // 2) - 10)
 
 
+class BrightnessController:
+    """Smooths ambient readings and only touches the display when it has to.
+
+    Each reading is folded into an exponential moving average. The target is
+    only recomputed once the smoothed ambient level leaves a hysteresis band
+    around the level that produced the last write (or the theme changes), and
+    the display write is skipped when the target equals the applied value.
+    """
+
+    def __init__(self, alpha=0.3, hysteresis=8):
+        self.alpha = alpha              # EMA weight of the newest reading
+        self.hysteresis = hysteresis    # gray levels the ambient must move before retargeting
+        self.ambient = None
+        self.anchor_ambient = None      # smoothed ambient at the last retarget
+        self.anchor_theme = None
+        self.applied = None             # last brightness written to the display
+        self.hardware_writes = 0
+        self.writes_saved = 0
+        self.lock = threading.Lock()
+
+    def smooth(self, avg_pixel_brightness):
+        """Fold a new reading into the EMA and return the smoothed level"""
+        with self.lock:
+            if self.ambient is None:
+                self.ambient = float(avg_pixel_brightness)
+            else:
+                self.ambient += self.alpha * (avg_pixel_brightness - self.ambient)
+            return self.ambient
+
+    def update(self, theme_mode):
+        """Apply the brightness for the current smoothed ambient level.
+
+        Returns (screen_brightness, written) where written tells whether the
+        hardware was actually touched.
+        """
+        with self.lock:
+            inside_band = (
+                self.applied is not None
+                and theme_mode == self.anchor_theme
+                and abs(self.ambient - self.anchor_ambient) < self.hysteresis
+            )
+            if inside_band:
+                self.writes_saved += 1
+                return self.applied, False
+
+            target = compute_screen_brightness(self.ambient, theme_mode)
+            if target == self.applied:
+                self._anchor(theme_mode)
+                self.writes_saved += 1
+                return target, False
+
+            results = get_display_manager().set_brightness(target)
+            if not any(results.values()):
+                # Keep the old anchor so the next update retries instead of settling inside the band
+                print("Brightness setting error: no display accepted the change")
+                return target, False
+            self._anchor(theme_mode)
+            self.applied = target
+            self.hardware_writes += 1
+            return target, True
+
+    def _anchor(self, theme_mode):
+        self.anchor_ambient = self.ambient
+        self.anchor_theme = theme_mode
+
+    def stats(self):
+        with self.lock:
+            return {
+                "smoothed_ambient": round(self.ambient, 1) if self.ambient is not None else None,
+                "applied_brightness": self.applied,
+                "hardware_writes": self.hardware_writes,
+                "writes_saved": self.writes_saved
+            }
+
+
+brightness_controller = BrightnessController()
+
+
 @app.route("/")
 def home():
     return jsonify({"status": "Flask server is running!", "port": 5001})
@@ -31,34 +114,52 @@ def adjust_brightness():
     # Get ambient light level
     avg_pixel_brightness = 100  # Default
     try:
-        cap = cv2.VideoCapture(0)
-        if cap.isOpened():
-            ret, frame = cap.read()
-            if ret:
-                gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-                avg_pixel_brightness = float(np.mean(gray))
-            cap.release()
+        with timer(FRAME_STAGE_LATENCY, stage="ambient_capture"):
+            cap = cv2.VideoCapture(0)
+            if cap.isOpened():
+                ret, frame = cap.read()
+                if ret:
+                    avg_pixel_brightness = estimate_luminance(frame)
+                cap.release()
     except Exception as e:
         print(f"Webcam error: {e}")
     
+    # Smooth out single-frame flicker before deciding anything
+    smoothed_ambient = brightness_controller.smooth(avg_pixel_brightness)
+    
     # Auto-detect theme if requested
     if theme_mode == "auto":
-        theme_mode = "Light" if avg_pixel_brightness > 127 else "Dark"
-    
-    # Calculate screen brightness
-    screen_brightness = compute_screen_brightness(avg_pixel_brightness, theme_mode)
+        theme_mode = "Light" if smoothed_ambient > 127 else "Dark"
     
-    # Apply brightness
-    try:
-        sbc.set_brightness(screen_brightness)
-    except Exception as e:
-        print(f"Brightness setting error: {e}")
+    # Calculate and apply screen brightness (skipped when nothing changed)
+    screen_brightness, written = brightness_controller.update(theme_mode)
     
     return jsonify({
         "avg_pixel_brightness": avg_pixel_brightness,
+        "smoothed_ambient": round(smoothed_ambient, 1),
         "screen_brightness": screen_brightness,
         "theme_mode": theme_mode,
-        "detected_theme": "Light" if avg_pixel_brightness > 127 else "Dark"
+        "detected_theme": "Light" if smoothed_ambient > 127 else "Dark",
+        "applied": written,
+        "writes_saved": brightness_controller.writes_saved
     })
+
+@app.route("/brightness_controller", methods=["GET"])
+def brightness_controller_stats():
+    """How many hardware brightness writes the controller made and avoided"""
+    return jsonify(brightness_controller.stats())
+
+@app.route("/displays", methods=["GET", "POST"])
+def displays():
+    """GET: brightness of every display. POST {"targets": {"name#index" or index: value}}: set per display"""
+    manager = get_display_manager()
+    if request.method == "POST":
+        data = request.json or {}
+        targets = data.get("targets")
+        if targets is None:
+            return jsonify({"error": "targets is required"}), 400
+        return jsonify({"applied": manager.set_brightness(targets)})
+    return jsonify({"displays": manager.get_brightness()})
+
 if __name__ == "__main__":
     app.run(port=5001)
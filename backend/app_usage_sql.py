@@ -1,16 +1,36 @@
-import time, psutil, win32gui, win32process, threading, sqlite3
-import screen_brightness_control as sbc
+import time, threading
+from display_manager import get_display_manager
+from foreground import get_foreground_source
+from timeseries import SampleStore, THEME_NAMES
+from dashboard import (DashboardCache, recent_sessions, usage_summary_panel, usage_by_hour_panel,
+                       theme_stats_panel, brightness_stats_panel)
+from http_cache import ResponseCache, cached_endpoint
+from metrics import instrument_app, timed_connect
+from retention import RetentionJob, ensure_schema, attach_archive, generation
+from ingest import IngestStore, IngestError, decode_batch, MAX_BATCH_BYTES
+from uploader import SessionUploader
+from columnar import get_session_columns
+from streams import Broadcast
+from asgi import AsgiApp, asgi_enabled, serve, stream_response
 import platform
 import subprocess
-from flask import Flask, jsonify
+import urllib.request
+import atexit
+import csv
+import io
+import json
+import os
+import uuid
+from flask import Flask, jsonify, request, Response, stream_with_context
 from flask_cors import CORS
 
 app = Flask(__name__)
 CORS(app)
+instrument_app(app, "app_usage")
 
 # Database setup
 DB_FILE = "app_usage.db"
-conn = sqlite3.connect(DB_FILE, check_same_thread=False)
+conn = timed_connect(DB_FILE, check_same_thread=False)
 c = conn.cursor()
 
 # Database setup with session tracking including brightness and theme
@@ -27,23 +47,117 @@ CREATE TABLE IF NOT EXISTS app_sessions (
 """)
 conn.commit()
 
+# ensure_schema adds newer columns (duration_ms) to older databases. Old sessions live in an
+# attached archive; history queries read the all_sessions view
+ensure_schema(conn)
+attach_archive(conn)
+retention_job = RetentionJob(DB_FILE)
+RETENTION_INTERVAL = 6 * 3600
+
+# Sessions uploaded by other trackers (POST /ingest), with per-device rollups. They are kept
+# in fleet_sessions, apart from this machine's app_sessions, and only /fleet/* reads them.
+ingest_store = IngestStore(DB_FILE)
+
+# When set, this tracker's sessions are also uploaded to that aggregation server's /ingest
+INGEST_URL = os.environ.get("INGEST_URL")
+uploader = SessionUploader(INGEST_URL) if INGEST_URL else None
+
+# Periodic brightness/theme samples, packed a few bytes each
+sample_store = SampleStore(DB_FILE)
+atexit.register(sample_store.flush)
+SAMPLE_INTERVAL = 15
+MAX_SAMPLES_RETURNED = 2000
+
+# Serialized read responses, validated against the sessions high-water mark
+response_cache = ResponseCache()
+
+# NumPy columns of every session, live and archived, for the group-by endpoints
+session_columns = get_session_columns(DB_FILE, "app_usage")
+
+# All dashboard panels from one view of the columns, cached until a new session is logged
+dashboard_cache = DashboardCache(DB_FILE, session_columns)
+
+def sessions_version():
+    """MAX(id), today's date and the retention generation: changes whenever a read endpoint's answer can"""
+    db = timed_connect(DB_FILE)
+    try:
+        max_id, today = db.execute("SELECT MAX(id), date('now') FROM app_sessions").fetchone()
+        return max_id, today, generation(db)
+    finally:
+        db.close()
+
+# Bulk export: rows are streamed in batches from a cursor, never held all at once
+EXPORT_COLUMNS = ["id", "app", "start_time", "end_time", "duration_seconds", "brightness", "theme_mode", "duration_ms"]
+EXPORT_BATCH_SIZE = 1000
+EXPORT_DIR = "exports"
+
+# Fatigue API is woken through this endpoint whenever a session is logged
+FATIGUE_NOTIFY_URL = "http://127.0.0.1:5005/notify_session"
+
+# Live session events for /events (server-sent events); a reconnecting client resumes from Last-Event-ID.
+# Event ids carry this process's boot id, so an id from before a restart replays what is kept instead.
+events = Broadcast(history=256)
+EVENTS_BOOT = uuid.uuid4().hex[:8]
+EVENT_HEARTBEAT = 15.0
+
 # Track current app session
 current_app = None
 session_start_time = None
+session_start_epoch = None
+foreground_source = None
+
+# Polling backs off from MIN to MAX while the foreground app stays the same;
+# event-driven sources only use MAX_WAIT as a safety-net recheck
+MIN_POLL_INTERVAL = 0.25
+MAX_POLL_INTERVAL = 5.0
+EVENT_MAX_WAIT = 60.0
+
+# Seconds a brightness/theme reading stays valid; probes are slow (DDC, registry, subprocess)
+BRIGHTNESS_MAX_AGE = 30
+THEME_MAX_AGE = 60
+
+class CachedProbe:
+    """Runs an expensive probe at most once per max_age seconds"""
+
+    def __init__(self, probe, max_age):
+        self.probe = probe
+        self.max_age = max_age
+        self.value = None
+        self.taken_at = None
+        self.runs = 0
+        self.lock = threading.Lock()
+
+    def get(self):
+        with self.lock:
+            if self.taken_at is None or time.monotonic() - self.taken_at >= self.max_age:
+                self._take()
+            return self.value
+
+    def refresh(self):
+        """Probe now regardless of age; the reading is cached for get() as usual"""
+        with self.lock:
+            return self._take()
+
+    def _take(self):
+        self.value = self.probe()
+        self.taken_at = time.monotonic()
+        self.runs += 1
+        return self.value
+
+def format_timestamp(epoch):
+    """Local time with milliseconds, e.g. 2025-01-31 14:05:09.250"""
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(epoch)) + f".{int(epoch * 1000) % 1000:03d}"
 
 def get_active_app():
-    try:
-        hwnd = win32gui.GetForegroundWindow()
-        tid, pid = win32process.GetWindowThreadProcessId(hwnd)
-        process = psutil.Process(pid)
-        return process.name()
-    except Exception:
-        return "Unknown"
+    global foreground_source
+    if foreground_source is None:
+        foreground_source = get_foreground_source()
+    return foreground_source.active_app()
 
 def get_current_brightness():
-    """Get current screen brightness"""
+    """Get current screen brightness (average over all displays)"""
     try:
-        return sbc.get_brightness()[0]  # Returns first monitor's brightness
+        return get_display_manager().average_brightness()
     except:
         return None
 
@@ -72,176 +186,390 @@ def get_current_theme():
     except:
         return "Unknown"
 
+def notify_new_session():
+    """Tell the fatigue API a new session was inserted (best effort)"""
+    try:
+        req = urllib.request.Request(FATIGUE_NOTIFY_URL, data=b"{}", method="POST",
+                                     headers={"Content-Type": "application/json"})
+        urllib.request.urlopen(req, timeout=1).close()
+    except Exception:
+        pass  # Fatigue API not running
+
+brightness_probe = CachedProbe(get_current_brightness, BRIGHTNESS_MAX_AGE)
+theme_probe = CachedProbe(get_current_theme, THEME_MAX_AGE)
+
+def sample_display_state():
+    """Background loop: record brightness and theme every SAMPLE_INTERVAL seconds.
+
+    Samples always probe afresh: SAMPLE_INTERVAL is shorter than the probes' max age, so cached
+    readings would repeat earlier samples. Session boundaries then reuse these readings.
+    """
+    while True:
+        sample_store.record(time.time(), brightness_probe.refresh(), theme_probe.refresh())
+        time.sleep(SAMPLE_INTERVAL)
+
+def summarize_session(start_epoch, end_epoch, fallback_brightness, fallback_theme):
+    """Session brightness/theme from the samples taken during it"""
+    summary = sample_store.aggregate(start_epoch, end_epoch)
+    brightness = summary["avg_brightness"]
+    theme = summary["dominant_theme"]
+    return (
+        int(round(brightness)) if brightness is not None else fallback_brightness,
+        theme if theme is not None else fallback_theme
+    )
+
 def log_active_app():
-    """Background loop: track app sessions with start/end times including brightness and theme"""
-    global current_app, session_start_time
+    """Background loop: track app sessions with start/end times including brightness and theme.
+
+    Event-driven sources wake the loop on foreground changes; otherwise the
+    poll interval shrinks right after a switch and backs off while idle.
+    Brightness and theme are probed at session boundaries, and reuse a cached
+    reading if it is recent.
+    """
+    global current_app, session_start_time, session_start_epoch
+    
+    # Own connection so the tracker never shares a cursor with request handlers
+    tracker_conn = timed_connect(DB_FILE)
+    poll_interval = MIN_POLL_INTERVAL
     
     while True:
         app_name = get_active_app()
-        current_time = time.strftime("%Y-%m-%d %H:%M:%S")
-        current_brightness = get_current_brightness()
-        current_theme = get_current_theme()
         
-       
         if app_name != current_app:
+            now = time.time()
+            current_time = format_timestamp(now)
+            current_brightness = brightness_probe.get()
+            current_theme = theme_probe.get()
           
-            if current_app is not None and session_start_time is not None:
-                duration = int(time.time() - time.mktime(time.strptime(session_start_time, "%Y-%m-%d %H:%M:%S")))
-                c.execute(
-                    "INSERT INTO app_sessions (app, start_time, end_time, duration_seconds, brightness, theme_mode) VALUES (?, ?, ?, ?, ?, ?)",
-                    (current_app, session_start_time, current_time, duration, current_brightness, current_theme)
+            if current_app is not None and session_start_epoch is not None:
+                duration_ms = int(round((now - session_start_epoch) * 1000))
+                duration = int(round(duration_ms / 1000))
+                session_brightness, session_theme = summarize_session(
+                    session_start_epoch, now, current_brightness, current_theme
+                )
+                tracker_conn.execute(
+                    "INSERT INTO app_sessions (app, start_time, end_time, duration_seconds, brightness, theme_mode, duration_ms) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (current_app, session_start_time, current_time, duration, session_brightness, session_theme, duration_ms)
                 )
-                conn.commit()
-                print(f"Session ended: {current_app} ({duration}s), Brightness: {current_brightness}%, Theme: {current_theme}")
+                tracker_conn.commit()
+                response_cache.invalidate()
+                notify_new_session()
+                events.publish(("session_ended", {
+                    "app": current_app, "start_time": session_start_time, "end_time": current_time,
+                    "duration_ms": duration_ms, "brightness": session_brightness, "theme_mode": session_theme
+                }))
+                if uploader is not None:
+                    uploader.enqueue({
+                        "app": current_app, "start_time": session_start_time, "end_time": current_time,
+                        "duration_seconds": duration, "brightness": session_brightness,
+                        "theme_mode": session_theme, "duration_ms": duration_ms
+                    })
+                print(f"Session ended: {current_app} ({duration_ms / 1000:.3f}s), Brightness: {session_brightness}%, Theme: {session_theme}")
             
             # Start new session
             current_app = app_name
             session_start_time = current_time
+            session_start_epoch = now
+            poll_interval = MIN_POLL_INTERVAL
+            events.publish(("session_started", {
+                "app": app_name, "start_time": current_time, "brightness": current_brightness,
+                "theme_mode": current_theme
+            }))
             print(f"Session started: {app_name}, Brightness: {current_brightness}%, Theme: {current_theme}")
+        else:
+            poll_interval = min(poll_interval * 2, MAX_POLL_INTERVAL)
         
-        time.sleep(5)  # Check every 5 seconds, but only log session changes
+        if foreground_source.event_driven:
+            foreground_source.wait_for_change(EVENT_MAX_WAIT)
+        else:
+            time.sleep(poll_interval)
+
+@app.route("/health")
+def health():
+    return jsonify({"status": "healthy"})
+
+@app.route("/dashboard", methods=["GET"])
+@cached_endpoint(response_cache, sessions_version)
+def dashboard():
+    """All dashboard panels in one response, rebuilt only when sessions change"""
+    snapshot, _ = dashboard_cache.get()
+    return jsonify(snapshot)
 
 @app.route("/app_report", methods=["GET"])
+@cached_endpoint(response_cache, sessions_version)
 def app_report():
     """Get recent app sessions with brightness and theme data"""
-    c.execute("""
-        SELECT app, start_time, end_time, duration_seconds, brightness, theme_mode 
-        FROM app_sessions 
-        ORDER BY id DESC 
-        LIMIT 100
-    """)
-    rows = c.fetchall()
-    sessions = [{
-        "app": row[0], 
-        "start_time": row[1], 
-        "end_time": row[2],
-        "duration": row[3],
-        "brightness": row[4],
-        "theme_mode": row[5]
-    } for row in rows]
-    return jsonify(sessions)
+    return jsonify(recent_sessions(conn))
 
 @app.route("/usage_summary", methods=["GET"])
+@cached_endpoint(response_cache, sessions_version)
 def usage_summary():
     """Get usage summary by app with brightness and theme statistics"""
-    c.execute("""
-        SELECT 
-            app,
-            COUNT(*) as session_count,
-            SUM(duration_seconds) as total_seconds,
-            AVG(duration_seconds) as avg_duration,
-            AVG(brightness) as avg_brightness,
-            GROUP_CONCAT(DISTINCT theme_mode) as themes_used
-        FROM app_sessions 
-        WHERE date(start_time) = date('now')
-        GROUP BY app
-        ORDER BY total_seconds DESC
-    """)
-    rows = c.fetchall()
-    summary = [{
-        "app": row[0],
-        "session_count": row[1],
-        "total_seconds": row[2],
-        "total_minutes": round(row[2] / 60, 1),
-        "avg_duration": round(row[3], 1) if row[3] else 0,
-        "avg_brightness": round(row[4], 1) if row[4] else "N/A",
-        "themes_used": row[5] if row[5] else "Unknown"
-    } for row in rows]
-    return jsonify(summary)
+    return jsonify(usage_summary_panel(session_columns.refresh()))
 
 @app.route("/brightness_stats", methods=["GET"])
+@cached_endpoint(response_cache, sessions_version)
 def brightness_stats():
     """Get brightness statistics"""
-    c.execute("""
-        SELECT 
-            AVG(brightness) as avg_brightness,
-            MIN(brightness) as min_brightness,
-            MAX(brightness) as max_brightness,
-            COUNT(*) as records_with_brightness
-        FROM app_sessions 
-        WHERE brightness IS NOT NULL
-    """)
-    row = c.fetchone()
-    stats = {
-        "avg_brightness": round(row[0], 1) if row[0] else "N/A",
-        "min_brightness": row[1] if row[1] else "N/A",
-        "max_brightness": row[2] if row[2] else "N/A",
-        "records_count": row[3] if row[3] else 0
-    }
-    return jsonify(stats)
+    return jsonify(brightness_stats_panel(session_columns.refresh()))
+
+@app.route("/display_samples", methods=["GET"])
+def display_samples():
+    """Periodic brightness/theme samples and their summary (default: last hour)"""
+    end = request.args.get("end", time.time(), type=float)
+    start = request.args.get("start", end - 3600, type=float)
+    epochs, brightness, themes = sample_store.samples(start, end)
+    # Thin long ranges so the response stays bounded
+    step = max(1, len(epochs) // MAX_SAMPLES_RETURNED)
+    samples = [{
+        "epoch": int(epoch),
+        "brightness": None if value != value else int(value),
+        "theme_mode": THEME_NAMES[int(theme)]
+    } for epoch, value, theme in zip(epochs[::step], brightness[::step], themes[::step])]
+    return jsonify({
+        "start": start,
+        "end": end,
+        "summary": sample_store.aggregate(start, end),
+        "samples": samples
+    })
+
+def iter_session_batches(start=None, end=None, apps=None):
+    """Yield lists of app_sessions rows matching the filters, EXPORT_BATCH_SIZE at a time.
+
+    Archived sessions come first; each table is read in id order so no sort is needed.
+    """
+    query = " WHERE 1 = 1"
+    params = []
+    if start:
+        query += " AND start_time >= ?"
+        params.append(start)
+    if end:
+        query += " AND start_time <= ?"
+        params.append(end + " 23:59:59.999" if len(end) == 10 else end)
+    if apps:
+        query += f" AND app IN ({', '.join('?' for _ in apps)})"
+        params.extend(apps)
+    query += " ORDER BY id"
+
+    # Own connection: the generator outlives the request handler's frame
+    db = attach_archive(timed_connect(DB_FILE))
+    try:
+        for table in ("archive.app_sessions", "main.app_sessions"):
+            cursor = db.execute(f"SELECT {', '.join(EXPORT_COLUMNS)} FROM {table}" + query, params)
+            while True:
+                rows = cursor.fetchmany(EXPORT_BATCH_SIZE)
+                if not rows:
+                    break
+                yield rows
+    finally:
+        db.close()
+
+def write_parquet_export(batches):
+    """Write batches to a Parquet file under EXPORT_DIR, one row group per batch"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([
+        ("id", pa.int64()), ("app", pa.string()), ("start_time", pa.string()),
+        ("end_time", pa.string()), ("duration_seconds", pa.int64()), ("brightness", pa.int16()),
+        ("theme_mode", pa.string()), ("duration_ms", pa.int64())
+    ])
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    path = os.path.join(EXPORT_DIR, time.strftime("app_sessions_%Y%m%d_%H%M%S.parquet"))
+    row_count = 0
+    with pq.ParquetWriter(path, schema, compression="zstd") as writer:
+        for rows in batches:
+            columns = list(zip(*rows))
+            writer.write_table(pa.table(
+                {name: pa.array(values, type=schema.field(name).type) for name, values in zip(EXPORT_COLUMNS, columns)},
+                schema=schema
+            ))
+            row_count += len(rows)
+    return path, row_count
+
+@app.route("/export", methods=["GET"])
+def export_sessions():
+    """Stream app_sessions as NDJSON (default) or CSV, or write a Parquet file.
+
+    Query params: format=ndjson|csv|parquet, start, end (timestamp or date)
+    and app (repeatable or comma separated).
+    """
+    export_format = request.args.get("format", "ndjson")
+    apps = [name for value in request.args.getlist("app") for name in value.split(",") if name]
+    batches = iter_session_batches(request.args.get("start"), request.args.get("end"), apps)
+
+    if export_format == "ndjson":
+        def generate():
+            for rows in batches:
+                yield "".join(json.dumps(dict(zip(EXPORT_COLUMNS, row))) + "\n" for row in rows)
+        mimetype, extension = "application/x-ndjson", "ndjson"
+    elif export_format == "csv":
+        def generate():
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(EXPORT_COLUMNS)
+            for rows in batches:
+                writer.writerows(rows)
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+            yield buffer.getvalue()
+        mimetype, extension = "text/csv", "csv"
+    elif export_format == "parquet":
+        try:
+            path, row_count = write_parquet_export(batches)
+        except ImportError:
+            return jsonify({"error": "Parquet export requires pyarrow"}), 501
+        return jsonify({"path": os.path.abspath(path), "rows": row_count})
+    else:
+        return jsonify({"error": "format must be ndjson, csv or parquet"}), 400
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f"attachment; filename=app_sessions.{extension}"}
+    )
 
 @app.route("/theme_stats", methods=["GET"])
+@cached_endpoint(response_cache, sessions_version)
 def theme_stats():
     """Get theme usage statistics"""
-    c.execute("""
-        SELECT 
-            theme_mode,
-            COUNT(*) as count,
-            SUM(duration_seconds) as total_seconds
-        FROM app_sessions 
-        WHERE theme_mode IS NOT NULL AND theme_mode != 'Unknown'
-        GROUP BY theme_mode
-        ORDER BY total_seconds DESC
-    """)
-    rows = c.fetchall()
-    stats = [{
-        "theme_mode": row[0],
-        "session_count": row[1],
-        "total_minutes": round(row[2] / 60, 1) if row[2] else 0
-    } for row in rows]
-    return jsonify(stats)
+    return jsonify(theme_stats_panel(session_columns.refresh()))
 
 @app.route("/usage_by_hour", methods=["GET"])
+@cached_endpoint(response_cache, sessions_version)
 def usage_by_hour():
     """Get app usage grouped by hour with brightness and theme data"""
-    c.execute("""
-        SELECT 
-            substr(start_time, 12, 2) || ':00' as hour,
-            app,
-            SUM(duration_seconds) as total_seconds,
-            AVG(brightness) as avg_brightness,
-            GROUP_CONCAT(DISTINCT theme_mode) as themes
-        FROM app_sessions 
-        WHERE substr(start_time, 1, 10) = date('now')
-        GROUP BY hour, app
-        ORDER BY hour, total_seconds DESC
-    """)
-    rows = c.fetchall()
-    data = [{
-        "hour": row[0],
-        "app": row[1],
-        "total_minutes": round(row[2] / 60, 1),
-        "avg_brightness": round(row[3], 1) if row[3] else "N/A",
-        "themes": row[4] if row[4] else "Unknown"
-    } for row in rows]
-    return jsonify(data)
+    return jsonify(usage_by_hour_panel(session_columns.refresh()))
 
 @app.route("/usage_by_date", methods=["GET"])
+@cached_endpoint(response_cache, sessions_version)
 def usage_by_date():
     """Get app usage grouped by date with brightness and theme data"""
-    c.execute("""
-        SELECT 
-            substr(start_time, 1, 10) as date,
-            app,
-            SUM(duration_seconds) as total_seconds,
-            AVG(brightness) as avg_brightness,
-            GROUP_CONCAT(DISTINCT theme_mode) as themes
-        FROM app_sessions 
-        GROUP BY date, app
-        ORDER BY date, total_seconds DESC
-        LIMIT 50
-    """)
-    rows = c.fetchall()
+    rows = session_columns.refresh().aggregate(("day", "app"))
+    rows.sort(key=lambda row: (row[0], -row[3]))
     data = [{
         "date": row[0],
         "app": row[1],
-        "total_minutes": round(row[2] / 60, 1),
-        "avg_brightness": round(row[3], 1) if row[3] else "N/A",
-        "themes": row[4] if row[4] else "Unknown"
-    } for row in rows]
+        "total_minutes": round(row[3] / 60, 1),
+        "avg_brightness": round(row[5], 1) if row[5] else "N/A",
+        "themes": row[6] if row[6] else "Unknown"
+    } for row in rows[:50]]
     return jsonify(data)
 
+def run_retention():
+    """Merge micro-sessions and archive old ones, dropping caches if any rows changed"""
+    result = retention_job.run()
+    if result["merged"] or result["archived"]:
+        dashboard_cache.invalidate()
+        response_cache.invalidate()
+    return result
+
+def retention_loop():
+    """Background loop: run the retention job every RETENTION_INTERVAL seconds"""
+    while True:
+        try:
+            result = run_retention()
+            print(f"Retention: merged {result['merged']}, archived {result['archived']} sessions")
+        except Exception as e:
+            print(f"Retention error: {e}")
+        time.sleep(RETENTION_INTERVAL)
+
+@app.route("/retention", methods=["GET", "POST"])
+def retention():
+    """GET: last retention result and row counts. POST: run the job now"""
+    if request.method == "POST":
+        return jsonify(run_retention())
+    db = attach_archive(timed_connect(DB_FILE))
+    try:
+        live, archived = db.execute(
+            "SELECT (SELECT COUNT(*) FROM main.app_sessions), (SELECT COUNT(*) FROM archive.app_sessions)"
+        ).fetchone()
+    finally:
+        db.close()
+    return jsonify({
+        "last_run": retention_job.last_result,
+        "horizon_days": retention_job.horizon_days,
+        "live_sessions": live,
+        "archived_sessions": archived
+    })
+
+@app.route("/ingest", methods=["POST"])
+def ingest():
+    """Store a batch of sessions from another tracker; idempotent per (device_id, seq)"""
+    if (request.content_length or 0) > MAX_BATCH_BYTES:
+        return jsonify({"error": f"batch larger than {MAX_BATCH_BYTES} bytes"}), 413
+    try:
+        device_id, seq, rows = decode_batch(request.get_data(), request.headers.get("Content-Encoding"))
+    except IngestError as e:
+        return jsonify({"error": str(e)}), e.status
+    result = ingest_store.ingest(device_id, seq, rows)
+    if result["accepted"]:
+        # Local views, the dashboard and the fatigue checker only see this machine's sessions
+        events.publish(("sessions_ingested", {"device_id": device_id, "seq": seq, "sessions": result["accepted"]}))
+    return jsonify(result)
+
+def format_event(entry):
+    """One server-sent event from a (seq, (event type, data)) Broadcast entry; None is a heartbeat"""
+    if entry is None:
+        return ": heartbeat\n\n"
+    seq, (event_type, data) = entry
+    return f"id: {EVENTS_BOOT}-{seq}\nevent: {event_type}\ndata: {json.dumps(data)}\n\n"
+
+def last_event_id(value):
+    """Broadcast seq to resume after: None without an id, 0 (all kept events) for an id from another boot"""
+    if not value:
+        return None
+    boot, _, seq = value.partition("-")
+    return int(seq) if boot == EVENTS_BOOT and seq.isdigit() else 0
+
+@app.route("/events", methods=["GET"])
+def session_events():
+    """Server-sent events for session starts, ends and ingested batches"""
+    last_seq = last_event_id(request.headers.get("Last-Event-ID"))
+    def generate():
+        for entry in events.follow(timeout=EVENT_HEARTBEAT, last_seq=last_seq):
+            yield format_event(entry)
+    return Response(generate(), mimetype="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+async def session_events_stream(scope, receive, send):
+    """/events as a coroutine for the asyncio server"""
+    headers = dict(scope["headers"])
+    last_seq = last_event_id(headers.get(b"last-event-id", b"").decode("latin1"))
+    async def chunks():
+        async for entry in events.follow_async(timeout=EVENT_HEARTBEAT, last_seq=last_seq):
+            yield format_event(entry).encode()
+    await stream_response(send, receive, "text/event-stream", chunks(), "/events")
+
+@app.route("/ingest/devices", methods=["GET"])
+def ingest_devices():
+    """Devices that have uploaded sessions, with their last sequence number, and the local upload backlog"""
+    return jsonify({
+        "devices": ingest_store.devices(),
+        "uploader": None if uploader is None else dict(
+            uploader.backlog(), device_id=uploader.device_id, url=uploader.url,
+            sent_batches=uploader.sent_batches, last_error=uploader.last_error
+        )
+    })
+
+@app.route("/fleet/usage", methods=["GET"])
+@cached_endpoint(response_cache, ingest_store.version)
+def fleet_usage():
+    """Usage per date and app summed over ingested devices. Query params: start, end, device"""
+    return jsonify(ingest_store.usage(request.args.get("start"), request.args.get("end"),
+                                      request.args.get("device")))
+
+# SERVER_MODE=asgi: /events subscribers are coroutines instead of one thread each
+asgi_app = AsgiApp(app, {"/events": session_events_stream})
+
 if __name__ == "__main__":
     t = threading.Thread(target=log_active_app, daemon=True)
     t.start()
-    app.run(port=5004)
\ No newline at end of file
+    threading.Thread(target=sample_display_state, daemon=True).start()
+    threading.Thread(target=retention_loop, daemon=True).start()
+    if uploader is not None:
+        uploader.start()
+    if asgi_enabled():
+        serve(asgi_app, port=5004)
+    else:
+        app.run(port=5004)
\ No newline at end of file
@@ -0,0 +1,211 @@
+"""Asyncio (ASGI) serving mode for services with long-lived streams.
+
+Under Flask's threaded server every open stream (/video_feed, /events) pins
+an OS thread for as long as the client stays connected. AsgiApp serves the
+streaming routes as coroutines on the event loop instead, fed by the
+producers' Broadcasts (streams.py), so the thread count stays the same
+however many consumers connect. Every other route still goes through the
+Flask app, called on a small fixed pool of worker threads. A streamed Flask
+body such as /export is iterated on one worker until it ends, since it may
+hold thread-bound SQLite cursors; those are finite, unlike the native
+streams.
+
+A service runs in this mode with SERVER_MODE=asgi, which needs uvicorn
+(`pip install uvicorn`); without it the services keep using app.run().
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import io
+import os
+import sys
+import time
+from metrics import HTTP_LATENCY
+
+WSGI_WORKERS = int(os.environ.get("ASGI_WSGI_WORKERS", 8))
+QUEUE_CHUNKS = 8  # body chunks a WSGI worker may run ahead of the client
+
+
+def asgi_enabled():
+    return os.environ.get("SERVER_MODE") == "asgi"
+
+
+async def stream_response(send, receive, content_type, chunks, route, extra_headers=()):
+    """Send an async iterator of bytes as a streamed 200 response until it ends or the client leaves"""
+    started = time.perf_counter()
+    headers = [(b"content-type", content_type.encode()), (b"cache-control", b"no-cache"),
+               (b"access-control-allow-origin", b"*")]
+    headers.extend((name.encode(), value.encode()) for name, value in extra_headers)
+    await send({"type": "http.response.start", "status": 200, "headers": headers})
+    HTTP_LATENCY.observe(time.perf_counter() - started, route=route, method="GET", status=200)
+
+    async def wait_disconnect():
+        while (await receive())["type"] != "http.disconnect":
+            pass
+
+    disconnected = asyncio.ensure_future(wait_disconnect())
+    iterator = chunks.__aiter__()
+    try:
+        while True:
+            next_chunk = asyncio.ensure_future(iterator.__anext__())
+            await asyncio.wait({next_chunk, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+            if not next_chunk.done():
+                next_chunk.cancel()
+                # The generator counts as running until the cancellation has reached it
+                await asyncio.wait({next_chunk})
+                break
+            try:
+                chunk = next_chunk.result()
+            except StopAsyncIteration:
+                break
+            await send({"type": "http.response.body", "body": chunk, "more_body": True})
+        if not disconnected.done():
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+    finally:
+        disconnected.cancel()
+        await iterator.aclose()
+
+
+class AsgiApp:
+    """ASGI application: native stream handlers plus the Flask app for everything else.
+
+    streams maps a path to `async def handler(scope, receive, send)`.
+    """
+
+    def __init__(self, flask_app, streams, workers=WSGI_WORKERS):
+        self.flask_app = flask_app
+        self.streams = streams
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="wsgi")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return
+        handler = self.streams.get(scope["path"])
+        if handler is not None and scope["method"] == "GET":
+            await handler(scope, receive, send)
+        else:
+            await self._call_wsgi(scope, receive, send)
+
+    async def _call_wsgi(self, scope, receive, send):
+        body = bytearray()
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            body += message.get("body", b"")
+            if not message.get("more_body"):
+                break
+
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(maxsize=QUEUE_CHUNKS)
+        abandoned = []
+        worker = loop.run_in_executor(self.executor, self._run, self._environ(scope, bytes(body)), loop, queue,
+                                      abandoned)
+        finished = False
+        try:
+            while True:
+                message = await queue.get()
+                if message is None:
+                    finished = True
+                    break
+                kind, payload = message
+                if kind == "error":
+                    raise payload
+                if kind == "start":
+                    status, headers = payload
+                    await send({
+                        "type": "http.response.start",
+                        "status": int(status.split(" ", 1)[0]),
+                        "headers": [(name.lower().encode("latin1"), value.encode("latin1")) for name, value in headers]
+                    })
+                elif payload:
+                    await send({"type": "http.response.body", "body": payload, "more_body": True})
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+        finally:
+            if not finished:
+                # Let the worker stop at its next chunk instead of blocking on a full queue
+                abandoned.append(True)
+                while await queue.get() is not None:
+                    pass
+            await worker
+
+    def _run(self, environ, loop, queue, abandoned):
+        """Call the WSGI app and iterate its body on this one pool thread, handing chunks to the loop.
+
+        Kept on a single thread because streamed bodies may hold thread-bound objects (SQLite cursors).
+        """
+        def put(message):
+            asyncio.run_coroutine_threadsafe(queue.put(message), loop).result()
+
+        response = {}
+        written = []
+
+        def start_response(status, headers, exc_info=None):
+            response["status"], response["headers"] = status, headers
+            return written.append
+
+        started = False
+        result = None
+        try:
+            result = self.flask_app(environ, start_response)
+            for chunk in result:
+                if not started:
+                    put(("start", (response["status"], response["headers"])))
+                    started = True
+                if written:
+                    chunk = b"".join(written) + chunk
+                    written.clear()
+                put(("body", chunk))
+                if abandoned:
+                    break
+            if not started:
+                put(("start", (response["status"], response["headers"])))
+                put(("body", b"".join(written)))
+        except Exception as e:
+            put(("error", e))
+        finally:
+            try:
+                if hasattr(result, "close"):
+                    result.close()
+            finally:
+                put(None)
+
+    @staticmethod
+    def _environ(scope, body):
+        server = scope.get("server") or ("localhost", 80)
+        client = scope.get("client") or ("", 0)
+        environ = {
+            "REQUEST_METHOD": scope["method"],
+            "SCRIPT_NAME": scope.get("root_path", "").encode("utf8").decode("latin1"),
+            "PATH_INFO": scope["path"].encode("utf8").decode("latin1"),
+            "QUERY_STRING": scope["query_string"].decode("latin1"),
+            "SERVER_NAME": str(server[0]),
+            "SERVER_PORT": str(server[1]),
+            "SERVER_PROTOCOL": f"HTTP/{scope['http_version']}",
+            "REMOTE_ADDR": client[0],
+            "wsgi.version": (1, 0),
+            "wsgi.url_scheme": scope.get("scheme", "http"),
+            "wsgi.input": io.BytesIO(body),
+            "wsgi.errors": sys.stderr,
+            "wsgi.multithread": True,
+            "wsgi.multiprocess": False,
+            "wsgi.run_once": False,
+            "CONTENT_LENGTH": str(len(body))
+        }
+        for name, value in scope["headers"]:
+            name = name.decode("latin1").upper().replace("-", "_")
+            value = value.decode("latin1")
+            if name == "CONTENT_TYPE":
+                environ["CONTENT_TYPE"] = value
+            elif name != "CONTENT_LENGTH":
+                key = f"HTTP_{name}"
+                environ[key] = f"{environ[key]},{value}" if key in environ else value
+        return environ
+
+
+def serve(asgi_app, host="127.0.0.1", port=8000):
+    """Run an AsgiApp on uvicorn's single event loop thread"""
+    try:
+        import uvicorn
+    except ImportError:
+        raise SystemExit("SERVER_MODE=asgi requires uvicorn (pip install uvicorn)")
+    uvicorn.run(asgi_app, host=host, port=port, lifespan="off", log_level="warning")
@@ -0,0 +1,186 @@
+"""Scaling benchmark for the analytics read endpoints and model retraining.
+
+For each dataset size a fresh app_usage.db is generated with workload.py in
+its own directory, the services are imported there (they open DB_FILE and
+the model files relative to the working directory) and every read endpoint
+is driven through the Flask test client. Response and dashboard caches are
+cleared and the session columns reloaded before each timed call so the
+numbers are for the work itself; the cached column shows what a repeated
+poll costs. Peak memory is the largest
+Python allocation (tracemalloc, which includes NumPy buffers) seen during
+one extra uncached call. The productivity model is timed twice: forced to
+retrain, and taking the load-only path that still reads the table.
+
+    python benchmark.py [--sizes 10000,100000,1000000] [--runs 20] [--json results.json]
+"""
+import argparse
+import datetime
+import importlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+import warnings
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+from workload import populate, SESSIONS_PER_DAY  # noqa: E402
+
+SIZES = (10_000, 100_000, 1_000_000)
+SERVICE_MODULES = ("app_usage_sql", "productivity_api", "fatigue_api")
+MODEL_FILES = ("fatigue_model.pkl", "productivity_model.pkl")
+
+
+def endpoints(today, first_day):
+    """(service module, path) for every read endpoint backed by app_sessions"""
+    return [
+        ("app_usage_sql", "/dashboard"),
+        ("app_usage_sql", "/app_report"),
+        ("app_usage_sql", "/usage_summary"),
+        ("app_usage_sql", "/brightness_stats"),
+        ("app_usage_sql", "/theme_stats"),
+        ("app_usage_sql", "/usage_by_hour"),
+        ("app_usage_sql", "/usage_by_date"),
+        ("app_usage_sql", "/export?format=ndjson"),
+        ("productivity_api", "/predict/productivity/latest"),
+        ("productivity_api", "/predict/productivity/daily"),
+        ("productivity_api", f"/predict/productivity/daily?date={today}"),
+        ("productivity_api", "/predict/productivity/available_dates"),
+        ("fatigue_api", "/predfatigue/latest"),
+        ("fatigue_api", f"/predfatigue/range?start={today}&end={today}"),
+        ("fatigue_api", f"/predfatigue/range?start={first_day}&end={today}&bucket=hour"),
+    ]
+
+
+def load_services(workdir):
+    """Import the services fresh, with workdir as the working directory"""
+    os.chdir(workdir)
+    for name in SERVICE_MODULES:
+        sys.modules.pop(name, None)
+    return {name: importlib.import_module(name) for name in SERVICE_MODULES}
+
+
+def clear_caches(services):
+    for module in services.values():
+        if hasattr(module, "response_cache"):
+            module.response_cache.invalidate()
+        if hasattr(module, "session_columns"):
+            module.session_columns.invalidate()
+    services["app_usage_sql"].dashboard_cache.invalidate()
+
+
+def measure(fn, runs, before=None):
+    """(p50 ms, p99 ms, peak MB) of fn over `runs` calls, calling before() ahead of each"""
+    latencies = []
+    for _ in range(runs):
+        if before:
+            before()
+        started = time.perf_counter()
+        fn()
+        latencies.append((time.perf_counter() - started) * 1000)
+
+    if before:
+        before()
+    tracemalloc.start()
+    try:
+        fn()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return float(np.percentile(latencies, 50)), float(np.percentile(latencies, 99)), peak / 1e6
+
+
+def request_fn(client, path):
+    def call():
+        response = client.get(path)
+        response.get_data()  # drain streamed bodies
+        if response.status_code != 200:
+            raise RuntimeError(f"{path} returned {response.status_code}")
+    return call
+
+
+def bench_size(count, runs, root):
+    workdir = os.path.join(root, f"sessions_{count}")
+    os.makedirs(workdir, exist_ok=True)
+    today = datetime.date.today()
+    days = max(1, -(-count // SESSIONS_PER_DAY))
+
+    started = time.perf_counter()
+    populate(os.path.join(workdir, "app_usage.db"), count, end_date=today)
+    generate_s = time.perf_counter() - started
+    for name in MODEL_FILES:
+        shutil.copy(os.path.join(BACKEND_DIR, name), workdir)
+
+    import joblib
+    # Start from the bundled productivity model so the first get_model() does not retrain
+    joblib.dump({"rows": count}, os.path.join(workdir, "productivity_meta.pkl"))
+    services = load_services(workdir)
+    productivity = services["productivity_api"]
+    # Models load on first use; do it now so it isn't charged to the first request
+    productivity.get_model()
+    services["fatigue_api"].get_engine()
+
+    results = []
+    first_day = today - datetime.timedelta(days=days - 1)
+    for module, path in endpoints(today.isoformat(), first_day.isoformat()):
+        call = request_fn(services[module].app.test_client(), path)
+        p50, p99, peak_mb = measure(call, runs, before=lambda: clear_caches(services))
+        cached_p50 = measure(call, runs)[0]
+        results.append({"name": path, "p50_ms": p50, "p99_ms": p99, "cached_p50_ms": cached_p50,
+                        "peak_mb": peak_mb})
+
+    def retrain():
+        os.remove("productivity_meta.pkl")
+        productivity.train_or_load_model()
+
+    p50, p99, peak_mb = measure(retrain, 1)
+    results.append({"name": "train_or_load_model (retrain)", "p50_ms": p50, "p99_ms": p99,
+                    "cached_p50_ms": None, "peak_mb": peak_mb})
+    p50, p99, peak_mb = measure(productivity.train_or_load_model, min(runs, 5))
+    results.append({"name": "train_or_load_model (load)", "p50_ms": p50, "p99_ms": p99,
+                    "cached_p50_ms": None, "peak_mb": peak_mb})
+    return {"sessions": count, "generate_s": round(generate_s, 2), "results": results}
+
+
+def print_report(report):
+    print(f"\n{report['sessions']:,} sessions (generated in {report['generate_s']}s)")
+    print(f"  {'endpoint':<66} {'p50 ms':>9} {'p99 ms':>9} {'cached':>8} {'peak MB':>8}")
+    for row in report["results"]:
+        cached = "-" if row["cached_p50_ms"] is None else f"{row['cached_p50_ms']:.2f}"
+        print(f"  {row['name']:<66} {row['p50_ms']:9.2f} {row['p99_ms']:9.2f} {cached:>8} {row['peak_mb']:8.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark analytics endpoints at several dataset sizes")
+    parser.add_argument("--sizes", default=",".join(str(size) for size in SIZES),
+                        help="comma separated session counts")
+    parser.add_argument("--runs", type=int, default=20, help="timed calls per endpoint")
+    parser.add_argument("--json", help="also write the results to this file")
+    parser.add_argument("--keep", action="store_true", help="keep the generated databases")
+    args = parser.parse_args()
+
+    warnings.filterwarnings("ignore")
+    output = os.path.abspath(args.json) if args.json else None
+    root = tempfile.mkdtemp(prefix="eyecare_bench_")
+    reports = []
+    try:
+        for size in (int(value) for value in args.sizes.split(",")):
+            report = bench_size(size, args.runs, root)
+            print_report(report)
+            reports.append(report)
+    finally:
+        os.chdir(BACKEND_DIR)
+        if args.keep:
+            print(f"\nDatabases kept in {root}")
+        else:
+            shutil.rmtree(root, ignore_errors=True)
+
+    if output:
+        with open(output, "w") as f:
+            json.dump(reports, f, indent=2)
@@ -0,0 +1,387 @@
+"""Process-wide columnar copy of app_sessions for the analytics endpoints.
+
+Each analytics request used to pull rows out of SQLite into Python tuples
+(or a pandas DataFrame) and rebuild them per row. SessionColumns keeps every
+session, live and archived, as a few NumPy columns:
+
+    start_ms    int64    start time as written (local wall clock), ms since 1970
+    duration    int32    duration_seconds
+    brightness  float32  NaN when unknown
+    app         int32    index into SessionColumns.apps (dictionary encoded)
+    theme       int16    index into SessionColumns.themes, THEME_NULL for NULL
+
+about 30 bytes per session. Apps and themes are dictionary encoded in
+first-seen order, so any theme_mode value groups under its own name as it
+did in SQL. The columns are loaded once and then extended
+with the rows whose id is above the last one seen; a new retention
+generation (rows merged or archived) triggers a full reload. Group-bys over
+app, hour, day and theme are np.bincount reductions over a boolean mask and
+return rows shaped like the SQL they replace.
+
+With cache_dir set (SESSION_CACHE_DIR/<service> for the services) the
+columns live in memory-mapped files there, so a restarted service maps them
+back instead of re-reading the table. The files are append-only; meta.json,
+written after the data is flushed, records how many rows are valid, and a
+reload or a capacity change writes a new set of files.
+"""
+import json
+import os
+import sqlite3
+import threading
+import uuid
+import numpy as np
+from metrics import timed_connect, timer, MODEL_LATENCY
+from retention import attach_archive, generation, ARCHIVE_DB_FILE
+
+THEME_NULL = -1
+COLUMNS = {
+    "start_ms": np.int64,
+    "duration": np.int32,
+    "brightness": np.float32,
+    "app": np.int32,
+    "theme": np.int16
+}
+NAT = np.iinfo(np.int64).min
+MS_PER_HOUR = 3_600_000
+MS_PER_DAY = 86_400_000
+LOAD_CHUNK = 50_000
+MIN_CAPACITY = 1024
+
+
+def _parse_starts(values):
+    """start_time strings -> int64 ms, NAT where missing or malformed"""
+    try:
+        return np.array(values, dtype="datetime64[ms]").astype(np.int64)
+    except ValueError:
+        parsed = np.empty(len(values), dtype=np.int64)
+        for index, value in enumerate(values):
+            try:
+                parsed[index] = np.datetime64(value, "ms").astype(np.int64)
+            except (TypeError, ValueError):
+                parsed[index] = NAT
+        return parsed
+
+
+def _date_ms(value):
+    """'YYYY-MM-DD' (or a longer timestamp) -> ms since 1970"""
+    return int(np.datetime64(value, "ms").astype(np.int64))
+
+
+class SessionView:
+    """Consistent, read-only slice of the columns; later appends do not affect it"""
+
+    def __init__(self, columns, size, apps, themes, today):
+        for name in COLUMNS:
+            setattr(self, name, columns[name][:size])
+        self.apps = apps
+        self.themes = themes
+        self.today = today
+        self.size = size
+
+    def mask(self, start=None, end=None):
+        """Sessions starting on or after `start` and before the day after `end` (dates)"""
+        keep = self.start_ms != NAT
+        if start:
+            keep &= self.start_ms >= _date_ms(start[:10])
+        if end:
+            keep &= self.start_ms < _date_ms(end[:10]) + MS_PER_DAY
+        return keep
+
+    def _keys(self, name, keep):
+        """(codes, number of codes, labels) for one group-by dimension over the kept rows"""
+        if name == "app":
+            return self.app[keep], len(self.apps), self.apps
+        if name == "theme":
+            # NULL takes the code after the last theme
+            codes = self.theme[keep].astype(np.int64)
+            codes[codes == THEME_NULL] = len(self.themes)
+            return codes, len(self.themes) + 1, self.themes + [None]
+        if name == "hour":
+            return (self.start_ms[keep] // MS_PER_HOUR) % 24, 24, [f"{hour:02d}:00" for hour in range(24)]
+        if name == "day":
+            days = self.start_ms[keep] // MS_PER_DAY
+            first = int(days.min()) if len(days) else 0
+            span = int(days.max()) - first + 1 if len(days) else 0
+            labels = np.datetime_as_string(np.arange(first, first + span).astype("datetime64[D]")).tolist()
+            return days - first, span, labels
+        raise ValueError(f"cannot group by {name}")
+
+    def aggregate(self, by, start=None, end=None, keep=None):
+        """Rows of (*labels, session count, total seconds, avg seconds, avg brightness, distinct themes).
+
+        by is a tuple of "app", "hour", "day" and "theme"; rows come out in key order.
+        Averages are None for an empty group, themes are joined like GROUP_CONCAT(DISTINCT).
+        """
+        if keep is None:
+            keep = self.mask(start, end)
+        keys = [self._keys(name, keep) for name in by]
+        group = np.zeros(int(keep.sum()), dtype=np.int64)
+        n_groups = 1
+        for codes, size, _ in keys:
+            group = group * size + codes
+            n_groups *= size
+        if n_groups > 4 * len(group) + MIN_CAPACITY:
+            # Sparse keys (a long span of days): number only the groups that occur
+            present, group = np.unique(group, return_inverse=True)
+            n_groups = len(present)
+        else:
+            present = None
+
+        durations = self.duration[keep]
+        brightness = self.brightness[keep]
+        known = ~np.isnan(brightness)
+        counts = np.bincount(group, minlength=n_groups)
+        seconds = np.bincount(group, weights=durations, minlength=n_groups)
+        brightness_sum = np.bincount(group[known], weights=brightness[known], minlength=n_groups)
+        brightness_count = np.bincount(group[known], minlength=n_groups)
+        themes = self._distinct_themes(group, self.theme[keep])
+
+        rows = []
+        for index in np.flatnonzero(counts).tolist():
+            composite = index if present is None else int(present[index])
+            labels = []
+            for codes, size, names in reversed(keys):
+                labels.append(names[composite % size])
+                composite //= size
+            count = int(counts[index])
+            total = int(seconds[index])
+            rows.append(tuple(reversed(labels)) + (
+                count,
+                total,
+                total / count,
+                float(brightness_sum[index]) / int(brightness_count[index]) if brightness_count[index] else None,
+                themes.get(index)
+            ))
+        return rows
+
+    def _distinct_themes(self, group, theme):
+        """group index -> themes of its sessions, comma separated in first-seen order"""
+        present = theme != THEME_NULL
+        n_themes = max(len(self.themes), 1)
+        pairs = group[present] * n_themes + theme[present]
+        unique, first = np.unique(pairs, return_index=True)
+        themes = {}
+        for pair in unique[np.argsort(first, kind="stable")].tolist():
+            index, code = divmod(pair, n_themes)
+            name = self.themes[code]
+            themes[index] = f"{themes[index]},{name}" if index in themes else name
+        return themes
+
+    def brightness_summary(self):
+        """(avg, min, max, count) of known brightness, like the SQL aggregate"""
+        known = self.brightness[~np.isnan(self.brightness)]
+        if not len(known):
+            return None, None, None, 0
+        return float(known.astype(np.float64).mean()), int(known.min()), int(known.max()), int(len(known))
+
+    def hours(self, keep):
+        return (self.start_ms[keep] // MS_PER_HOUR) % 24
+
+    def productivity_features(self, keep, app_codes):
+        """Productivity model inputs for the kept sessions, in training order: duration, brightness, hour, app.
+
+        NULL brightness scores as 0, the same rule as /predict/productivity/latest;
+        apps missing from app_codes (the model's label encoding) get -1.
+        """
+        app_lookup = np.array([app_codes.get(name, -1) for name in self.apps], dtype=np.float64)
+        return np.column_stack([
+            self.duration[keep].astype(np.float64),
+            np.nan_to_num(self.brightness[keep].astype(np.float64), nan=0.0),
+            self.hours(keep).astype(np.float64),
+            app_lookup[self.app[keep]]
+        ])
+
+    def productivity_split(self, engine, app_codes, keep):
+        """(productive seconds, distracting seconds) of the kept sessions under the productivity model"""
+        features = self.productivity_features(keep, app_codes)
+        with timer(MODEL_LATENCY, model="productivity"):
+            productive = engine.predict(features) == 1
+        durations = self.duration[keep].astype(np.int64)
+        return int(durations[productive].sum()), int(durations[~productive].sum())
+
+
+class SessionColumns:
+    """Columnar app_sessions cache, refreshed incrementally from new ids"""
+
+    def __init__(self, db_file, archive_file=ARCHIVE_DB_FILE, cache_dir=None):
+        self.db_file = db_file
+        self.archive_file = archive_file
+        self.cache_dir = cache_dir
+        self.lock = threading.Lock()
+        self.generation = None
+        self.stale = True  # next refresh reloads both tables
+        self.last_id = 0
+        self.today = None
+        self.loads = 0
+        self.appended = 0
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+        if not (cache_dir and self._open_files()):
+            self._reset(MIN_CAPACITY)
+
+    def _reset(self, capacity):
+        self.apps = []
+        self.app_index = {}
+        self.themes = []
+        self.theme_index = {}
+        self.size = 0
+        self.last_id = 0
+        self.layout = uuid.uuid4().hex[:8]
+        self.columns = {name: self._allocate(name, dtype, capacity) for name, dtype in COLUMNS.items()}
+        self.capacity = capacity
+
+    def _allocate(self, name, dtype, capacity):
+        if not self.cache_dir:
+            return np.empty(capacity, dtype=dtype)
+        path = os.path.join(self.cache_dir, f"{name}.{self.layout}.{capacity}.bin")
+        return np.memmap(path, dtype=dtype, mode="w+", shape=(capacity,))
+
+    def _open_files(self):
+        """Map the columns saved by an earlier process, if meta.json describes a complete set"""
+        try:
+            with open(os.path.join(self.cache_dir, "meta.json")) as f:
+                meta = json.load(f)
+            columns = {
+                name: np.memmap(os.path.join(self.cache_dir, f"{name}.{meta['layout']}.{meta['capacity']}.bin"),
+                                dtype=dtype, mode="r+", shape=(meta["capacity"],))
+                for name, dtype in COLUMNS.items()
+            }
+        except (OSError, ValueError, KeyError):
+            return False
+        self.columns = columns
+        self.layout, self.capacity, self.size = meta["layout"], meta["capacity"], meta["size"]
+        self.last_id, self.generation = meta["last_id"], meta["generation"]
+        self.apps, self.themes = meta["apps"], meta["themes"]
+        self.stale = False
+        self.app_index = {app: code for code, app in enumerate(self.apps)}
+        self.theme_index = {theme: code for code, theme in enumerate(self.themes)}
+        return True
+
+    def _save(self):
+        if not self.cache_dir:
+            return
+        for array in self.columns.values():
+            array.flush()
+        meta = {"layout": self.layout, "capacity": self.capacity, "size": self.size, "last_id": self.last_id,
+                "generation": self.generation, "apps": self.apps, "themes": self.themes}
+        path = os.path.join(self.cache_dir, "meta.json")
+        with open(path + ".tmp", "w") as f:
+            json.dump(meta, f)
+        os.replace(path + ".tmp", path)
+        # Files of earlier layouts; mapped ones may not be removable yet on Windows
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(".bin") and f".{self.layout}.{self.capacity}." not in name:
+                try:
+                    os.remove(os.path.join(self.cache_dir, name))
+                except OSError:
+                    pass
+
+    def _grow(self, needed):
+        capacity = self.capacity
+        while capacity < needed:
+            capacity *= 2
+        if capacity == self.capacity:
+            return
+        self.layout = uuid.uuid4().hex[:8]
+        grown = {}
+        for name, dtype in COLUMNS.items():
+            grown[name] = self._allocate(name, dtype, capacity)
+            grown[name][:self.size] = self.columns[name][:self.size]
+        self.columns, self.capacity = grown, capacity
+
+    def _append(self, rows):
+        """rows: (id, app, start_time, duration_seconds, brightness, theme_mode) tuples"""
+        ids, apps, starts, durations, brightness, themes = zip(*rows)
+        self._grow(self.size + len(rows))
+        names, inverse = np.unique(np.array(apps, dtype=object).astype(str), return_inverse=True)
+        for name in names.tolist():
+            if name not in self.app_index:
+                self.app_index[name] = len(self.apps)
+                self.apps.append(name)
+        codes = np.array([self.app_index[name] for name in names.tolist()], dtype=np.int32)
+
+        window = slice(self.size, self.size + len(rows))
+        self.columns["start_ms"][window] = _parse_starts(starts)
+        self.columns["duration"][window] = [value or 0 for value in durations]
+        self.columns["brightness"][window] = np.array(brightness, dtype=np.float64)  # None -> NaN
+        self.columns["app"][window] = codes[inverse.ravel()]
+        self.columns["theme"][window] = [self._theme_code(theme) for theme in themes]
+        self.size += len(rows)
+        self.last_id = max(self.last_id, max(ids))
+        self.appended += len(rows)
+
+    def _theme_code(self, theme):
+        if theme is None:
+            return THEME_NULL
+        code = self.theme_index.get(theme)
+        if code is None:
+            code = self.theme_index[theme] = len(self.themes)
+            self.themes.append(theme)
+        return code
+
+    def _load(self, db, query, params=()):
+        cursor = db.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(LOAD_CHUNK)
+            if not rows:
+                break
+            self._append(rows)
+
+    def refresh(self):
+        """Bring the columns up to date with the database; returns a SessionView"""
+        with self.lock:
+            db = timed_connect(self.db_file)
+            try:
+                try:
+                    max_id, self.today = db.execute("SELECT MAX(id), date('now') FROM app_sessions").fetchone()
+                except sqlite3.OperationalError:
+                    max_id, self.today = None, db.execute("SELECT date('now')").fetchone()[0]
+                current = generation(db)
+                columns = "id, app, start_time, duration_seconds, brightness, theme_mode"
+                # An empty live table (everything archived) is not a removal: archival bumps the generation
+                removed = max_id is not None and max_id < self.last_id
+                if self.stale or current != self.generation or removed:
+                    # Rows were merged, archived or removed: start over from both tables
+                    self._reset(self.capacity)
+                    self.generation = current
+                    self.stale = False
+                    attach_archive(db, self.archive_file)
+                    for table in ("archive.app_sessions", "main.app_sessions"):
+                        self._load(db, f"SELECT {columns} FROM {table} ORDER BY id")
+                    self.loads += 1
+                    self._save()
+                elif max_id and max_id > self.last_id:
+                    self._load(db, f"SELECT {columns} FROM main.app_sessions WHERE id > ? ORDER BY id",
+                               (self.last_id,))
+                    self._save()
+            finally:
+                db.close()
+            return SessionView(self.columns, self.size, list(self.apps), list(self.themes), self.today)
+
+    def invalidate(self):
+        """Make the next refresh reload everything instead of appending new ids"""
+        with self.lock:
+            self.stale = True
+
+    def stats(self):
+        return {"rows": self.size, "capacity": self.capacity, "apps": len(self.apps), "themes": len(self.themes),
+                "full_loads": self.loads, "rows_appended": self.appended, "memory_mapped": bool(self.cache_dir),
+                "bytes": sum(array[:self.size].nbytes for array in self.columns.values())}
+
+
+_instances = {}
+_instances_lock = threading.Lock()
+
+
+def get_session_columns(db_file, service, archive_file=ARCHIVE_DB_FILE):
+    """The process-wide SessionColumns for db_file.
+
+    Memory-mapped under SESSION_CACHE_DIR/<service> when that is set; each
+    service process needs its own directory since the files are written in place.
+    """
+    key = os.path.abspath(db_file)
+    with _instances_lock:
+        if key not in _instances:
+            base = os.environ.get("SESSION_CACHE_DIR")
+            _instances[key] = SessionColumns(db_file, archive_file, os.path.join(base, service) if base else None)
+        return _instances[key]
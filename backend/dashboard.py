@@ -0,0 +1,183 @@
+"""Combined dashboard snapshot for the app usage service.
+
+The dashboard used to need one request (and one full query) per panel. The
+snapshot builds every panel from one SessionColumns view (columnar.py), the
+columns behind the standalone endpoints, plus the newest-sessions query that
+/app_report runs. The panel builders below are the ones those endpoints
+(/app_report, /usage_summary, /usage_by_hour, /theme_stats, /brightness_stats)
+call, so a panel always matches its endpoint. Productivity is scored with
+SessionView.productivity_split, like /predict/productivity/daily. The result
+is cached and keyed on MAX(app_sessions.id), the current date and the
+retention generation, so repeated refreshes without new sessions are served
+from memory.
+"""
+import os
+import threading
+import time
+from tree_engine import compile_forest
+from metrics import timed_connect
+from retention import generation
+
+RECENT_LIMIT = 100
+
+
+def recent_sessions(db, limit=RECENT_LIMIT):
+    """The newest live sessions, newest first"""
+    rows = db.execute("""
+        SELECT app, start_time, end_time, duration_seconds, brightness, theme_mode
+        FROM app_sessions
+        ORDER BY id DESC
+        LIMIT ?
+    """, (limit,)).fetchall()
+    return [{
+        "app": row[0],
+        "start_time": row[1],
+        "end_time": row[2],
+        "duration": row[3],
+        "brightness": row[4],
+        "theme_mode": row[5]
+    } for row in rows]
+
+
+def usage_summary_panel(view):
+    """Today's usage per app, longest total first"""
+    # (app, session count, total seconds, avg duration, avg brightness, themes)
+    rows = view.aggregate(("app",), view.today, view.today)
+    rows.sort(key=lambda row: row[2], reverse=True)
+    return [{
+        "app": row[0],
+        "session_count": row[1],
+        "total_seconds": row[2],
+        "total_minutes": round(row[2] / 60, 1),
+        "avg_duration": round(row[3], 1) if row[3] else 0,
+        "avg_brightness": round(row[4], 1) if row[4] else "N/A",
+        "themes_used": row[5] if row[5] else "Unknown"
+    } for row in rows]
+
+
+def usage_by_hour_panel(view):
+    """Today's usage per hour and app"""
+    # (hour, app, session count, total seconds, avg duration, avg brightness, themes)
+    rows = view.aggregate(("hour", "app"), view.today, view.today)
+    rows.sort(key=lambda row: (row[0], -row[3]))
+    return [{
+        "hour": row[0],
+        "app": row[1],
+        "total_minutes": round(row[3] / 60, 1),
+        "avg_brightness": round(row[5], 1) if row[5] else "N/A",
+        "themes": row[6] if row[6] else "Unknown"
+    } for row in rows]
+
+
+def theme_stats_panel(view):
+    """All-time sessions and minutes per known theme"""
+    rows = [row for row in view.aggregate(("theme",)) if row[0] is not None and row[0] != "Unknown"]
+    rows.sort(key=lambda row: row[2], reverse=True)
+    return [{
+        "theme_mode": row[0],
+        "session_count": row[1],
+        "total_minutes": round(row[2] / 60, 1) if row[2] else 0
+    } for row in rows]
+
+
+def brightness_stats_panel(view):
+    """All-time brightness summary"""
+    avg, low, high, count = view.brightness_summary()
+    return {
+        "avg_brightness": round(avg, 1) if avg else "N/A",
+        "min_brightness": low if low else "N/A",
+        "max_brightness": high if high else "N/A",
+        "records_count": count if count else 0
+    }
+
+
+class DashboardCache:
+    """Cached dashboard snapshot built from the session columns"""
+
+    def __init__(self, db_file, session_columns, model_file="productivity_model.pkl"):
+        self.db_file = db_file
+        self.session_columns = session_columns
+        self.model_file = model_file
+        self.lock = threading.Lock()
+        self.key = None
+        self.snapshot = None
+        self.hits = 0
+        self.misses = 0
+        self.model_mtime = None
+        self.engine = None
+        self.app_codes = None
+
+    def invalidate(self):
+        with self.lock:
+            self.key = None
+            self.snapshot = None
+
+    def get(self):
+        """Return (snapshot, cache_hit)"""
+        with self.lock:
+            db = timed_connect(self.db_file)
+            try:
+                max_id, today = db.execute("SELECT MAX(id), date('now') FROM app_sessions").fetchone()
+                key = (max_id, today, generation(db))
+                if key == self.key and self.snapshot is not None:
+                    self.hits += 1
+                    return self.snapshot, True
+                self.misses += 1
+                self.snapshot = self._build(db, max_id or 0)
+                self.key = key
+                return self.snapshot, False
+            finally:
+                db.close()
+
+    def _build(self, db, max_id):
+        started = time.perf_counter()
+        view = self.session_columns.refresh()
+        snapshot = {
+            "recent_sessions": recent_sessions(db),
+            "usage_summary": usage_summary_panel(view),
+            "usage_by_hour": usage_by_hour_panel(view),
+            "theme_stats": theme_stats_panel(view),
+            "brightness_stats": brightness_stats_panel(view),
+            "productivity": self._productivity(view),
+            "date": view.today,
+            "max_session_id": max_id,
+            "build_ms": None
+        }
+        snapshot["build_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        return snapshot
+
+    def _load_engine(self):
+        """Compiled productivity model, reloaded when the model file changes"""
+        try:
+            mtime = os.path.getmtime(self.model_file)
+        except OSError:
+            return None
+        if mtime != self.model_mtime:
+            try:
+                import joblib
+                model, le_app = joblib.load(self.model_file)
+                self.engine = compile_forest(model)
+                self.app_codes = {app: code for code, app in enumerate(le_app.classes_)}
+            except Exception as e:
+                print(f"Productivity model unavailable for dashboard: {e}")
+                self.engine = None
+            self.model_mtime = mtime
+        return self.engine
+
+    def _productivity(self, view):
+        """Today's productive/distracting split, scored like /predict/productivity/daily"""
+        keep = view.mask(view.today, view.today)
+        session_count = int(keep.sum())
+        engine = self._load_engine()
+        if engine is None or not session_count:
+            return None
+        productive_seconds, distracting_seconds = view.productivity_split(engine, self.app_codes, keep)
+        total_seconds = productive_seconds + distracting_seconds
+        return {
+            "productive_minutes": round(productive_seconds / 60, 1),
+            "distracting_minutes": round(distracting_seconds / 60, 1),
+            "total_minutes": round(total_seconds / 60, 1),
+            "productive_percentage": round(productive_seconds / total_seconds * 100, 1) if total_seconds > 0 else 0,
+            "distracting_percentage": round(distracting_seconds / total_seconds * 100, 1) if total_seconds > 0 else 0,
+            "session_count": session_count
+        }
@@ -0,0 +1,160 @@
+"""Multi-monitor brightness access shared by the backend services.
+
+Brightness used to be read and written through sbc.get_brightness()[0] and
+sbc.set_brightness(), which only considered the first monitor and re-detected
+displays on every call. DisplayManager enumerates displays once, keeps their
+handles, and reads or writes every display concurrently on a small thread pool
+(DDC/CI round trips are slow and independent per monitor), with optional
+per-display targets. Displays are keyed "name#index": two monitors of the same
+model report the same name.
+
+DISPLAY_BACKEND=fake selects FakeDisplayBackend, which simulates monitors in
+memory for tests and headless machines.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import os
+import threading
+import time
+from providers import sbc
+from metrics import timer, ACTUATOR_LATENCY
+
+
+class SbcDisplayBackend:
+    """Real displays through screen_brightness_control"""
+
+    def enumerate(self):
+        displays = []
+        for index, info in enumerate(sbc.list_monitors_info()):
+            name = info.get("name") or f"Display {index}"
+            displays.append((name, sbc.Display.from_dict(info)))
+        return displays
+
+    def get_brightness(self, handle):
+        return handle.get_brightness()
+
+    def set_brightness(self, handle, value):
+        handle.set_brightness(value)
+
+
+class FakeDisplayBackend:
+    """In-memory monitors with an optional per-call delay to mimic DDC latency"""
+
+    def __init__(self, count=2, brightness=50, delay=0.0):
+        self.values = {index: brightness for index in range(count)}
+        self.delay = delay
+        self.calls = []
+
+    def enumerate(self):
+        return [(f"Fake Display {index}", index) for index in self.values]
+
+    def get_brightness(self, handle):
+        time.sleep(self.delay)
+        self.calls.append(("get", handle))
+        return self.values[handle]
+
+    def set_brightness(self, handle, value):
+        time.sleep(self.delay)
+        self.calls.append(("set", handle, value))
+        self.values[handle] = value
+
+
+class DisplayManager:
+    """Cached display handles with concurrent per-display reads and writes"""
+
+    def __init__(self, backend=None, max_workers=4):
+        self.backend = backend or SbcDisplayBackend()
+        self.displays = None
+        self.lock = threading.Lock()
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="display")
+
+    def list_displays(self):
+        """Display keys ("name#index"), enumerating the hardware only on first use"""
+        with self.lock:
+            if self.displays is None:
+                try:
+                    self.displays = [(f"{name}#{index}", name, handle)
+                                     for index, (name, handle) in enumerate(self.backend.enumerate())]
+                except Exception as e:
+                    print(f"Display enumeration error: {e}")
+                    return []
+            return [key for key, _, _ in self.displays]
+
+    def refresh(self):
+        """Forget cached handles (e.g. after a monitor is plugged in)"""
+        with self.lock:
+            self.displays = None
+        return self.list_displays()
+
+    def _handles(self):
+        self.list_displays()
+        return list(self.displays or [])
+
+    def get_brightness(self):
+        """{display key: brightness or None}, read from all displays at once"""
+        def read(display):
+            key, _, handle = display
+            try:
+                with timer(ACTUATOR_LATENCY, actuator="display_get"):
+                    value = self.backend.get_brightness(handle)
+                # sbc handles may return a one-element list
+                return key, value[0] if isinstance(value, list) else value
+            except Exception as e:
+                print(f"Brightness read error on {key}: {e}")
+                return key, None
+        return dict(self.pool.map(read, self._handles()))
+
+    def average_brightness(self):
+        """Mean brightness over displays that could be read, or None"""
+        values = [value for value in self.get_brightness().values() if value is not None]
+        return round(sum(values) / len(values)) if values else None
+
+    def set_brightness(self, targets):
+        """Write brightness to all displays concurrently.
+
+        targets is either one value for every display or a dict keyed by
+        display key or index; displays not in the dict are left alone. A plain
+        display name is accepted only while no other display shares it.
+        Returns {display key: True/False}.
+        """
+        handles = self._handles()
+        if isinstance(targets, dict):
+            names = [name for _, name, _ in handles]
+            jobs = []
+            for index, (key, name, handle) in enumerate(handles):
+                value = targets.get(key, targets.get(index, targets.get(str(index))))
+                if value is None and name in targets:
+                    if names.count(name) == 1:
+                        value = targets[name]
+                    else:
+                        print(f"Brightness target {name!r} matches several displays; use {key!r}")
+                if value is not None:
+                    jobs.append((key, handle, value))
+        else:
+            jobs = [(key, handle, targets) for key, _, handle in handles]
+
+        def write(job):
+            key, handle, value = job
+            try:
+                with timer(ACTUATOR_LATENCY, actuator="display_set"):
+                    self.backend.set_brightness(handle, int(max(0, min(100, value))))
+                return key, True
+            except Exception as e:
+                print(f"Brightness setting error on {key}: {e}")
+                return key, False
+        return dict(self.pool.map(write, jobs))
+
+
+_default_manager = None
+_default_lock = threading.Lock()
+
+
+def get_display_manager():
+    """Process-wide DisplayManager, created on first use"""
+    global _default_manager
+    with _default_lock:
+        if _default_manager is None:
+            if os.environ.get("DISPLAY_BACKEND") == "fake":
+                _default_manager = DisplayManager(FakeDisplayBackend())
+            else:
+                _default_manager = DisplayManager()
+        return _default_manager
@@ -1,51 +1,123 @@
 from flask import Flask, jsonify, request
 from flask_cors import CORS
 import threading
-import time
-import sqlite3
-import joblib
+import numpy as np
+from tree_engine import compile_forest
+from metrics import instrument_app, timed_connect, timer, MODEL_LATENCY
+from providers import joblib
+from retention import attach_archive
 
 app = Flask(__name__)
 CORS(app)  # Allow frontend (Electron) to call API
+instrument_app(app, "fatigue_api")
 
-# Load fatigue model
-model = joblib.load("fatigue_model.pkl")
+# Fatigue model, loaded and flattened for fast scoring on first use
+MODEL_FILE = "fatigue_model.pkl"
+engine = None
+engine_lock = threading.Lock()
+
+def get_engine():
+    global engine
+    with engine_lock:
+        if engine is None:
+            engine = compile_forest(joblib.load(MODEL_FILE))
+        return engine
 
 # Database connection
 DB_FILE = "app_usage.db"
-conn = sqlite3.connect(DB_FILE, check_same_thread=False)
+conn = timed_connect(DB_FILE, check_same_thread=False)
+attach_archive(conn)  # /predfatigue/range can reach back into archived sessions
 c = conn.cursor()
 
 # Auto-trigger state
 auto_trigger_enabled = False
+last_scored_id = None
+check_lock = threading.Lock()  # held while checking; guards last_scored_id against /toggle_autopredfatigue
+new_session_event = threading.Event()
+FALLBACK_CHECK_SECONDS = 300
+
+def build_features(rows):
+    """Turn (duration_seconds, brightness, start_time) rows into the model's feature matrix.
+
+    NULL brightness stays missing (NaN), as sklearn saw the None it was passed before.
+    """
+    X = np.empty((len(rows), 3), dtype=np.float64)
+    for i, (duration_seconds, brightness, start_time) in enumerate(rows):
+        hour = int(start_time[11:13])
+        X[i, 0] = duration_seconds / 60
+        X[i, 1] = brightness if brightness is not None else np.nan
+        X[i, 2] = 1 if (hour >= 22 or hour < 6) else 0
+    return X
+
+def score_features(X):
+    """Score a feature matrix with a single predict_proba call.
+
+    Returns (predictions, fatigue probabilities); the label is derived from the
+    probabilities the same way RandomForestClassifier.predict does.
+    """
+    forest = get_engine()
+    with timer(MODEL_LATENCY, model="fatigue"):
+        proba = forest.predict_proba(X)
+    predictions = forest.classes_.take(np.argmax(proba, axis=1))
+    return predictions, proba[:, 1]
+
+def check_new_sessions(cur):
+    """Score every session inserted since the last check in one batch"""
+    global last_scored_id
+    if last_scored_id is None:
+        # First check after enabling: start from the latest session
+        cur.execute("SELECT MAX(id) FROM app_sessions")
+        max_id = cur.fetchone()[0]
+        if max_id is None:
+            return 0
+        last_scored_id = max_id - 1
+
+    cur.execute("""
+        SELECT id, duration_seconds, brightness, start_time
+        FROM app_sessions
+        WHERE id > ?
+        ORDER BY id
+    """, (last_scored_id,))
+    rows = cur.fetchall()
+    if not rows:
+        return 0
+
+    # A malformed row is skipped, not retried: it would fail the same way on every later check
+    scored, features = [], []
+    for row in rows:
+        try:
+            features.append(build_features([row[1:]])[0])
+        except (TypeError, ValueError) as e:
+            print(f"Auto fatigue check skipped session {row[0]}: {e}")
+            continue
+        scored.append(row)
+
+    if scored:
+        predictions, probs = score_features(np.array(features))
+        for row, prediction, prob in zip(scored, predictions, probs):
+            if prediction == 1 and prob > 0.7:
+                print(f"⚠ AUTO WARNING: High fatigue risk detected! (session {row[0]}, prob {prob:.2f})")
+
+    last_scored_id = rows[-1][0]
+    return len(rows)
 
 def check_latest_fatigue():
-    """Background job to auto-check fatigue risk every 60s"""
-    global auto_trigger_enabled
+    """Background job: score new sessions as soon as the tracker reports them.
+
+    Sleeps on new_session_event instead of polling, so it costs nothing while
+    idle; a slow fallback check catches inserts from trackers that don't notify.
+    """
+    # Own connection so request handlers never share this cursor
+    cur = timed_connect(DB_FILE).cursor()
     while True:
+        new_session_event.wait(FALLBACK_CHECK_SECONDS if auto_trigger_enabled else None)
+        new_session_event.clear()
         if auto_trigger_enabled:
-            c.execute("""
-                SELECT duration_seconds, brightness, start_time
-                FROM app_sessions 
-                ORDER BY id DESC 
-                LIMIT 1
-            """)
-            row = c.fetchone()
-
-            if row:
-                duration_seconds, brightness, start_time = row
-                duration_minutes = duration_seconds / 60
-                hour = int(start_time[11:13])
-                night_session = 1 if (hour >= 22 or hour < 6) else 0
-
-                features = [[duration_minutes, brightness, night_session]]
-                prediction = model.predict(features)[0]
-                prob = model.predict_proba(features)[0][1]
-
-                if prediction == 1 and prob > 0.7:
-                    print("⚠ AUTO WARNING: High fatigue risk detected!")
-
-        time.sleep(60)  # run every 1 minute
+            try:
+                with check_lock:
+                    check_new_sessions(cur)
+            except Exception as e:
+                print(f"Auto fatigue check error: {e}")
 
 # Start background thread
 threading.Thread(target=check_latest_fatigue, daemon=True).start()
@@ -56,7 +128,7 @@ def home():
 
 @app.route("/health")
 def health():
-    return jsonify({"status": "healthy"})
+    return jsonify({"status": "healthy", "model_loaded": engine is not None})
 
 @app.route("/predfatigue/latest", methods=["GET"])
 def predict_latest():
@@ -74,31 +146,110 @@ def predict_latest():
             return jsonify({"error": "No app usage data found"})
 
         duration_seconds, brightness, start_time = row
-        duration_minutes = duration_seconds / 60
-        hour = int(start_time[11:13])
-        night_session = 1 if (hour >= 22 or hour < 6) else 0
-
-        features = [[duration_minutes, brightness, night_session]]
-        prediction = model.predict(features)[0]
-        prob = model.predict_proba(features)[0][1]
+        features = build_features([row])
+        predictions, probs = score_features(features)
+        prediction, prob = predictions[0], probs[0]
 
         return jsonify({
-            "duration_minutes": duration_minutes,
+            "duration_minutes": duration_seconds / 60,
             "brightness": brightness,
-            "night_session": night_session,
+            "night_session": int(features[0, 2]),
             "fatigue_prediction": int(prediction),
             "fatigue_probability": round(float(prob), 2)
         })
     except Exception as e:
         return jsonify({"error": str(e)})
 
+@app.route("/predfatigue/range", methods=["GET"])
+def predict_range():
+    """Fatigue risk timeline for every session in a time window.
+
+    Query params: start, end (YYYY-MM-DD or YYYY-MM-DD HH:MM:SS, default today)
+    and bucket=hour to aggregate the timeline per hour.
+    """
+    try:
+        start = request.args.get("start")
+        end = request.args.get("end")
+        bucket = request.args.get("bucket")
+
+        if bucket not in (None, "", "hour"):
+            return jsonify({"error": "bucket must be 'hour'"}), 400
+
+        # A bare end date covers the whole day
+        if end and len(end) == 10:
+            end = end + " 23:59:59.999"
+
+        c_range = conn.cursor()
+        c_range.execute("""
+            SELECT duration_seconds, brightness, start_time
+            FROM all_sessions
+            WHERE start_time >= COALESCE(?, date('now'))
+              AND start_time <= COALESCE(?, date('now') || ' 23:59:59.999')
+            ORDER BY start_time
+        """, (start, end))
+        rows = c_range.fetchall()
+
+        if not rows:
+            return jsonify({"start": start, "end": end, "session_count": 0, "timeline": []})
+
+        predictions, probs = score_features(build_features(rows))
+        high_risk = (predictions == 1) & (probs > 0.7)
+
+        if bucket == "hour":
+            hours = [row[2][:13] for row in rows]
+            timeline = []
+            i = 0
+            # Rows are ordered by start_time, so each hour is a contiguous run
+            while i < len(rows):
+                j = i
+                while j < len(rows) and hours[j] == hours[i]:
+                    j += 1
+                timeline.append({
+                    "hour": hours[i] + ":00",
+                    "sessions": j - i,
+                    "avg_probability": round(float(probs[i:j].mean()), 2),
+                    "max_probability": round(float(probs[i:j].max()), 2),
+                    "high_risk_sessions": int(high_risk[i:j].sum())
+                })
+                i = j
+        else:
+            timeline = [{
+                "start_time": row[2],
+                "fatigue_prediction": int(pred),
+                "fatigue_probability": round(float(prob), 2)
+            } for row, pred, prob in zip(rows, predictions, probs)]
+
+        return jsonify({
+            "start": start,
+            "end": end,
+            "session_count": len(rows),
+            "high_risk_sessions": int(high_risk.sum()),
+            "avg_probability": round(float(probs.mean()), 2),
+            "timeline": timeline
+        })
+    except Exception as e:
+        return jsonify({"error": str(e)})
+
 @app.route("/toggle_autopredfatigue", methods=["POST"])
 def toggle_autopredfatigue():
     """Enable or disable auto fatigue warnings"""
-    global auto_trigger_enabled
+    global auto_trigger_enabled, last_scored_id
     enabled = request.json.get("enabled", False)
     auto_trigger_enabled = bool(enabled)
+    if not auto_trigger_enabled:
+        # Don't replay sessions logged while disabled once re-enabled
+        with check_lock:
+            last_scored_id = None
+    new_session_event.set()
     return jsonify({"auto_trigger_enabled": auto_trigger_enabled})
 
+@app.route("/notify_session", methods=["POST"])
+def notify_session():
+    """Called by the app usage tracker after it inserts a session"""
+    new_session_event.set()
+    return jsonify({"notified": True, "auto_trigger_enabled": auto_trigger_enabled})
+
 if __name__ == "__main__":
+    # Load the model in the background so /health answers as soon as the server is up
+    threading.Thread(target=get_engine, daemon=True).start()
     app.run(port=5005)
@@ -1,27 +1,46 @@
 
-import cv2
-import mediapipe as mp
 import numpy as np
-from sklearn.naive_bayes import GaussianNB
 from flask import Flask, Response, jsonify, request
+import os
 import time
 import threading
+from luminance import estimate_luminance
+from providers import cv2, mp, sklearn_naive_bayes
+from metrics import instrument_app, timer, FRAME_STAGE_LATENCY, FRAME_FPS, MODEL_LATENCY
+from streams import Broadcast
+from asgi import AsgiApp, asgi_enabled, serve, stream_response
 
 app = Flask(__name__)
+instrument_app(app, "fatigue_detection")
 
-# MediaPipe setup
-mp_face_mesh = mp.solutions.face_mesh
-face_mesh = mp_face_mesh.FaceMesh(refine_landmarks=True)
+# MediaPipe face mesh and the blink classifier are built on first use
+face_mesh = None
+face_mesh_error = None  # why face detection is unavailable (MediaPipe missing); reported by /health
+clf = None
+model_lock = threading.Lock()
 
 # Eye landmark indices (from MediaPipe Face Mesh)
 LEFT_EYE = [33, 160, 158, 133, 153, 144]
 RIGHT_EYE = [263, 387, 385, 362, 380, 373]
 
-# Classifier (Naive Bayes)
-clf = GaussianNB()
+# Classifier (Naive Bayes) training data
 X_train = np.array([[15, 100], [16, 110], [14, 90], [6, 200], [7, 180], [5, 220]])
 y_train = np.array([0, 0, 0, 1, 1, 1])
-clf.fit(X_train, y_train)
+
+def get_face_mesh():
+    global face_mesh
+    with model_lock:
+        if face_mesh is None:
+            face_mesh = mp.solutions.face_mesh.FaceMesh(refine_landmarks=True)
+        return face_mesh
+
+def get_classifier():
+    global clf
+    with model_lock:
+        if clf is None:
+            clf = sklearn_naive_bayes.GaussianNB()
+            clf.fit(X_train, y_train)
+        return clf
 
 # Global variables
 last_blink_time = time.time()
@@ -31,11 +50,19 @@ closed_frames = 0
 EAR_THRESH = 0.22
 CONSEC_FRAMES = 3
 fatigue_status = "Normal"
+ambient_luminance = None
 camera = None
 is_camera_active = False
 frame_lock = threading.Lock()
 frame = None
 stop_event = threading.Event()
+producer_thread = None  # the running capture loop; it clears this under frame_lock as it decides to exit
+# Annotated JPEG frames from the one capture loop, fanned out to every /video_feed viewer
+frames = Broadcast(history=1)
+FRAME_WAIT = 1.0  # seconds a viewer waits for a frame before checking it is still connected
+FPS_ALPHA = 0.1  # EMA weight of the newest frame interval
+last_frame_at = None
+smoothed_fps = None
 
 def eye_aspect_ratio(landmarks, eye_indices):
     p1, p2, p3, p4, p5, p6 = [landmarks[i] for i in eye_indices]
@@ -44,23 +71,103 @@ def eye_aspect_ratio(landmarks, eye_indices):
     horizontal = np.linalg.norm(np.array(p1) - np.array(p4))
     return (vertical1 + vertical2) / (2.0 * horizontal)
 
-def generate_frames():
-    global last_blink_time, blink_count, frame_counter, blink_durations, closed_frames, fatigue_status, camera, is_camera_active, frame
-    while not stop_event.is_set():
+def record_frame_rate():
+    """Fold the interval since the previous frame into the FPS gauge"""
+    global last_frame_at, smoothed_fps
+    now = time.perf_counter()
+    if last_frame_at is not None and now > last_frame_at:
+        fps = 1.0 / (now - last_frame_at)
+        smoothed_fps = fps if smoothed_fps is None else smoothed_fps + FPS_ALPHA * (fps - smoothed_fps)
+        FRAME_FPS.set(round(smoothed_fps, 2))
+    last_frame_at = now
+
+class SyntheticCamera:
+    """Moving test pattern at about 30 fps, for running without a webcam (CAMERA_SOURCE=synthetic)"""
+
+    def __init__(self, width=640, height=480, fps=30):
+        self.width, self.height = width, height
+        self.interval = 1.0 / fps
+        self.next_at = time.monotonic()
+        self.count = 0
+
+    def isOpened(self):
+        return True
+
+    def read(self):
+        delay = self.next_at - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        self.next_at = max(self.next_at + self.interval, time.monotonic())
+        image = np.full((self.height, self.width, 3), 40, dtype=np.uint8)
+        x = (self.count * 8) % self.width
+        image[:, x:x + 40] = (200, 200, 200)
+        self.count += 1
+        return True, image
+
+    def release(self):
+        pass
+
+def open_camera():
+    if os.environ.get("CAMERA_SOURCE") == "synthetic":
+        return SyntheticCamera()
+    return cv2.VideoCapture(0)
+
+def load_face_mesh():
+    """The face mesh, or None when MediaPipe is unavailable; the failure is logged once, not retried per frame"""
+    global face_mesh_error
+    if face_mesh_error is None:
+        try:
+            return get_face_mesh()
+        except ImportError as e:
+            face_mesh_error = str(e)
+            print(f"Face detection unavailable, streaming frames without blink tracking: {e}")
+    return None
+
+def detect_faces(rgb):
+    """Face mesh landmarks, or None when face detection is unavailable"""
+    face_mesh = load_face_mesh()
+    return None if face_mesh is None else face_mesh.process(rgb)
+
+def produce_frames():
+    """Capture loop: runs the pipeline once per frame and publishes the JPEG to every viewer"""
+    try:
+        capture_loop()
+    finally:
+        release_producer()
+
+def release_producer():
+    """Forget this thread as the producer, under frame_lock, so start_camera starts a new one"""
+    global producer_thread
+    with frame_lock:
+        if producer_thread is threading.current_thread():
+            producer_thread = None
+
+def capture_loop():
+    global last_blink_time, blink_count, frame_counter, blink_durations, closed_frames, fatigue_status, camera, is_camera_active, frame, ambient_luminance, producer_thread
+    avgEAR = 0.0
+    while True:
         with frame_lock:
-            if not is_camera_active or camera is None:
-                time.sleep(0.1)
-                continue
-            success, frame = camera.read()
+            # Deciding to exit and giving up producer_thread happen together, so a start_camera
+            # racing with a stop either keeps this loop running or starts a fresh one
+            if stop_event.is_set() or not is_camera_active or camera is None:
+                producer_thread = None
+                break
+            with timer(FRAME_STAGE_LATENCY, stage="capture"):
+                success, frame = camera.read()
             if not success:
                 print("Error: Failed to read frame from camera.")
+                producer_thread = None
                 break
+            # Ambient light comes for free from frames we already capture
+            with timer(FRAME_STAGE_LATENCY, stage="luminance"):
+                ambient_luminance = estimate_luminance(frame)
 
-        rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        results = face_mesh.process(rgb)
+        with timer(FRAME_STAGE_LATENCY, stage="face_mesh"):
+            rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            results = detect_faces(rgb)
 
         eyes_detected = False
-        if results.multi_face_landmarks:
+        if results is not None and results.multi_face_landmarks:
             for face_landmarks in results.multi_face_landmarks:
                 h, w, _ = frame.shape
                 landmarks = [(int(lm.x * w), int(lm.y * h)) for lm in face_landmarks.landmark]
@@ -79,7 +186,10 @@ def generate_frames():
 
                 eyes_detected = True
 
-        if not eyes_detected:
+        if face_mesh_error is not None:
+            # No detector, so no eyes is not evidence of closed eyes
+            fatigue_status = "Face detection unavailable"
+        elif not eyes_detected:
             if time.time() - last_blink_time > 5:
                 fatigue_status = "⚠️ Fatigue Detected (Eyes Closed!)"
         else:
@@ -87,28 +197,46 @@ def generate_frames():
             fatigue_status = "Normal"
 
         frame_counter += 1
-        with frame_lock:
+        with frame_lock, timer(FRAME_STAGE_LATENCY, stage="annotate"):
             if frame is not None:
                 cv2.putText(frame, f"EAR: {avgEAR:.2f}", (30, 50), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
                 cv2.putText(frame, f"Blinks: {blink_count}", (30, 100), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
                 cv2.putText(frame, f"Status: {fatigue_status}", (30, 450), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (255, 255, 255), 2)
 
-        ret, buffer = cv2.imencode('.jpg', frame)
+        with timer(FRAME_STAGE_LATENCY, stage="encode"):
+            ret, buffer = cv2.imencode('.jpg', frame)
+        record_frame_rate()
         if not ret:
             continue
             
-        frame_bytes = buffer.tobytes()
-        yield (b'--frame\r\n'
-               b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
+        frames.publish(b'--frame\r\n'
+                       b'Content-Type: image/jpeg\r\n\r\n' + buffer.tobytes() + b'\r\n')
+
+def generate_frames():
+    """Multipart parts for one viewer, newest frame first; the viewer never runs the pipeline itself"""
+    for entry in frames.follow(timeout=FRAME_WAIT, latest=True):
+        if entry is not None:
+            yield entry[1]
+
+async def video_feed_stream(scope, receive, send):
+    """/video_feed as a coroutine for the asyncio server"""
+    async def parts():
+        async for entry in frames.follow_async(timeout=FRAME_WAIT, latest=True):
+            if entry is not None:
+                yield entry[1]
+    await stream_response(send, receive, "multipart/x-mixed-replace; boundary=frame", parts(), "/video_feed")
 
 def start_camera():
-    global camera, is_camera_active
+    global camera, is_camera_active, producer_thread
     with frame_lock:
         if camera is None:
-            camera = cv2.VideoCapture(0)
+            camera = open_camera()
             if not camera.isOpened():
                 raise RuntimeError("Could not open camera.")
         is_camera_active = True
+        if producer_thread is None:
+            producer_thread = threading.Thread(target=produce_frames, daemon=True)
+            producer_thread.start()
 
 def stop_camera():
     global is_camera_active, camera
@@ -118,6 +246,20 @@ def stop_camera():
             camera.release()
             camera = None
 
+def warm_up():
+    """Build the models off the request path so the first frame isn't slow"""
+    get_classifier()
+    load_face_mesh()
+
+@app.route('/health')
+def health():
+    return jsonify({
+        "status": "degraded" if face_mesh_error else "healthy",
+        "models_loaded": face_mesh is not None and clf is not None,
+        "face_detection": "unavailable" if face_mesh_error else "ok",
+        "face_detection_error": face_mesh_error
+    })
+
 @app.route('/video_feed')
 def video_feed():
     return Response(generate_frames(), mimetype='multipart/x-mixed-replace; boundary=frame')
@@ -126,11 +268,15 @@ def video_feed():
 def status():
     global blink_count, blink_durations, frame_counter
     with frame_lock:
-        if frame_counter > 0:
+        if face_mesh_error is not None:
+            fatigue_status = "Face detection unavailable"
+            recommendation = "Install mediapipe to enable blink tracking."
+        elif frame_counter > 0:
             avg_duration = np.mean(blink_durations) if blink_durations else 0
             blink_rate = blink_count / (frame_counter / 30 / 60)
             features = np.array([[blink_rate, avg_duration]])
-            fatigue_prob = clf.predict_proba(features)[0][1]
+            with timer(MODEL_LATENCY, model="blink_nb"):
+                fatigue_prob = get_classifier().predict_proba(features)[0][1]
             if fatigue_prob > 0.3 or (time.time() - last_blink_time > 5):
                 if time.time() - last_blink_time > 5:
                     fatigue_status = "⚠️ Fatigue Detected (Eyes Closed!)"
@@ -144,7 +290,11 @@ def status():
         else:
             fatigue_status = "Normal"
             recommendation = "Recommendation: Start detection to monitor eye fatigue."
-    return jsonify({"fatigue_status": fatigue_status, "recommendation": recommendation})
+    return jsonify({
+        "fatigue_status": fatigue_status,
+        "recommendation": recommendation,
+        "ambient_luminance": round(ambient_luminance, 1) if ambient_luminance is not None else None
+    })
 
 @app.route('/start_detection', methods=['POST'])
 def start_detection():
@@ -161,9 +311,16 @@ def stop_detection():
     stop_event.set()
     return jsonify({"status": "stopped"})
 
+# SERVER_MODE=asgi: /video_feed viewers are coroutines instead of one thread each
+asgi_app = AsgiApp(app, {"/video_feed": video_feed_stream})
+
 if __name__ == "__main__":
+    threading.Thread(target=warm_up, daemon=True).start()
     try:
-        app.run(host='0.0.0.0', port=5003, debug=True)
+        if asgi_enabled():
+            serve(asgi_app, host='0.0.0.0', port=5003)
+        else:
+            app.run(host='0.0.0.0', port=5003)
     finally:
         stop_event.set()
         with frame_lock:
@@ -0,0 +1,143 @@
+"""Foreground-window sources for the app usage tracker.
+
+The tracker only needs one thing from the OS: the process name of the window
+the user is looking at. Sources implement active_app(); the Windows source
+reads it through win32gui/psutil, and ScriptedForegroundSource replays a fixed
+sequence of apps so the tracker can run (and be exercised) on Linux.
+
+Sources with event_driven = True also implement wait_for_change(timeout),
+which blocks until the foreground window may have changed, so the tracker
+does not have to poll. On Windows this is a SetWinEventHook subscription to
+EVENT_SYSTEM_FOREGROUND.
+
+FOREGROUND_SOURCE=scripted with FOREGROUND_SCRIPT="Code.exe:10,chrome.exe:5"
+selects the scripted source (app name and seconds in the foreground, looped);
+FOREGROUND_SOURCE=poll forces plain polling on Windows.
+"""
+import os
+import platform
+import threading
+import time
+
+
+class Win32ForegroundSource:
+    """Foreground process name on Windows"""
+
+    event_driven = False
+
+    def __init__(self):
+        import psutil
+        import win32gui
+        import win32process
+        self.psutil = psutil
+        self.win32gui = win32gui
+        self.win32process = win32process
+
+    def active_app(self):
+        try:
+            hwnd = self.win32gui.GetForegroundWindow()
+            tid, pid = self.win32process.GetWindowThreadProcessId(hwnd)
+            return self.psutil.Process(pid).name()
+        except Exception:
+            return "Unknown"
+
+
+class Win32EventForegroundSource(Win32ForegroundSource):
+    """Win32 source woken by EVENT_SYSTEM_FOREGROUND notifications"""
+
+    EVENT_SYSTEM_FOREGROUND = 0x0003
+    WINEVENT_OUTOFCONTEXT = 0x0000
+
+    def __init__(self):
+        super().__init__()
+        self.event_driven = True
+        self.changed = threading.Event()
+        self.hooked = threading.Event()
+        threading.Thread(target=self._pump, daemon=True).start()
+        self.hooked.wait(2)
+
+    def _pump(self):
+        """Install the hook and run the message loop it needs, on one thread"""
+        import ctypes
+        from ctypes import wintypes
+        user32 = ctypes.windll.user32
+        WinEventProc = ctypes.WINFUNCTYPE(None, wintypes.HANDLE, wintypes.DWORD, wintypes.HWND,
+                                          wintypes.LONG, wintypes.LONG, wintypes.DWORD, wintypes.DWORD)
+        # Keep a reference so the callback isn't garbage collected
+        self._callback = WinEventProc(lambda *args: self.changed.set())
+        hook = user32.SetWinEventHook(self.EVENT_SYSTEM_FOREGROUND, self.EVENT_SYSTEM_FOREGROUND, 0,
+                                      self._callback, 0, 0, self.WINEVENT_OUTOFCONTEXT)
+        if not hook:
+            print("Foreground hook unavailable, falling back to polling")
+            self.event_driven = False
+            self.hooked.set()
+            return
+        self.hooked.set()
+        msg = wintypes.MSG()
+        while user32.GetMessageW(ctypes.byref(msg), 0, 0, 0) > 0:
+            user32.TranslateMessage(ctypes.byref(msg))
+            user32.DispatchMessageW(ctypes.byref(msg))
+
+    def wait_for_change(self, timeout):
+        changed = self.changed.wait(timeout)
+        self.changed.clear()
+        return changed
+
+
+class ScriptedForegroundSource:
+    """Replays (app name, seconds) steps against the clock, for testing"""
+
+    event_driven = True
+
+    def __init__(self, steps, loop=True, clock=time.monotonic):
+        if not steps:
+            raise ValueError("Scripted foreground source needs at least one step")
+        self.steps = [(app, float(seconds)) for app, seconds in steps]
+        self.loop = loop
+        self.clock = clock
+        self.started = clock()
+        self.cycle = sum(seconds for _, seconds in self.steps)
+
+    @classmethod
+    def from_string(cls, script, **kwargs):
+        """Parse "App.exe:10,Other.exe:5" into steps"""
+        steps = []
+        for part in script.split(","):
+            app, _, seconds = part.strip().rpartition(":")
+            steps.append((app, float(seconds)))
+        return cls(steps, **kwargs)
+
+    def _position(self):
+        """(step index, seconds left in that step); None index once a one-shot script ends"""
+        elapsed = self.clock() - self.started
+        if self.loop and self.cycle > 0:
+            elapsed %= self.cycle
+        for index, (_, seconds) in enumerate(self.steps):
+            if elapsed < seconds:
+                return index, seconds - elapsed
+            elapsed -= seconds
+        return None, None
+
+    def active_app(self):
+        index, _ = self._position()
+        return self.steps[-1 if index is None else index][0]
+
+    def wait_for_change(self, timeout):
+        """Sleep until the next scripted switch, like a foreground notification"""
+        _, remaining = self._position()
+        if remaining is None or remaining > timeout:
+            time.sleep(timeout)
+            return False
+        time.sleep(remaining + 0.001)
+        return True
+
+
+def get_foreground_source():
+    """Source selected by FOREGROUND_SOURCE (default: Win32 foreground events)"""
+    mode = os.environ.get("FOREGROUND_SOURCE")
+    if mode == "scripted":
+        script = os.environ.get("FOREGROUND_SCRIPT", "Code.exe:10,chrome.exe:5")
+        return ScriptedForegroundSource.from_string(script)
+    if mode == "poll" or platform.system() != "Windows":
+        return Win32ForegroundSource()
+    return Win32EventForegroundSource()
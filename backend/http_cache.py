@@ -0,0 +1,125 @@
+"""Conditional GET, gzip and an in-process response cache for read endpoints.
+
+The analytics endpoints are polled far more often than new sessions arrive,
+yet each poll re-ran the query and re-serialized the JSON. cached_endpoint()
+wraps a Flask view with a cheap version function (for example the table's
+MAX(id) plus the model version): the ETag is derived from that version, so a
+client that already has the current data gets a 304 without the view running,
+and other clients are served the stored serialized body from a small LRU.
+Large bodies are gzip-compressed once and reused. X-Cache tells whether the
+body came from the LRU.
+"""
+from collections import OrderedDict
+from datetime import datetime, timezone
+from functools import wraps
+import gzip
+import hashlib
+import threading
+import time
+from flask import Response, request
+
+MIN_GZIP_SIZE = 1024
+
+
+class ResponseCache:
+    """LRU of serialized 200 responses keyed by (path, query, version)"""
+
+    def __init__(self, max_entries=128):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.modified = {}  # version -> (first second it was seen, shares that second with another version)
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+            return entry
+
+    def put(self, key, entry):
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def modified_at(self, version):
+        """(Last-Modified second of version, whether If-Modified-Since at that second is ambiguous)"""
+        with self.lock:
+            if version not in self.modified:
+                if len(self.modified) > self.max_entries:
+                    self.modified.clear()
+                now = int(time.time())
+                shared = any(second == now for second, _ in self.modified.values())
+                self.modified[version] = (now, shared)
+            return self.modified[version]
+
+    def invalidate(self):
+        """Drop every stored response (call after writing new data)"""
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            return {"entries": len(self.entries), "hits": self.hits, "misses": self.misses,
+                    "not_modified": self.not_modified}
+
+
+def cached_endpoint(cache, version_fn):
+    """Decorate a GET view with ETag/Last-Modified validation, LRU caching and gzip"""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            version = str(version_fn())
+            key = (request.path, request.query_string, version)
+            etag = hashlib.sha1(repr(key).encode()).hexdigest()[:20]
+            modified_at, shared_second = cache.modified_at(version)
+
+            # The ETag is exact; If-Modified-Since only has whole seconds, so it cannot
+            # tell this version from an older one first seen in the same second
+            not_modified = False
+            if request.if_none_match:
+                not_modified = request.if_none_match.contains(etag)
+            elif request.if_modified_since:
+                last_modified = datetime.fromtimestamp(modified_at, timezone.utc)
+                not_modified = (request.if_modified_since > last_modified
+                                or request.if_modified_since == last_modified and not shared_second)
+            if not_modified:
+                with cache.lock:
+                    cache.not_modified += 1
+                response = Response(status=304)
+            else:
+                entry = cache.get(key)
+                cache_status = "hit" if entry is not None else "miss"
+                if entry is None:
+                    result = view(*args, **kwargs)
+                    if not isinstance(result, Response) or result.status_code != 200:
+                        return result  # errors are never cached
+                    body = result.get_data()
+                    compressed = gzip.compress(body, 6) if len(body) >= MIN_GZIP_SIZE else None
+                    entry = (body, compressed, result.mimetype)
+                    cache.put(key, entry)
+                body, compressed, mimetype = entry
+
+                # accept_encodings honours q-values, so "gzip;q=0" refuses gzip
+                if compressed is not None and request.accept_encodings["gzip"] > 0:
+                    response = Response(compressed, mimetype=mimetype)
+                    response.headers["Content-Encoding"] = "gzip"
+                else:
+                    response = Response(body, mimetype=mimetype)
+                response.headers["X-Cache"] = cache_status
+
+            response.set_etag(etag)
+            response.last_modified = modified_at
+            response.headers["Cache-Control"] = "no-cache"
+            response.vary.add("Accept-Encoding")
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,73 @@
+"""Import-time budget check for the backend services.
+
+Each service is imported in a fresh interpreter with `python -X importtime`,
+from a scratch working directory and with the fake display, theme and
+foreground backends so nothing touches hardware or the real databases. The
+check fails when a service takes longer than its budget to import, or when
+importing it pulls in one of the heavy modules that providers.py defers.
+
+    python import_budget.py [--budget-ms 600] [--top 8] [service ...]
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+SERVICES = ("app", "theme_app", "fatigue_detection", "app_usage_sql", "fatigue_api", "productivity_api")
+DEFERRED = ("pandas", "sklearn", "cv2", "mediapipe", "screen_brightness_control", "joblib",
+            "win32gui", "win32process", "win32api", "pyarrow", "uvicorn")
+DEFAULT_BUDGET_MS = 600
+
+
+def import_profile(module, workdir):
+    """[(package, self us, cumulative us, depth)] from -X importtime, in import order"""
+    env = dict(os.environ, PYTHONPATH=BACKEND_DIR, DISPLAY_BACKEND="fake", THEME_BACKEND="fake",
+               FOREGROUND_SOURCE="scripted")
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            cwd=workdir, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"importing {module} failed:\n{result.stderr.strip().splitlines()[-1]}")
+
+    entries = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        entries.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return entries
+
+
+def check(module, budget_ms, top, workdir):
+    entries = import_profile(module, workdir)
+    # The service's own imports are the depth-1 lines just before its depth-0 line
+    end = next(index for index, entry in enumerate(entries) if entry[0] == module and entry[3] == 0)
+    total_ms = entries[end][2] / 1000
+    start = end
+    while start > 0 and entries[start - 1][3] > 0:
+        start -= 1
+    direct = sorted((entry for entry in entries[start:end] if entry[3] == 1),
+                    key=lambda entry: entry[2], reverse=True)
+    heavy = sorted({name.split(".")[0] for name, _, _, _ in entries} & set(DEFERRED))
+    ok = total_ms <= budget_ms and not heavy
+
+    print(f"{'OK  ' if ok else 'FAIL'} {module:<20} {total_ms:8.1f} ms (budget {budget_ms:g} ms)")
+    if heavy:
+        print(f"     imports deferred modules: {', '.join(heavy)}")
+    for name, _, cumulative, _ in direct[:top]:
+        print(f"     {cumulative / 1000:8.1f} ms  {name}")
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fail if a service imports slowly or eagerly loads heavy modules")
+    parser.add_argument("services", nargs="*", default=SERVICES)
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS)
+    parser.add_argument("--top", type=int, default=8, help="slowest imports to list per service")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="import_budget_") as workdir:
+        results = [check(module, args.budget_ms, args.top, workdir) for module in args.services]
+    sys.exit(0 if all(results) else 1)
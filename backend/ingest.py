@@ -0,0 +1,314 @@
+"""Bulk ingest of app sessions uploaded by trackers on other machines.
+
+One app_usage service can act as the aggregation server for a fleet: each
+tracker's uploader (uploader.py) POSTs gzip-compressed JSON batches to
+/ingest,
+
+    {"device_id": "...", "seq": 17, "sessions": [{"app": ..., "start_time": ..., ...}, ...]}
+
+with a per-device sequence number. Every accepted (device_id, seq) is kept
+in device_batches; a batch whose seq is already there has been stored and is
+acknowledged without inserting anything, so uploads can be retried safely,
+and batches may arrive in any order. Each batch is stored in a single
+transaction: the sessions (in fleet_sessions, tagged with device_id), its
+device_batches row, the device's totals and highest seq, and the per
+device/day/app totals in session_rollups, which answer fleet-wide usage
+queries without scanning the sessions.
+
+Uploaded sessions never go into app_sessions: that table is this machine's
+own usage, read by the dashboard, the analytics endpoints, the productivity
+model and the fatigue checker. fleet_sessions is left alone by retention,
+and its rollups are never archived.
+
+Bodies are capped at MAX_BATCH_BYTES both as sent and after decompression.
+Sessions are validated before anything is stored. Timestamps may be any ISO
+8601 date and time and are rewritten in the tracker's own format
+(YYYY-MM-DD HH:MM:SS.mmm, the device's wall-clock time; a UTC offset is
+dropped), so hour slicing and string range filters work on every row.
+"""
+from datetime import datetime
+import gzip
+import json
+import math
+import threading
+import zlib
+from metrics import timed_connect
+from timeseries import THEME_CODES
+
+MAX_BATCH_SESSIONS = 10_000
+MAX_BATCH_BYTES = 16 * 1024 * 1024  # as sent and after decompression
+SESSION_FIELDS = ("app", "start_time", "end_time", "duration_seconds", "brightness", "theme_mode", "duration_ms")
+
+
+class IngestError(ValueError):
+    """A batch that can never be accepted; status is the HTTP status to answer with"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def ensure_schema(db):
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS fleet_sessions (
+            id INTEGER PRIMARY KEY,
+            device_id TEXT,
+            app TEXT,
+            start_time TEXT,
+            end_time TEXT,
+            duration_seconds INTEGER,
+            brightness INTEGER,
+            theme_mode TEXT,
+            duration_ms INTEGER
+        )
+    """)
+    db.execute("CREATE INDEX IF NOT EXISTS idx_fleet_sessions_device ON fleet_sessions (device_id, start_time)")
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS devices (
+            device_id TEXT PRIMARY KEY,
+            last_seq INTEGER,
+            first_seen TEXT,
+            last_seen TEXT,
+            batches INTEGER DEFAULT 0,
+            sessions INTEGER DEFAULT 0
+        )
+    """)
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS device_batches (
+            device_id TEXT,
+            seq INTEGER,
+            received_at TEXT,
+            sessions INTEGER,
+            PRIMARY KEY (device_id, seq)
+        ) WITHOUT ROWID
+    """)
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS session_rollups (
+            device_id TEXT,
+            day TEXT,
+            app TEXT,
+            session_count INTEGER,
+            total_seconds INTEGER,
+            brightness_sum INTEGER,
+            brightness_count INTEGER,
+            PRIMARY KEY (device_id, day, app)
+        )
+    """)
+    db.execute("CREATE INDEX IF NOT EXISTS idx_session_rollups_day ON session_rollups (day)")
+    db.commit()
+
+
+def decode_batch(body, content_encoding=None):
+    """Request body (optionally gzip) -> (device_id, seq, list of session row tuples)"""
+    if len(body) > MAX_BATCH_BYTES:
+        raise IngestError(f"batch larger than {MAX_BATCH_BYTES} bytes", 413)
+    if content_encoding == "gzip":
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        try:
+            body = decompressor.decompress(body, MAX_BATCH_BYTES)
+        except zlib.error:
+            raise IngestError("body is not valid gzip")
+        if decompressor.unconsumed_tail:
+            raise IngestError(f"batch larger than {MAX_BATCH_BYTES} bytes", 413)
+    elif content_encoding not in (None, "", "identity"):
+        raise IngestError(f"unsupported Content-Encoding {content_encoding}", 415)
+
+    try:
+        batch = json.loads(body)
+    except ValueError:
+        raise IngestError("body is not valid JSON")
+    if not isinstance(batch, dict):
+        raise IngestError("batch must be a JSON object")
+    device_id = batch.get("device_id")
+    seq = batch.get("seq")
+    sessions = batch.get("sessions")
+    if not isinstance(device_id, str) or not device_id or len(device_id) > 128:
+        raise IngestError("device_id must be a non-empty string")
+    if not isinstance(seq, int) or isinstance(seq, bool) or seq < 1:
+        raise IngestError("seq must be a positive integer")
+    if not isinstance(sessions, list):
+        raise IngestError("sessions must be a list")
+    if len(sessions) > MAX_BATCH_SESSIONS:
+        raise IngestError(f"at most {MAX_BATCH_SESSIONS} sessions per batch", 413)
+    return device_id, seq, [_session_row(index, session) for index, session in enumerate(sessions)]
+
+
+def _session_row(index, session):
+    if not isinstance(session, dict):
+        raise IngestError(f"session {index} must be an object")
+    app, start_time, end_time, seconds, brightness, theme, ms = (session.get(field) for field in SESSION_FIELDS)
+    if not isinstance(app, str) or not app:
+        raise IngestError(f"session {index}: app is required")
+    if start_time is None:
+        raise IngestError(f"session {index}: start_time is required")
+    start_time = _timestamp(index, "start_time", start_time)
+    if end_time is not None:
+        end_time = _timestamp(index, "end_time", end_time)
+    if any(isinstance(value, float) and not math.isfinite(value) for value in (seconds, brightness, ms)):
+        raise IngestError(f"session {index}: durations and brightness must be finite numbers")
+    try:
+        if ms is not None:
+            ms = int(ms)
+        seconds = int(seconds) if seconds is not None else int(round(ms / 1000)) if ms is not None else 0
+        brightness = int(brightness) if brightness is not None else None
+    except (TypeError, ValueError, OverflowError):
+        raise IngestError(f"session {index}: durations and brightness must be numbers")
+    if seconds < 0 or (ms is not None and ms < 0):
+        raise IngestError(f"session {index}: durations cannot be negative")
+    if brightness is not None and not 0 <= brightness <= 100:
+        raise IngestError(f"session {index}: brightness must be between 0 and 100")
+    if theme is not None and (not isinstance(theme, str) or theme not in THEME_CODES):
+        raise IngestError(f"session {index}: theme_mode must be one of {', '.join(THEME_CODES)}")
+    return (app, start_time, end_time, seconds, brightness, theme, ms)
+
+
+def _timestamp(index, field, value):
+    """ISO 8601 date and time -> YYYY-MM-DD HH:MM:SS.mmm, as the tracker writes it"""
+    if not isinstance(value, str) or not ("T" in value or " " in value):
+        raise IngestError(f"session {index}: {field} must be an ISO 8601 date and time")
+    try:
+        moment = datetime.fromisoformat(value)
+    except ValueError:
+        raise IngestError(f"session {index}: {field} must be an ISO 8601 date and time")
+    return moment.strftime("%Y-%m-%d %H:%M:%S") + f".{moment.microsecond // 1000:03d}"
+
+
+def encode_batch(device_id, seq, sessions):
+    """gzip JSON body for /ingest; sessions are dicts with SESSION_FIELDS"""
+    return gzip.compress(json.dumps({"device_id": device_id, "seq": seq, "sessions": sessions}).encode())
+
+
+class IngestStore:
+    """Writes device batches into fleet_sessions and session_rollups"""
+
+    def __init__(self, db_file):
+        self.db_file = db_file
+        self.lock = threading.Lock()  # one writer at a time; SQLite would serialize them anyway
+        db = timed_connect(db_file)
+        try:
+            ensure_schema(db)
+        finally:
+            db.close()
+
+    def ingest(self, device_id, seq, rows):
+        """Store one batch; returns a summary, with duplicate=True if seq was already accepted"""
+        with self.lock:
+            db = timed_connect(self.db_file, timeout=30, isolation_level=None)
+            try:
+                db.execute("BEGIN IMMEDIATE")
+                added = db.execute("""
+                    INSERT OR IGNORE INTO device_batches (device_id, seq, received_at, sessions)
+                    VALUES (?, ?, datetime('now'), ?)
+                """, (device_id, seq, len(rows))).rowcount
+                if not added:
+                    last_seq = db.execute("SELECT last_seq FROM devices WHERE device_id = ?",
+                                          (device_id,)).fetchone()[0]
+                    db.execute("ROLLBACK")
+                    return {"device_id": device_id, "seq": seq, "last_seq": last_seq, "accepted": 0,
+                            "duplicate": True}
+
+                db.executemany("""
+                    INSERT INTO fleet_sessions
+                    (device_id, app, start_time, end_time, duration_seconds, brightness, theme_mode, duration_ms)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """, [(device_id,) + session for session in rows])
+                db.executemany("""
+                    INSERT INTO session_rollups
+                    (device_id, day, app, session_count, total_seconds, brightness_sum, brightness_count)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (device_id, day, app) DO UPDATE SET
+                        session_count = session_count + excluded.session_count,
+                        total_seconds = total_seconds + excluded.total_seconds,
+                        brightness_sum = brightness_sum + excluded.brightness_sum,
+                        brightness_count = brightness_count + excluded.brightness_count
+                """, [(device_id, day, app) + tuple(totals) for (day, app), totals in _rollup(rows).items()])
+                db.execute("""
+                    INSERT INTO devices (device_id, last_seq, first_seen, last_seen, batches, sessions)
+                    VALUES (?, ?, datetime('now'), datetime('now'), 1, ?)
+                    ON CONFLICT (device_id) DO UPDATE SET
+                        last_seq = MAX(last_seq, excluded.last_seq),
+                        last_seen = excluded.last_seen,
+                        batches = batches + 1,
+                        sessions = sessions + excluded.sessions
+                """, (device_id, seq, len(rows)))
+                last_seq = db.execute("SELECT last_seq FROM devices WHERE device_id = ?", (device_id,)).fetchone()[0]
+                db.execute("COMMIT")
+            except Exception:
+                if db.in_transaction:
+                    db.execute("ROLLBACK")
+                raise
+            finally:
+                db.close()
+        return {"device_id": device_id, "seq": seq, "last_seq": last_seq, "accepted": len(rows), "duplicate": False}
+
+    def version(self):
+        """Changes with every accepted batch, for caching /fleet/* responses"""
+        db = timed_connect(self.db_file)
+        try:
+            return db.execute("SELECT COUNT(*), COALESCE(SUM(batches), 0) FROM devices").fetchone()
+        finally:
+            db.close()
+
+    def devices(self):
+        db = timed_connect(self.db_file)
+        try:
+            rows = db.execute("""
+                SELECT device_id, last_seq, first_seen, last_seen, batches, sessions
+                FROM devices ORDER BY last_seen DESC
+            """).fetchall()
+        finally:
+            db.close()
+        return [{
+            "device_id": row[0],
+            "last_seq": row[1],
+            "first_seen": row[2],
+            "last_seen": row[3],
+            "batches": row[4],
+            "sessions": row[5]
+        } for row in rows]
+
+    def usage(self, start=None, end=None, device_id=None):
+        """Per day and app totals across devices (or for one device) from the rollups"""
+        query = " WHERE 1 = 1"
+        params = []
+        if start:
+            query += " AND day >= ?"
+            params.append(start[:10])
+        if end:
+            query += " AND day <= ?"
+            params.append(end[:10])
+        if device_id:
+            query += " AND device_id = ?"
+            params.append(device_id)
+        db = timed_connect(self.db_file)
+        try:
+            rows = db.execute(f"""
+                SELECT day, app, COUNT(DISTINCT device_id), SUM(session_count), SUM(total_seconds),
+                       SUM(brightness_sum), SUM(brightness_count)
+                FROM session_rollups{query}
+                GROUP BY day, app
+                ORDER BY day, SUM(total_seconds) DESC
+            """, params).fetchall()
+        finally:
+            db.close()
+        return [{
+            "date": row[0],
+            "app": row[1],
+            "devices": row[2],
+            "session_count": row[3],
+            "total_minutes": round(row[4] / 60, 1) if row[4] else 0,
+            "avg_brightness": round(row[5] / row[6], 1) if row[6] else "N/A"
+        } for row in rows]
+
+
+def _rollup(rows):
+    """(day, app) -> [sessions, seconds, brightness sum, brightness count] for one batch"""
+    totals = {}
+    for app, start_time, _, seconds, brightness, _, _ in rows:
+        entry = totals.setdefault((start_time[:10], app), [0, 0, 0, 0])
+        entry[0] += 1
+        entry[1] += seconds
+        if brightness is not None:
+            entry[2] += brightness
+            entry[3] += 1
+    return totals
@@ -0,0 +1,114 @@
+"""Cheap ambient luminance estimation from camera frames.
+
+Converting a full BGR frame to grayscale and averaging it touches every pixel
+just to get one number. estimate_luminance() reads a downsampled view instead,
+either a strided slice (no copy) or a cv2.resize INTER_AREA thumbnail, and
+applies the same BT.601 weights as cv2.COLOR_BGR2GRAY. An optional weighting
+(center-weighted or a caller-supplied region mask) lets bright windows at the
+edge of the frame count less than the user's surroundings.
+
+Run `python luminance.py` for a per-sample cost comparison against the
+full-frame path.
+"""
+from functools import lru_cache
+import numpy as np
+from providers import cv2
+
+# cv2.COLOR_BGR2GRAY weights, in BGR channel order
+BGR_LUMA = np.array([0.114, 0.587, 0.299], dtype=np.float32)
+
+DEFAULT_SIZE = (32, 24)
+DEFAULT_STRIDE = 16
+
+
+@lru_cache(maxsize=16)
+def center_weights(height, width, sigma=0.35):
+    """Normalized Gaussian weights peaking at the frame center"""
+    ys = (np.arange(height, dtype=np.float32) + 0.5) / height - 0.5
+    xs = (np.arange(width, dtype=np.float32) + 0.5) / width - 0.5
+    weights = np.exp(-(ys[:, None] ** 2 + xs[None, :] ** 2) / (2 * sigma ** 2))
+    weights /= weights.sum()
+    weights.flags.writeable = False
+    return weights
+
+
+def region_weights(mask, height, width):
+    """Scale a region mask (any size, nonzero = counted) to the sample grid"""
+    mask = np.asarray(mask, dtype=np.float32)
+    if mask.shape != (height, width):
+        mask = cv2.resize(mask, (width, height), interpolation=cv2.INTER_AREA)
+    total = mask.sum()
+    if total <= 0:
+        raise ValueError("Luminance mask selects no pixels")
+    return mask / total
+
+
+def sample_frame(frame, method="stride", size=DEFAULT_SIZE, stride=DEFAULT_STRIDE):
+    """Return a small BGR view of the frame for luminance estimation"""
+    if method == "area":
+        return cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+    if method == "stride":
+        return frame[stride // 2::stride, stride // 2::stride]
+    if method == "full":
+        return frame
+    raise ValueError(f"Unknown sampling method: {method}")
+
+
+def estimate_luminance(frame, method="stride", weighting=None, mask=None,
+                       size=DEFAULT_SIZE, stride=DEFAULT_STRIDE):
+    """Mean gray level (0-255) of a BGR or grayscale frame.
+
+    method: "stride" (every Nth pixel, the cheapest), "area" (INTER_AREA
+    thumbnail, antialiased but reads the whole frame) or "full".
+    weighting: None for a plain mean, "center" for a center-weighted mean.
+    mask: optional region mask; takes precedence over weighting.
+    """
+    sample = sample_frame(frame, method, size, stride)
+    if sample.ndim == 3:
+        gray = sample.reshape(-1, 3).astype(np.float32) @ BGR_LUMA
+        gray = gray.reshape(sample.shape[:2])
+    else:
+        gray = sample.astype(np.float32)
+
+    height, width = gray.shape
+    if mask is not None:
+        return float((gray * region_weights(mask, height, width)).sum())
+    if weighting == "center":
+        return float((gray * center_weights(height, width)).sum())
+    if weighting is not None:
+        raise ValueError(f"Unknown weighting: {weighting}")
+    return float(gray.mean())
+
+
+def full_frame_luminance(frame):
+    """Original path: grayscale conversion of every pixel, then np.mean"""
+    return float(np.mean(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)))
+
+
+if __name__ == "__main__":
+    import time
+
+    rng = np.random.default_rng(0)
+    # Smooth synthetic scene: bright window on the left, darker room, sensor noise
+    height, width = 720, 1280
+    ramp = np.linspace(220, 40, width, dtype=np.float32)[None, :, None]
+    scene = np.broadcast_to(ramp, (height, width, 3)) + rng.normal(0, 12, (height, width, 3))
+    frame = np.clip(scene, 0, 255).astype(np.uint8)
+
+    candidates = [
+        ("full frame (cvtColor + mean)", full_frame_luminance),
+        ("area 32x24", lambda f: estimate_luminance(f, "area")),
+        ("stride 16", lambda f: estimate_luminance(f, "stride")),
+        ("stride 16, center-weighted", lambda f: estimate_luminance(f, "stride", weighting="center")),
+        ("stride 32", lambda f: estimate_luminance(f, "stride", stride=32)),
+    ]
+    reference = full_frame_luminance(frame)
+    runs = 200
+    print(f"{width}x{height} BGR frame, {runs} samples each")
+    for name, fn in candidates:
+        value = fn(frame)
+        start = time.perf_counter()
+        for _ in range(runs):
+            fn(frame)
+        cost = (time.perf_counter() - start) / runs * 1e6
+        print(f"  {name:<30} {cost:9.1f} us/sample   value {value:6.1f}   (full {reference:6.1f})")
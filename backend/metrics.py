@@ -0,0 +1,293 @@
+"""Shared low-overhead instrumentation for the backend services.
+
+Every service calls instrument_app(app, name), which times each request and
+adds two routes:
+  GET  /metrics          Prometheus text exposition of everything below
+  GET  /debug/profile    folded stacks from the sampling profiler
+  POST /debug/profile    {"enabled": true|false, "interval_ms": 10} to toggle it
+
+Hot paths record into the shared histograms with `with timer(HIST, label=...)`
+or @timed(...): route latency, SQLite execute/fetch time (through
+timed_connect), model inference, fatigue frame pipeline stages and FPS, and
+actuator calls (theme, blue light, display brightness). Recording is a
+perf_counter pair, a bisect and a short lock; the profiler costs nothing
+until it is switched on.
+"""
+from bisect import bisect_left
+from collections import Counter
+from contextlib import contextmanager
+from functools import wraps
+import math
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_registry = []
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+class Histogram:
+    """Prometheus-style cumulative histogram with fixed buckets"""
+
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(labels)
+        self.buckets = tuple(buckets)
+        self.series = {}  # label values -> [bucket counts..., sum, count]
+        self.lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.label_names)
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            snapshot = {key: list(series) for key, series in self.series.items()}
+        for key, series in sorted(snapshot.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, ('le', repr(bound)))} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, ('le', '+Inf'))} {series[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, key)} {series[-2]}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, key)} {series[-1]}")
+        return lines
+
+
+class Gauge:
+    """Last-value metric"""
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(labels)
+        self.values = {}
+        self.lock = threading.Lock()
+        _registry.append(self)
+
+    def set(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.label_names)
+        with self.lock:
+            self.values[key] = value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} gauge"]
+        with self.lock:
+            items = sorted(self.values.items())
+        lines.extend(f"{self.name}{_format_labels(self.label_names, key)} {value}" for key, value in items)
+        return lines
+
+
+HTTP_LATENCY = Histogram("http_request_duration_seconds", "Time to produce a response (first byte for streams)",
+                         labels=("route", "method", "status"))
+DB_LATENCY = Histogram("db_query_duration_seconds", "SQLite execute and fetch time", labels=("op",))
+MODEL_LATENCY = Histogram("model_inference_duration_seconds", "Model scoring time per call", labels=("model",))
+FRAME_STAGE_LATENCY = Histogram("frame_stage_duration_seconds", "Camera frame pipeline time per stage",
+                                labels=("stage",))
+FRAME_FPS = Gauge("frame_pipeline_fps", "Smoothed frames per second of the fatigue pipeline")
+ACTUATOR_LATENCY = Histogram("actuator_call_duration_seconds", "Time spent in OS/hardware actuator calls",
+                             labels=("actuator",))
+SERVICE_INFO = Gauge("service_info", "Service identity", labels=("service",))
+
+
+@contextmanager
+def timer(histogram, **labels):
+    """Observe the wall time of a with-block"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram.observe(time.perf_counter() - start, **labels)
+
+
+def timed(histogram, **labels):
+    """Decorator form of timer()"""
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - start, **labels)
+        return wrapper
+    return decorator
+
+
+class TimedCursor(sqlite3.Cursor):
+    """Cursor that records execute and fetch time in DB_LATENCY"""
+
+    def execute(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return super().execute(*args, **kwargs)
+        finally:
+            DB_LATENCY.observe(time.perf_counter() - start, op="execute")
+
+    def executemany(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return super().executemany(*args, **kwargs)
+        finally:
+            DB_LATENCY.observe(time.perf_counter() - start, op="executemany")
+
+    def fetchone(self):
+        start = time.perf_counter()
+        try:
+            return super().fetchone()
+        finally:
+            DB_LATENCY.observe(time.perf_counter() - start, op="fetch")
+
+    def fetchmany(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return super().fetchmany(*args, **kwargs)
+        finally:
+            DB_LATENCY.observe(time.perf_counter() - start, op="fetch")
+
+    def fetchall(self):
+        start = time.perf_counter()
+        try:
+            return super().fetchall()
+        finally:
+            DB_LATENCY.observe(time.perf_counter() - start, op="fetch")
+
+
+class TimedConnection(sqlite3.Connection):
+    """Connection whose cursors (including conn.execute shortcuts) are TimedCursors"""
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+
+def timed_connect(db_file, **kwargs):
+    """sqlite3.connect() with query timing"""
+    return sqlite3.connect(db_file, factory=TimedConnection, **kwargs)
+
+
+def render_metrics():
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+class SamplingProfiler:
+    """Opt-in wall-clock sampler of every thread's stack, reported as folded stacks"""
+
+    def __init__(self, interval=0.01, max_depth=20):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.stacks = Counter()
+        self.samples = 0
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    @property
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self, interval=None):
+        if interval:
+            self.interval = interval
+        if self.running:
+            return
+        with self.lock:
+            self.stacks.clear()
+            self.samples = 0
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self.stop_event.wait(self.interval):
+            folded = []
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < self.max_depth:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                folded.append(";".join(reversed(stack)))
+            with self.lock:
+                self.stacks.update(folded)
+                self.samples += 1
+
+    def report(self, limit=100):
+        with self.lock:
+            lines = [f"# samples={self.samples} interval_ms={self.interval * 1000:g} running={self.running}"]
+            lines.extend(f"{stack} {count}" for stack, count in self.stacks.most_common(limit))
+        return "\n".join(lines) + "\n"
+
+
+profiler = SamplingProfiler()
+
+
+def instrument_app(app, service):
+    """Time every request of a Flask app and add /metrics and /debug/profile"""
+    from flask import Response, g, jsonify, request
+
+    SERVICE_INFO.set(1, service=service)
+
+    @app.before_request
+    def _start_timer():
+        g._metrics_start = time.perf_counter()
+
+    @app.after_request
+    def _record_latency(response):
+        start = getattr(g, "_metrics_start", None)
+        if start is not None:
+            rule = request.url_rule.rule if request.url_rule else "unmatched"
+            HTTP_LATENCY.observe(time.perf_counter() - start, route=rule,
+                                 method=request.method, status=response.status_code)
+        return response
+
+    @app.route("/metrics", methods=["GET"])
+    def metrics():
+        return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
+
+    @app.route("/debug/profile", methods=["GET", "POST"])
+    def debug_profile():
+        if request.method == "POST":
+            data = request.get_json(silent=True) or {}
+            if data.get("enabled"):
+                interval_ms = data.get("interval_ms", profiler.interval * 1000)
+                if isinstance(interval_ms, bool) or not isinstance(interval_ms, (int, float)) \
+                        or not math.isfinite(interval_ms):
+                    return jsonify({"error": "interval_ms must be a number"}), 400
+                profiler.start(max(interval_ms, 1) / 1000)
+            else:
+                profiler.stop()
+            return jsonify({"profiling": bool(data.get("enabled")), "interval_ms": profiler.interval * 1000})
+        return Response(profiler.report(request.args.get("limit", 100, type=int)), mimetype="text/plain")
@@ -0,0 +1,157 @@
+"""Append-only JSON-lines log of theme preference changes.
+
+Every theme or blue-light change used to read the whole preference file,
+append one entry and rewrite it, so each change cost O(history). PreferenceLog
+appends one line per change instead and keeps a small in-memory index (id,
+byte offset, timestamp per entry), so a page of history is read by seeking
+straight to it. The full history is kept, as the JSON array file kept it.
+
+Truncation is opt-in: with max_entries set, every compact_every appends the
+log is checked and, if it holds more than max_entries entries, atomically
+replaced by its newest max_entries entries. Older entries are then gone for
+good, from /get_theme_history and from the file.
+"""
+import bisect
+import json
+import os
+import threading
+
+
+class PreferenceLog:
+    """Append-only preference history with cursor and time-range paging"""
+
+    def __init__(self, path, legacy_path=None, max_entries=None, compact_every=500):
+        self.path = path
+        self.max_entries = max_entries
+        self.compact_every = compact_every
+        self.lock = threading.Lock()
+        self.ids = []
+        self.offsets = []
+        self.timestamps = []
+        self.size = 0
+        self.appends_since_compaction = 0
+
+        if legacy_path and os.path.exists(legacy_path) and not os.path.exists(path):
+            self._migrate(legacy_path)
+        self._load_index()
+
+    def _migrate(self, legacy_path):
+        """One-time conversion of the old JSON array file"""
+        try:
+            with open(legacy_path, "r") as f:
+                data = json.load(f)
+        except Exception:
+            data = []
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for i, entry in enumerate(data, start=1):
+                f.write(json.dumps(dict(entry, id=i)) + "\n")
+        os.replace(tmp_path, self.path)
+        print(f"Migrated {len(data)} preference entries from {legacy_path}")
+
+    def _load_index(self):
+        self.ids, self.offsets, self.timestamps = [], [], []
+        if not os.path.exists(self.path):
+            self.size = 0
+            return
+        offset = 0
+        with open(self.path, "rb") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                    self.ids.append(entry["id"])
+                    self.offsets.append(offset)
+                    self.timestamps.append(entry.get("timestamp", ""))
+                except Exception:
+                    pass  # Skip a torn or corrupt line
+                offset += len(line)
+        self.size = offset
+        # A crash mid-append can leave a partial last line; terminate it
+        if offset and not line.endswith(b"\n"):
+            with open(self.path, "ab") as f:
+                f.write(b"\n")
+            self.size += 1
+
+    def append(self, entry):
+        """Append one entry with a single write and return it with its id"""
+        with self.lock:
+            entry = dict(entry, id=(self.ids[-1] + 1) if self.ids else 1)
+            line = (json.dumps(entry) + "\n").encode("utf-8")
+            with open(self.path, "ab") as f:
+                f.write(line)
+            self.ids.append(entry["id"])
+            self.offsets.append(self.size)
+            self.timestamps.append(entry.get("timestamp", ""))
+            self.size += len(line)
+
+            if self.max_entries is not None:
+                self.appends_since_compaction += 1
+                if self.appends_since_compaction >= self.compact_every:
+                    self._compact()
+            return entry
+
+    def _compact(self):
+        """Atomically drop everything but the newest max_entries entries"""
+        self.appends_since_compaction = 0
+        excess = len(self.ids) - self.max_entries
+        if excess <= 0:
+            return
+        with open(self.path, "rb") as f:
+            f.seek(self.offsets[excess])
+            tail = f.read()
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(tail)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+        shift = self.offsets[excess]
+        self.ids = self.ids[excess:]
+        self.offsets = [offset - shift for offset in self.offsets[excess:]]
+        self.timestamps = self.timestamps[excess:]
+        self.size -= shift
+
+    def page(self, after=None, before=None, start=None, end=None, limit=100, newest_first=False):
+        """Return (entries, next_cursor) for one page of history.
+
+        after/before are entry ids (exclusive); start/end bound the timestamp
+        (a bare YYYY-MM-DD end covers that whole day). next_cursor is the id
+        to pass as after (or before, when newest_first) for the next page.
+        """
+        with self.lock:
+            lo, hi = 0, len(self.ids)
+            if after is not None:
+                lo = max(lo, bisect.bisect_right(self.ids, after))
+            if before is not None:
+                hi = min(hi, bisect.bisect_left(self.ids, before))
+            if start:
+                lo = max(lo, bisect.bisect_left(self.timestamps, start))
+            if end:
+                if len(end) == 10:
+                    end = end + " 99"  # sorts after any time on that day
+                hi = min(hi, bisect.bisect_right(self.timestamps, end))
+            if lo >= hi:
+                return [], None
+
+            if newest_first:
+                first = max(lo, hi - limit)
+                more = first > lo
+            else:
+                first = lo
+                more = hi - lo > limit
+            last = min(hi, first + limit)
+
+            entries = []
+            with open(self.path, "rb") as f:
+                for offset in self.offsets[first:last]:
+                    f.seek(offset)
+                    entries.append(json.loads(f.readline()))
+
+        if newest_first:
+            entries.reverse()
+        next_cursor = entries[-1]["id"] if more else None
+        return entries, next_cursor
+
+    def __len__(self):
+        return len(self.ids)
@@ -1,22 +1,27 @@
 from flask import Flask, jsonify, request
 from flask_cors import CORS
-import sqlite3
-import pandas as pd
-import joblib
-from sklearn.ensemble import RandomForestClassifier
-from sklearn.preprocessing import LabelEncoder
+import numpy as np
 import os
+import threading
 from datetime import datetime, timedelta
+from tree_engine import compile_forest
+from http_cache import ResponseCache, cached_endpoint
+from metrics import instrument_app, timed_connect, timer, MODEL_LATENCY
+from providers import pd, joblib, sklearn_ensemble, sklearn_preprocessing
+from retention import attach_archive, generation
+from columnar import get_session_columns
 
 app = Flask(__name__)
 CORS(app)
+instrument_app(app, "productivity")
 
 DB_FILE = "app_usage.db"
 MODEL_FILE = "productivity_model.pkl"
 META_FILE = "productivity_meta.pkl"
 
 # Connect database
-conn = sqlite3.connect(DB_FILE, check_same_thread=False)
+conn = timed_connect(DB_FILE, check_same_thread=False)
+attach_archive(conn)  # training and past dates read all_sessions, including archived rows
 c = conn.cursor()
 
 
@@ -37,7 +42,7 @@ def train_or_load_model():
         meta = joblib.load(META_FILE)
         last_trained_rows = meta.get("rows", 0)
 
-    df = pd.read_sql_query("SELECT * FROM app_sessions", conn)
+    df = pd.read_sql_query("SELECT * FROM all_sessions", conn)
     row_count = len(df)
 
     if os.path.exists(MODEL_FILE) and row_count < last_trained_rows + 100:
@@ -47,17 +52,18 @@ def train_or_load_model():
     if df.empty:
         raise ValueError("No app usage data available to train")
 
-    df["hour"] = pd.to_datetime(df["start_time"]).dt.hour
+    df["hour"] = df["start_time"].str.slice(11, 13).astype(int)
     df["label"] = df["app"].apply(weak_label)
 
-    le = LabelEncoder()
+    le = sklearn_preprocessing.LabelEncoder()
     df["app_encoded"] = le.fit_transform(df["app"])
 
     X = df[["duration_seconds", "brightness", "hour", "app_encoded"]]
     y = df["label"]
 
-    model = RandomForestClassifier(n_estimators=100, random_state=42)
-    model.fit(X, y)
+    model = sklearn_ensemble.RandomForestClassifier(n_estimators=100, random_state=42)
+    with timer(MODEL_LATENCY, model="productivity_train"):
+        model.fit(X, y)
 
     joblib.dump((model, le), MODEL_FILE)
     joblib.dump({"rows": row_count}, META_FILE)
@@ -65,13 +71,51 @@ def train_or_load_model():
     print(f"📈 Retrained productivity model on {row_count} rows")
     return model, le
 
-model, le_app = train_or_load_model()
+# Trained or loaded on first use (or by the warm-up thread), not at import
+model = le_app = engine = None
+MODEL_VERSION = None  # set once the model is loaded; until then it only tells "not loaded yet"
+model_lock = threading.Lock()
+
+def get_model():
+    """(compiled forest, app label encoder, model version), loading them once"""
+    global model, le_app, engine, MODEL_VERSION
+    with model_lock:
+        if engine is None:
+            model, le_app = train_or_load_model()
+            engine = compile_forest(model)
+            MODEL_VERSION = os.path.getmtime(MODEL_FILE) if os.path.exists(MODEL_FILE) else 0
+        return engine, le_app, MODEL_VERSION
+
+# Serialized read responses, validated against the sessions high-water mark
+response_cache = ResponseCache()
+
+# NumPy columns of every session, live and archived; daily scoring slices them by date
+session_columns = get_session_columns(DB_FILE, "productivity")
+
+def data_version():
+    """MAX(id), today's date, retention generation and model version: changes whenever an answer can.
+
+    Reads MODEL_VERSION without loading the model, so endpoints that never score
+    (e.g. /available_dates) don't wait for training.
+    """
+    db = timed_connect(DB_FILE)
+    try:
+        max_id, today = db.execute("SELECT MAX(id), date('now') FROM app_sessions").fetchone()
+        retention_generation = generation(db)
+    finally:
+        db.close()
+    return max_id, today, retention_generation, MODEL_VERSION
 
 @app.route("/")
 def home():
     return jsonify({"status": "Productivity API running", "port": 5006})
 
+@app.route("/health")
+def health():
+    return jsonify({"status": "healthy", "model_loaded": engine is not None})
+
 @app.route("/predict/productivity/latest", methods=["GET"])
+@cached_endpoint(response_cache, data_version)
 def predict_latest():
     c.execute("""
         SELECT app, duration_seconds, brightness, start_time
@@ -85,21 +129,20 @@ def predict_latest():
 
     app_name, duration_seconds, brightness, start_time = row
     hour = int(start_time[11:13])
+    engine, le_app, _ = get_model()
 
     if app_name in le_app.classes_:
         app_encoded = le_app.transform([app_name])[0]
     else:
         app_encoded = -1
 
-    features = pd.DataFrame([{
-        "duration_seconds": duration_seconds,
-        "brightness": brightness if brightness else 0,
-        "hour": hour,
-        "app_encoded": app_encoded
-    }])
+    # Column order matches training: duration_seconds, brightness, hour, app_encoded
+    features = np.array([[duration_seconds, brightness if brightness else 0, hour, app_encoded]])
 
-    pred = model.predict(features)[0]
-    prob = model.predict_proba(features)[0].tolist()
+    with timer(MODEL_LATENCY, model="productivity"):
+        prob = engine.predict_proba(features)[0]
+    pred = engine.classes_[np.argmax(prob)]
+    prob = prob.tolist()
 
     return jsonify({
         "app": app_name,
@@ -111,50 +154,27 @@ def predict_latest():
     })
 
 @app.route("/predict/productivity/daily", methods=["GET"])
+@cached_endpoint(response_cache, data_version)
 def predict_daily():
     """Daily productivity summary with optional date parameter"""
     date_param = request.args.get('date')
     
-    if date_param:
-        # Filter by specific date
-        query = "SELECT * FROM app_sessions WHERE date(start_time) = ?"
-        df = pd.read_sql_query(query, conn, params=[date_param])
-    else:
-        # Default to today
-        query = "SELECT * FROM app_sessions WHERE date(start_time) = date('now')"
-        df = pd.read_sql_query(query, conn)
+    # Filter by specific date, default to today
+    sessions = session_columns.refresh()
+    day = date_param or sessions.today
+    try:
+        keep = sessions.mask(day, day)
+    except ValueError:
+        keep = np.zeros(sessions.size, dtype=bool)
+    session_count = int(keep.sum())
     
-    if df.empty:
+    if session_count == 0:
         return jsonify({"error": "No app usage data for selected date"})
-
-    df["hour"] = pd.to_datetime(df["start_time"]).dt.hour
     
-    # Predict productivity for each session
-    predictions = []
-    for _, row in df.iterrows():
-        if row["app"] in le_app.classes_:
-            app_encoded = le_app.transform([row["app"]])[0]
-        else:
-            app_encoded = -1
-            
-        features = [[
-            row["duration_seconds"], 
-            row["brightness"] or 0, 
-            row["hour"], 
-            app_encoded
-        ]]
-        
-        pred = model.predict(features)[0]
-        predictions.append({
-            "app": row["app"],
-            "duration_seconds": row["duration_seconds"],
-            "prediction": pred,
-            "productive": pred == 1
-        })
-
-    # Calculate totals
-    productive_seconds = sum(p["duration_seconds"] for p in predictions if p["productive"])
-    distracting_seconds = sum(p["duration_seconds"] for p in predictions if not p["productive"])
+    # Predict productivity for every session in one batch
+    engine, le_app, _ = get_model()
+    app_codes = {app_name: code for code, app_name in enumerate(le_app.classes_)}
+    productive_seconds, distracting_seconds = sessions.productivity_split(engine, app_codes, keep)
     total_seconds = productive_seconds + distracting_seconds
     
     # Calculate percentages
@@ -171,15 +191,16 @@ def predict_daily():
         "productive_seconds": productive_seconds,
         "distracting_seconds": distracting_seconds,
         "total_seconds": total_seconds,
-        "session_count": len(predictions)
+        "session_count": session_count
     })
 
 @app.route("/predict/productivity/available_dates", methods=["GET"])
+@cached_endpoint(response_cache, data_version)
 def get_available_dates():
     """Get list of available dates with productivity data"""
     c.execute("""
         SELECT DISTINCT date(start_time) as usage_date 
-        FROM app_sessions 
+        FROM all_sessions 
         ORDER BY usage_date DESC
         LIMIT 30
     """)
@@ -187,4 +208,6 @@ def get_available_dates():
     return jsonify({"available_dates": dates})
 
 if __name__ == "__main__":
-    app.run(port=5006, debug=True)
\ No newline at end of file
+    # Train or load the model in the background so /health answers as soon as the server is up
+    threading.Thread(target=get_model, daemon=True).start()
+    app.run(port=5006)
\ No newline at end of file
@@ -0,0 +1,52 @@
+"""Heavy third-party modules, imported on first use.
+
+pandas, scikit-learn, OpenCV, MediaPipe, screen_brightness_control and joblib
+take from a tenth of a second to well over a second each to import, and every
+service used to pay for them before it could answer /health. Services import
+the proxies below instead of the real modules: nothing is loaded until an
+attribute is first read (cv2.VideoCapture, pd.read_sql_query, ...), after
+which the proxy simply forwards to the module. win32 modules are already
+imported inside the Windows-only code paths.
+
+import_budget.py checks that importing a service stays under its time budget
+and pulls in none of these.
+"""
+import importlib
+import threading
+
+
+class LazyModule:
+    """Stand-in for a module that imports it on first attribute access.
+
+    Only underscore names live on the proxy itself, so every public attribute
+    (including ones like joblib.load) is forwarded to the real module.
+    """
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+
+    def _import(self):
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    self._module = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._import(), attr)
+
+    def __repr__(self):
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<lazy module {self._name!r} ({state})>"
+
+
+pd = LazyModule("pandas")
+joblib = LazyModule("joblib")
+cv2 = LazyModule("cv2")
+mp = LazyModule("mediapipe")
+sbc = LazyModule("screen_brightness_control")
+sklearn_ensemble = LazyModule("sklearn.ensemble")
+sklearn_preprocessing = LazyModule("sklearn.preprocessing")
+sklearn_naive_bayes = LazyModule("sklearn.naive_bayes")
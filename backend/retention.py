@@ -0,0 +1,300 @@
+"""Compaction and archival of old app sessions.
+
+app_sessions used to grow forever, and a good share of its rows are window
+flickers shorter than MICRO_SESSION_SECONDS. RetentionJob keeps it small:
+
+  * compaction merges consecutive sessions of the same app when one of them is
+    a micro-session and the gap between them is short. Durations are summed,
+    the later brightness and theme reading wins. Only rows from the id saved in
+    retention_state onwards are rescanned.
+  * archival moves sessions that started before the retention horizon into
+    app_sessions in a separate archive database (app_usage_archive.db), in
+    id-range batches, one transaction each.
+
+Every run that merged or archived rows is recorded in retention_runs; its
+MAX(id) is the retention generation, which the services fold into their cache
+versions so ETags and cached snapshots change when rows are merged or moved,
+even when the job runs in another process. Runs that change nothing leave it
+as it is.
+
+Readers that only need recent data keep querying app_sessions. Readers of
+history call attach_archive() on their connection and query the all_sessions
+temp view, which is app_sessions and the archive combined.
+
+    python retention.py [--db app_usage.db] [--archive app_usage_archive.db] [--horizon-days 90] [--vacuum]
+"""
+from datetime import datetime
+import os
+import sqlite3
+import threading
+import time
+from metrics import timed_connect
+
+ARCHIVE_DB_FILE = "app_usage_archive.db"
+DEFAULT_HORIZON_DAYS = int(os.environ.get("RETENTION_DAYS", 90))
+MICRO_SESSION_SECONDS = 10
+MERGE_GAP_SECONDS = 10
+BATCH_SIZE = 5000
+SESSION_COLUMNS = ("id", "app", "start_time", "end_time", "duration_seconds", "brightness", "theme_mode",
+                   "duration_ms")
+# Columns added to app_sessions after it was first created
+ADDED_COLUMNS = (("duration_ms", "INTEGER"),)
+
+
+def ensure_schema(db):
+    """Retention bookkeeping tables, newer app_sessions columns and the start_time index"""
+    existing = [row[1] for row in db.execute("PRAGMA main.table_info(app_sessions)")]
+    for column, column_type in ADDED_COLUMNS:
+        if existing and column not in existing:
+            db.execute(f"ALTER TABLE app_sessions ADD COLUMN {column} {column_type}")
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS retention_runs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            ran_at TEXT,
+            horizon_days INTEGER,
+            merged INTEGER,
+            archived INTEGER
+        )
+    """)
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS retention_state (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            resume_id INTEGER
+        )
+    """)
+    # Databases from before retention_state kept the resume id on every retention_runs row
+    runs = [row[1] for row in db.execute("PRAGMA main.table_info(retention_runs)")]
+    if "resume_id" in runs:
+        db.execute("""
+            INSERT OR IGNORE INTO retention_state (id, resume_id)
+            SELECT 1, COALESCE(MAX(resume_id), 0) FROM retention_runs
+        """)
+    else:
+        db.execute("INSERT OR IGNORE INTO retention_state (id, resume_id) VALUES (1, 0)")
+    db.execute("CREATE INDEX IF NOT EXISTS idx_app_sessions_start ON app_sessions (start_time)")
+    db.commit()
+
+
+def attach_archive(db, archive_file=ARCHIVE_DB_FILE):
+    """Attach the archive database and create the all_sessions view on this connection"""
+    if "archive" not in [row[1] for row in db.execute("PRAGMA database_list")]:
+        db.execute("ATTACH DATABASE ? AS archive", (archive_file,))
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS archive.app_sessions (
+            id INTEGER PRIMARY KEY,
+            app TEXT,
+            start_time TEXT,
+            end_time TEXT,
+            duration_seconds INTEGER,
+            brightness INTEGER,
+            theme_mode TEXT,
+            duration_ms INTEGER
+        )
+    """)
+    archived = [row[1] for row in db.execute("PRAGMA archive.table_info(app_sessions)")]
+    for column, column_type in ADDED_COLUMNS:
+        if column not in archived:
+            db.execute(f"ALTER TABLE archive.app_sessions ADD COLUMN {column} {column_type}")
+    db.execute("CREATE INDEX IF NOT EXISTS archive.idx_archive_start ON app_sessions (start_time)")
+    # A live table from before a column was added reads it as NULL
+    live = [row[1] for row in db.execute("PRAGMA main.table_info(app_sessions)")]
+    live_columns = ", ".join(c if c in live or not live else f"NULL AS {c}" for c in SESSION_COLUMNS)
+    db.execute(f"""
+        CREATE TEMP VIEW IF NOT EXISTS all_sessions AS
+        SELECT {live_columns} FROM main.app_sessions
+        UNION ALL
+        SELECT {", ".join(SESSION_COLUMNS)} FROM archive.app_sessions
+    """)
+    db.commit()
+    return db
+
+
+def generation(db):
+    """Number of the latest retention run, 0 if none has run"""
+    try:
+        return db.execute("SELECT COALESCE(MAX(id), 0) FROM retention_runs").fetchone()[0]
+    except sqlite3.OperationalError:
+        return 0
+
+
+def _parse(timestamp):
+    try:
+        return datetime.fromisoformat(timestamp)
+    except (TypeError, ValueError):
+        return None
+
+
+class _Session:
+    """A session being grown by compaction, with the rows folded into it"""
+
+    __slots__ = ("id", "app", "start", "end", "end_at", "seconds", "ms", "brightness", "theme",
+                 "absorbed", "changed")
+
+    def __init__(self, row):
+        self.id, self.app, self.start, self.end, self.seconds, self.brightness, self.theme, self.ms = row
+        self.end_at = _parse(self.end)
+        self.absorbed = []
+        self.changed = False
+
+    @property
+    def length(self):
+        return self.ms / 1000 if self.ms is not None else (self.seconds or 0)
+
+    def follows(self, other, gap):
+        """True if self starts within `gap` seconds of other's end"""
+        start_at = _parse(self.start)
+        return start_at is not None and other.end_at is not None and \
+            (start_at - other.end_at).total_seconds() <= gap
+
+    def absorb(self, other):
+        self.end, self.end_at = other.end, other.end_at
+        if self.ms is not None or other.ms is not None:
+            self.ms = (self.ms if self.ms is not None else (self.seconds or 0) * 1000) + \
+                (other.ms if other.ms is not None else (other.seconds or 0) * 1000)
+        self.seconds = (self.seconds or 0) + (other.seconds or 0)
+        if other.brightness is not None:
+            self.brightness = other.brightness
+        if other.theme is not None:
+            self.theme = other.theme
+        self.absorbed.append(other.id)
+        self.absorbed.extend(other.absorbed)
+        self.changed = True
+
+
+class RetentionJob:
+    """Merges micro-sessions and moves old sessions to the archive database"""
+
+    def __init__(self, db_file, archive_file=ARCHIVE_DB_FILE, horizon_days=DEFAULT_HORIZON_DAYS,
+                 micro_seconds=MICRO_SESSION_SECONDS, merge_gap=MERGE_GAP_SECONDS):
+        self.db_file = db_file
+        self.archive_file = archive_file
+        self.horizon_days = max(1, int(horizon_days))
+        self.micro_seconds = micro_seconds
+        self.merge_gap = merge_gap
+        self.lock = threading.Lock()
+        self.last_result = None
+
+    def run(self):
+        """Compact, then archive; returns a summary of what changed"""
+        with self.lock:
+            started = time.perf_counter()
+            db = attach_archive(timed_connect(self.db_file, timeout=30), self.archive_file)
+            try:
+                ensure_schema(db)
+                merged, resume_id = self.compact(db)
+                archived = self.archive(db)
+                with db:
+                    db.execute("UPDATE retention_state SET resume_id = ? WHERE id = 1", (resume_id,))
+                    if merged or archived:
+                        db.execute("""
+                            INSERT INTO retention_runs (ran_at, horizon_days, merged, archived)
+                            VALUES (datetime('now'), ?, ?, ?)
+                        """, (self.horizon_days, merged, archived))
+                self.last_result = {
+                    "merged": merged,
+                    "archived": archived,
+                    "horizon_days": self.horizon_days,
+                    "generation": generation(db),
+                    "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)
+                }
+                return self.last_result
+            finally:
+                db.close()
+
+    def _micro(self, session):
+        return session.length < self.micro_seconds
+
+    def compact(self, db):
+        """Merge micro-sessions among rows added since the last run; returns (rows removed, resume id)"""
+        resume_id = db.execute("SELECT resume_id FROM retention_state WHERE id = 1").fetchone()[0]
+        merged = 0
+        head = None  # session being grown
+        last_id = resume_id - 1
+        columns = ", ".join(SESSION_COLUMNS[1:])
+
+        while True:
+            rows = db.execute(f"""
+                SELECT id, {columns} FROM main.app_sessions WHERE id > ? ORDER BY id LIMIT ?
+            """, (last_id, BATCH_SIZE)).fetchall()
+            if not rows:
+                break
+            finished = []
+            for row in rows:
+                session = _Session(row)
+                if head is not None and session.app == head.app and session.follows(head, self.merge_gap) \
+                        and (self._micro(head) or self._micro(session)):
+                    head.absorb(session)
+                    continue
+                if head is not None:
+                    finished.append(head)
+                head = session
+            last_id = rows[-1][0]
+            merged += self._write(db, finished)
+
+        # The last session may still grow; save it and rescan from it next time
+        if head is not None:
+            merged += self._write(db, [head])
+            resume_id = head.id
+        return merged, resume_id
+
+    def _write(self, db, sessions):
+        changed = [session for session in sessions if session.changed]
+        if not changed:
+            return 0
+        with db:
+            db.executemany("""
+                UPDATE main.app_sessions
+                SET end_time = ?, duration_seconds = ?, duration_ms = ?, brightness = ?, theme_mode = ?
+                WHERE id = ?
+            """, [(s.end, s.seconds, s.ms, s.brightness, s.theme, s.id) for s in changed])
+            removed = [(row_id,) for s in changed for row_id in s.absorbed]
+            db.executemany("DELETE FROM main.app_sessions WHERE id = ?", removed)
+        return len(removed)
+
+    def archive(self, db):
+        """Move sessions older than the horizon to the archive, BATCH_SIZE ids per transaction"""
+        cutoff = db.execute("SELECT date('now', ?)", (f"-{self.horizon_days} days",)).fetchone()[0]
+        columns = ", ".join(SESSION_COLUMNS)
+        archived = 0
+        while True:
+            ids = db.execute("""
+                SELECT id FROM main.app_sessions WHERE start_time < ? ORDER BY id LIMIT ?
+            """, (cutoff, BATCH_SIZE)).fetchall()
+            if not ids:
+                break
+            first, last = ids[0][0], ids[-1][0]
+            with db:
+                db.execute(f"""
+                    INSERT OR REPLACE INTO archive.app_sessions ({columns})
+                    SELECT {columns} FROM main.app_sessions WHERE id BETWEEN ? AND ? AND start_time < ?
+                """, (first, last, cutoff))
+                db.execute("DELETE FROM main.app_sessions WHERE id BETWEEN ? AND ? AND start_time < ?",
+                           (first, last, cutoff))
+            archived += len(ids)
+        return archived
+
+
+def vacuum(db_file):
+    """Give the space freed by archival back to the file system (needs no other writers)"""
+    db = sqlite3.connect(db_file)
+    try:
+        db.execute("VACUUM")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Merge micro-sessions and archive old app sessions")
+    parser.add_argument("--db", default="app_usage.db")
+    parser.add_argument("--archive", default=ARCHIVE_DB_FILE)
+    parser.add_argument("--horizon-days", type=int, default=DEFAULT_HORIZON_DAYS)
+    parser.add_argument("--vacuum", action="store_true", help="compact the live database file afterwards")
+    args = parser.parse_args()
+
+    result = RetentionJob(args.db, args.archive, args.horizon_days).run()
+    if args.vacuum:
+        vacuum(args.db)
+    print(json.dumps(result, indent=2))
@@ -0,0 +1,164 @@
+"""Load test for the streaming endpoints: many consumers, constant threads.
+
+Starts a service from a scratch directory with the fake backends (a synthetic
+camera for fatigue_detection, app switches twice a second for the tracker),
+opens hundreds of concurrent /video_feed or /events consumers with asyncio
+sockets and samples the server process's thread count while they read.
+
+With SERVER_MODE=asgi the thread count must not grow with the number of
+consumers, and every consumer must keep receiving frames or events; the
+test fails otherwise. The Flask threaded server is run the same way for
+comparison, where each consumer costs one thread.
+
+    python stream_load.py [--service fatigue_detection|app_usage_sql] [--consumers 300] [--seconds 10] [--modes asgi,flask]
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+# service -> (port, stream path, marker counted per item, request that starts the producer)
+SERVICES = {
+    "fatigue_detection": (5003, "/video_feed", b"--frame\r\n", "/start_detection"),
+    "app_usage_sql": (5004, "/events", b"\nevent: ", None)
+}
+THREAD_SLACK = 2  # pool threads that may still be started lazily; not per consumer
+CONNECT_BATCH = 50
+
+
+def thread_count(pid):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("Threads:"):
+                    return int(line.split()[1])
+    except OSError:
+        import psutil
+        return psutil.Process(pid).num_threads()
+
+
+def start_server(service, mode, workdir):
+    env = dict(os.environ, PYTHONPATH=BACKEND_DIR, SERVER_MODE=mode, DISPLAY_BACKEND="fake", THEME_BACKEND="fake",
+               FOREGROUND_SOURCE="scripted", FOREGROUND_SCRIPT="Code.exe:0.5,chrome.exe:0.5",
+               CAMERA_SOURCE="synthetic", PYTHONWARNINGS="ignore")
+    log = open(os.path.join(workdir, f"{service}_{mode}.log"), "w")
+    process = subprocess.Popen([sys.executable, os.path.join(BACKEND_DIR, f"{service}.py")], cwd=workdir, env=env,
+                               stdout=log, stderr=subprocess.STDOUT)
+    port, _, _, start_path = SERVICES[service]
+    deadline = time.monotonic() + 60
+    while True:
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=1).close()
+            break
+        except OSError:
+            if process.poll() is not None or time.monotonic() > deadline:
+                process.kill()
+                raise RuntimeError(f"{service} ({mode}) did not start, see {log.name}")
+            time.sleep(0.2)
+    if start_path:
+        request = urllib.request.Request(f"http://127.0.0.1:{port}{start_path}", data=b"", method="POST")
+        urllib.request.urlopen(request, timeout=10).close()
+    return process
+
+
+async def consume(port, path, marker, until):
+    """Read one stream until `until`; returns the number of items received"""
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(f"GET {path} HTTP/1.1\r\nHost: 127.0.0.1\r\nConnection: close\r\n\r\n".encode())
+    await writer.drain()
+    items = 0
+    tail = b""
+    try:
+        while True:
+            remaining = until - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                chunk = await asyncio.wait_for(reader.read(65536), remaining)
+            except asyncio.TimeoutError:
+                break
+            if not chunk:
+                break
+            data = tail + chunk
+            items += data.count(marker)
+            tail = data[-(len(marker) - 1):]
+    finally:
+        writer.close()
+    return items
+
+
+async def run_load(pid, port, path, marker, consumers, seconds):
+    """(items per consumer, max thread count seen) with `consumers` concurrent streams"""
+    until = time.monotonic() + seconds
+    samples = []
+
+    async def sample():
+        while time.monotonic() < until:
+            samples.append(thread_count(pid))
+            await asyncio.sleep(0.25)
+
+    sampler = asyncio.ensure_future(sample())
+    tasks = []
+    for start in range(0, consumers, CONNECT_BATCH):
+        tasks.extend(asyncio.ensure_future(consume(port, path, marker, until))
+                     for _ in range(start, min(consumers, start + CONNECT_BATCH)))
+        await asyncio.sleep(0.05)
+    counts = await asyncio.gather(*tasks, return_exceptions=True)
+    await sampler
+    return [count if isinstance(count, int) else 0 for count in counts], max(samples)
+
+
+def run_mode(service, mode, consumers, seconds, workdir):
+    port, path, marker, _ = SERVICES[service]
+    process = start_server(service, mode, workdir)
+    try:
+        time.sleep(1)  # let the producer settle
+        baseline = thread_count(process.pid)
+        counts, peak = asyncio.run(run_load(process.pid, port, path, marker, consumers, seconds))
+        after = thread_count(process.pid)
+    finally:
+        process.terminate()
+        try:
+            process.wait(10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+    return {
+        "mode": mode,
+        "baseline_threads": baseline,
+        "peak_threads": peak,
+        "threads_after": after,
+        "consumers_served": sum(1 for count in counts if count > 0),
+        "min_items": min(counts),
+        "avg_items": sum(counts) / len(counts)
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Many concurrent stream consumers against one service")
+    parser.add_argument("--service", choices=sorted(SERVICES), default="fatigue_detection")
+    parser.add_argument("--consumers", type=int, default=300)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--modes", default="asgi,flask", help="comma separated: asgi, flask")
+    args = parser.parse_args()
+
+    ok = True
+    with tempfile.TemporaryDirectory(prefix="stream_load_") as workdir:
+        for mode in args.modes.split(","):
+            result = run_mode(args.service, mode, args.consumers, args.seconds, workdir)
+            print(f"{args.service} [{mode}] {args.consumers} consumers for {args.seconds:g}s: "
+                  f"threads {result['baseline_threads']} -> peak {result['peak_threads']}, "
+                  f"{result['consumers_served']}/{args.consumers} served, "
+                  f"items per consumer min {result['min_items']} avg {result['avg_items']:.1f}")
+            if mode == "asgi":
+                constant = result["peak_threads"] - result["baseline_threads"] <= THREAD_SLACK
+                served = result["consumers_served"] == args.consumers
+                if not (constant and served):
+                    print(f"FAIL: thread count {'grew' if not constant else 'constant'}, "
+                          f"{args.consumers - result['consumers_served']} consumers got nothing")
+                    ok = False
+    sys.exit(0 if ok else 1)
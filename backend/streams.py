@@ -0,0 +1,104 @@
+"""Fan-out from one producer to any number of long-lived stream consumers.
+
+/video_feed used to run the whole camera pipeline inside each viewer's
+response generator, so every extra viewer meant another capture loop racing
+for the camera and another pinned server thread. Producers now run once, in
+their own thread, and publish into a Broadcast; consumers only follow it:
+
+  * follow() is a blocking generator, for Flask (WSGI) responses;
+  * follow_async() is an async generator, for the asyncio server (asgi.py),
+    where hundreds of consumers share one event loop thread.
+
+Every item gets a sequence number. A Broadcast keeps the last `history`
+items, so a consumer that falls behind skips to what is still kept (one item
+for video frames: always the latest) and an SSE client can resume from its
+Last-Event-ID.
+"""
+import asyncio
+from collections import deque
+import threading
+
+
+class Broadcast:
+    """Latest items of a producer, followed by sync and async consumers"""
+
+    def __init__(self, history=1):
+        self.items = deque(maxlen=history)  # (seq, item)
+        self.seq = 0
+        self.condition = threading.Condition()
+        self.waiters = {}  # event loop -> future resolved by the next publish
+
+    def publish(self, item):
+        with self.condition:
+            self.seq += 1
+            self.items.append((self.seq, item))
+            self.condition.notify_all()
+            loops = list(self.waiters)
+        for loop in loops:
+            try:
+                loop.call_soon_threadsafe(self._wake, loop)
+            except RuntimeError:
+                with self.condition:  # loop closed
+                    self.waiters.pop(loop, None)
+
+    def _wake(self, loop):
+        with self.condition:
+            future = self.waiters.pop(loop, None)
+        if future is not None and not future.done():
+            future.set_result(None)
+
+    def since(self, seq):
+        """([(seq, item)] published after seq that are still kept, latest seq)"""
+        with self.condition:
+            return [entry for entry in self.items if entry[0] > seq], self.seq
+
+    def _start(self, last_seq, latest):
+        with self.condition:
+            if last_seq is not None:
+                if last_seq <= self.seq:
+                    return last_seq
+                # Ahead of us: a sequence number from before a restart; replay what is kept
+                return self.items[0][0] - 1 if self.items else self.seq
+            return self.seq - 1 if latest and self.seq else self.seq
+
+    def follow(self, timeout=None, last_seq=None, latest=False):
+        """Blocking generator of (seq, item); yields None after `timeout` seconds without news.
+
+        Starts after last_seq if given, else with the newest item if latest, else with the next one.
+        """
+        seq = self._start(last_seq, latest)
+        while True:
+            with self.condition:
+                if self.seq <= seq:
+                    self.condition.wait(timeout)
+            entries, seq_now = self.since(seq)
+            if not entries:
+                yield None
+                continue
+            seq = seq_now
+            yield from entries
+
+    async def follow_async(self, timeout=None, last_seq=None, latest=False):
+        """follow() for coroutines: waiting takes no thread, only a future on the running loop"""
+        loop = asyncio.get_running_loop()
+        seq = self._start(last_seq, latest)
+        while True:
+            entries, seq_now = self.since(seq)
+            if not entries:
+                with self.condition:
+                    if self.seq > seq:
+                        future = None  # published since we looked
+                    else:
+                        future = self.waiters.get(loop)
+                        if future is None or future.done():
+                            future = self.waiters[loop] = loop.create_future()
+                if future is not None:
+                    # wait() rather than await: cancelling one consumer must not cancel the shared future
+                    await asyncio.wait({future}, timeout=timeout)
+                entries, seq_now = self.since(seq)
+                if not entries:
+                    yield None
+                    continue
+            seq = seq_now
+            for entry in entries:
+                yield entry
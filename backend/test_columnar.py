@@ -0,0 +1,105 @@
+"""Columnar productivity scoring (SessionView.productivity_split) against the per-row SQL path it replaced.
+
+    python -m pytest test_columnar.py    (or python -m unittest test_columnar)
+"""
+import datetime
+import os
+import sqlite3
+import tempfile
+import unittest
+import warnings
+import joblib
+import numpy as np
+from columnar import SessionColumns
+from retention import RetentionJob, attach_archive
+from tree_engine import compile_forest
+from workload import populate
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+END_DATE = datetime.date(2025, 3, 31)
+
+
+def sql_daily_split(db_file, archive_file, day, model, app_codes):
+    """/predict/productivity/daily as it was: rows from all_sessions, features built one row at a time"""
+    db = attach_archive(sqlite3.connect(db_file), archive_file)
+    try:
+        rows = db.execute("""
+            SELECT app, start_time, duration_seconds, brightness FROM all_sessions
+            WHERE start_time >= ? AND start_time < date(?, '+1 day')
+        """, (day, day)).fetchall()
+    finally:
+        db.close()
+    features = np.array([[
+        duration,
+        brightness if brightness else 0,
+        int(start_time[11:13]),
+        app_codes.get(app, -1)
+    ] for app, start_time, duration, brightness in rows], dtype=np.float64)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        productive = model.predict(features) == 1
+    durations = np.array([row[2] for row in rows])
+    return int(durations[productive].sum()), int(durations[~productive].sum()), len(rows)
+
+
+class ProductivitySplitTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.db_file = os.path.join(cls.tmp.name, "app_usage.db")
+        cls.archive_file = os.path.join(cls.tmp.name, "app_usage_archive.db")
+        populate(cls.db_file, 3000, days=10, end_date=END_DATE)
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")  # model pickled by an older sklearn
+            cls.model, le_app = joblib.load(os.path.join(HERE, "productivity_model.pkl"))
+        cls.app_codes = {app: code for code, app in enumerate(le_app.classes_)}
+        cls.engine = compile_forest(cls.model)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp.cleanup()
+
+    def assertMatchesSql(self, day):
+        view = SessionColumns(self.db_file, self.archive_file).refresh()
+        keep = view.mask(day, day)
+        expected = sql_daily_split(self.db_file, self.archive_file, day, self.model, self.app_codes)
+        self.assertGreater(expected[2], 0)
+        self.assertEqual(view.productivity_split(self.engine, self.app_codes, keep) + (int(keep.sum()),), expected)
+
+    def test_workload_has_null_brightness(self):
+        db = sqlite3.connect(self.db_file)
+        try:
+            nulls = db.execute("SELECT COUNT(*) FROM app_sessions WHERE brightness IS NULL").fetchone()[0]
+        finally:
+            db.close()
+        self.assertGreater(nulls, 0)
+
+    def test_every_day_matches_sql(self):
+        for offset in range(10):
+            with self.subTest(offset=offset):
+                self.assertMatchesSql(str(END_DATE - datetime.timedelta(days=offset)))
+
+    def test_null_brightness_scores_as_zero(self):
+        view = SessionColumns(self.db_file, self.archive_file).refresh()
+        keep = view.mask(str(END_DATE), str(END_DATE))
+        features = view.productivity_features(keep, self.app_codes)
+        self.assertTrue(np.isnan(view.brightness[keep]).any())
+        self.assertFalse(np.isnan(features).any())
+        self.assertTrue((features[np.isnan(view.brightness[keep]), 1] == 0).all())
+
+    def test_archived_days_match_sql(self):
+        # A copy of the data, so the other tests keep reading live rows
+        db_file = os.path.join(self.tmp.name, "archived.db")
+        archive_file = os.path.join(self.tmp.name, "archived_archive.db")
+        populate(db_file, 3000, days=10, end_date=END_DATE)
+        RetentionJob(db_file, archive_file, horizon_days=1, micro_seconds=0).run()
+        view = SessionColumns(db_file, archive_file).refresh()
+        day = str(END_DATE)
+        keep = view.mask(day, day)
+        self.assertEqual(view.productivity_split(self.engine, self.app_codes, keep) + (int(keep.sum()),),
+                         sql_daily_split(db_file, archive_file, day, self.model, self.app_codes))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,127 @@
+"""Validation of uploaded session batches (ingest.decode_batch) and their storage (ingest.IngestStore).
+
+    python -m pytest test_ingest.py    (or python -m unittest test_ingest)
+"""
+import gzip
+import json
+import os
+import tempfile
+import unittest
+from ingest import decode_batch, encode_batch, IngestError, IngestStore, MAX_BATCH_BYTES
+
+VALID = {"app": "Code.exe", "start_time": "2025-01-01 10:00:00.250", "end_time": "2025-01-01 10:05:00.250",
+         "duration_seconds": 300, "brightness": 60, "theme_mode": "Dark", "duration_ms": 300000}
+
+
+def batch(**overrides):
+    return json.dumps({"device_id": "laptop-1", "seq": 1, "sessions": [dict(VALID, **overrides)]}).encode()
+
+
+class DecodeBatchTest(unittest.TestCase):
+
+    def assertRejected(self, **overrides):
+        with self.assertRaises(IngestError) as caught:
+            decode_batch(batch(**overrides))
+        self.assertEqual(caught.exception.status, 400)
+
+    def test_valid_session_is_kept_as_is(self):
+        device_id, seq, rows = decode_batch(encode_batch("laptop-1", 1, [VALID]), "gzip")
+        self.assertEqual((device_id, seq), ("laptop-1", 1))
+        self.assertEqual(rows, [("Code.exe", "2025-01-01 10:00:00.250", "2025-01-01 10:05:00.250", 300, 60, "Dark",
+                                 300000)])
+
+    def test_iso_timestamps_are_rewritten_in_tracker_format(self):
+        _, _, rows = decode_batch(batch(start_time="2025-01-01T10:00:00Z", end_time="2025-01-01T10:05:00.5+02:00"))
+        self.assertEqual(rows[0][1:3], ("2025-01-01 10:00:00.000", "2025-01-01 10:05:00.500"))
+
+    def test_optional_fields_may_be_missing(self):
+        _, _, rows = decode_batch(batch(end_time=None, brightness=None, theme_mode=None, duration_ms=None))
+        self.assertEqual(rows[0], ("Code.exe", "2025-01-01 10:00:00.250", None, 300, None, None, None))
+
+    def test_rejects_missing_start_time(self):
+        self.assertRejected(start_time=None)
+
+    def test_rejects_date_only_start_time(self):
+        self.assertRejected(start_time="2025-01-01")
+
+    def test_rejects_unparsable_start_time(self):
+        self.assertRejected(start_time="yesterday at noon")
+
+    def test_rejects_non_string_start_time(self):
+        self.assertRejected(start_time=1735725600)
+
+    def test_rejects_unparsable_end_time(self):
+        self.assertRejected(end_time="2025-13-01 10:00:00")
+
+    def test_rejects_negative_duration_seconds(self):
+        self.assertRejected(duration_seconds=-50)
+
+    def test_rejects_negative_duration_ms(self):
+        self.assertRejected(duration_ms=-1)
+
+    def test_rejects_non_numeric_duration(self):
+        self.assertRejected(duration_seconds="long")
+
+    def test_rejects_brightness_above_100(self):
+        self.assertRejected(brightness=101)
+
+    def test_rejects_negative_brightness(self):
+        self.assertRejected(brightness=-1)
+
+    def test_rejects_unknown_theme(self):
+        self.assertRejected(theme_mode="Sepia")
+
+    def test_rejects_non_string_theme(self):
+        self.assertRejected(theme_mode=["Dark"])
+
+    def test_rejects_missing_app(self):
+        self.assertRejected(app="")
+
+    def test_rejects_infinite_duration(self):
+        self.assertRejected(duration_seconds=float("inf"))
+
+    def test_rejects_nan_brightness(self):
+        self.assertRejected(brightness=float("nan"))
+
+    def test_rejects_overflowing_duration_ms(self):
+        self.assertRejected(duration_ms=1e400)  # serialized as Infinity
+
+    def test_rejects_oversized_compressed_body(self):
+        with self.assertRaises(IngestError) as caught:
+            decode_batch(b"\0" * (MAX_BATCH_BYTES + 1), "gzip")
+        self.assertEqual(caught.exception.status, 413)
+
+    def test_rejects_body_that_decompresses_too_large(self):
+        body = gzip.compress(b" " * (MAX_BATCH_BYTES + 1))
+        with self.assertRaises(IngestError) as caught:
+            decode_batch(body, "gzip")
+        self.assertEqual(caught.exception.status, 413)
+
+
+class IngestStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = IngestStore(os.path.join(self.tmp.name, "fleet.db"))
+        self.row = decode_batch(batch())[2][0]
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_retried_batch_is_stored_once(self):
+        self.assertEqual(self.store.ingest("laptop-1", 1, [self.row])["accepted"], 1)
+        result = self.store.ingest("laptop-1", 1, [self.row])
+        self.assertTrue(result["duplicate"])
+        self.assertEqual(self.store.devices()[0]["sessions"], 1)
+
+    def test_batches_arriving_out_of_order_are_all_stored(self):
+        for seq in (3, 1, 2):
+            result = self.store.ingest("laptop-1", seq, [self.row])
+            self.assertFalse(result["duplicate"])
+            self.assertEqual(result["last_seq"], 3)
+        device = self.store.devices()[0]
+        self.assertEqual((device["batches"], device["sessions"], device["last_seq"]), (3, 3, 3))
+
+
+if __name__ == "__main__":
+    unittest.main()
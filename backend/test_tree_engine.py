@@ -0,0 +1,89 @@
+"""Parity of the compiled forests (tree_engine) with sklearn on the bundled models.
+
+    python -m pytest test_tree_engine.py    (or python -m unittest test_tree_engine)
+"""
+import os
+import tempfile
+import unittest
+import warnings
+import joblib
+import numpy as np
+from tree_engine import BATCH_ROWS, CompiledForest, compile_forest, sample_inputs
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BRIGHTNESS = 1  # brightness is the second feature of both models
+
+
+def load(name):
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")  # models pickled by an older sklearn
+        return joblib.load(os.path.join(HERE, name))
+
+
+class ForestParityTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.fatigue_model = load("fatigue_model.pkl")
+        cls.productivity_model, le_app = load("productivity_model.pkl")
+        cls.X_fatigue, cls.X_productivity = sample_inputs(600, len(le_app.classes_))
+
+    def assertParity(self, model, X):
+        engine = compile_forest(model)
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            expected = model.predict_proba(X)
+            labels = model.predict(X)
+        np.testing.assert_array_equal(engine.compiled_proba(X), expected)
+        np.testing.assert_array_equal(engine.predict(X), labels)
+        np.testing.assert_array_equal(engine.predict(X[:1]), labels[:1])
+
+    @staticmethod
+    def with_null_brightness(X):
+        """Every third row with NaN brightness, as a NULL column reaches the models"""
+        X = X.copy()
+        X[::3, BRIGHTNESS] = np.nan
+        return X
+
+    def test_fatigue_model(self):
+        self.assertParity(self.fatigue_model, self.X_fatigue)
+
+    def test_productivity_model(self):
+        self.assertParity(self.productivity_model, self.X_productivity)
+
+    def test_fatigue_model_with_null_brightness(self):
+        self.assertParity(self.fatigue_model, self.with_null_brightness(self.X_fatigue))
+
+    def test_productivity_model_with_null_brightness(self):
+        self.assertParity(self.productivity_model, self.with_null_brightness(self.X_productivity))
+
+    def test_null_and_zero_brightness_are_distinct_inputs(self):
+        """NaN follows each split's missing-value branch rather than being read as 0"""
+        engine = compile_forest(self.fatigue_model)
+        X = self.with_null_brightness(self.X_fatigue)
+        zeroed = np.nan_to_num(X, nan=0.0)
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            np.testing.assert_array_equal(engine.compiled_proba(zeroed), self.fatigue_model.predict_proba(zeroed))
+        self.assertFalse(np.array_equal(engine.compiled_proba(X), engine.compiled_proba(zeroed)))
+
+    def test_large_batches_use_the_fitted_forest(self):
+        engine = compile_forest(self.fatigue_model)
+        X = np.tile(self.with_null_brightness(self.X_fatigue), (BATCH_ROWS // len(self.X_fatigue) + 1, 1))
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            expected = self.fatigue_model.predict_proba(X)
+        np.testing.assert_array_equal(engine.predict_proba(X), expected)
+
+    def test_saved_forest_scores_the_same(self):
+        engine = compile_forest(self.productivity_model)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "productivity.npz")
+            engine.save(path)
+            loaded = CompiledForest.load(path)
+        X = self.with_null_brightness(self.X_productivity)
+        np.testing.assert_array_equal(loaded.compiled_proba(X), engine.compiled_proba(X))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -4,33 +4,32 @@ from flask_cors import CORS
 import platform
 import subprocess
 import sys
-import screen_brightness_control as sbc
+import threading
+from display_manager import get_display_manager
+from actuator import ThemeActuator, FakeThemeBackend
+from pref_log import PreferenceLog
+from metrics import instrument_app
 
 app = Flask(__name__)
 CORS(app)  
+instrument_app(app, "theme")
 
 # Default settings
 current_theme = "Dark"
 blue_light_level = 20
 schedule_active = False
 schedule_settings = {"start": "06:00", "end": "16:00", "theme": "Light"}
-PREF_FILE = "user_prefs.json"
+schedule_rules = [(360, 960, "Light")]  # (start minute, end minute, theme), parsed once
+schedule_default_theme = "Dark"
+next_transition = None
+schedule_wakeup = threading.Event()
+MAX_SCHEDULE_SLEEP = 900  # re-check at least this often (clock changes, suspend)
+PREF_FILE = "user_prefs.jsonl"
+LEGACY_PREF_FILE = "user_prefs.json"
+HISTORY_PAGE_LIMIT = 500
 
-def apply_theme_system_changes(theme, blue_light):
-    """Apply actual system changes for theme and blue light filter"""
-    print(f"Applying system changes: Theme={theme}, Blue Light={blue_light}%")
-    
-    try:
-        # 1. Apply blue light filter (adjust screen temperature)
-        apply_blue_light_filter(blue_light)
-        
-        # 2. Apply theme (dark/light mode) - this is OS specific
-        apply_system_theme(theme)
-        
-        return True
-    except Exception as e:
-        print(f"Error applying system changes: {e}")
-        return False
+# Append-only preference history (migrates the old JSON array file once)
+pref_log = PreferenceLog(PREF_FILE, legacy_path=LEGACY_PREF_FILE)
 
 def apply_blue_light_filter(level):
     """Apply blue light filter by adjusting screen color temperature"""
@@ -61,10 +60,15 @@ def apply_blue_light_filter(level):
 def adjust_windows_color_temperature(warmth):
     """Adjust color temperature on Windows"""
     try:
-        # Adjust brightness as a proxy for color temperature (warmer = slightly dimmer)
-        current_brightness = sbc.get_brightness()[0]
-        adjusted_brightness = max(10, current_brightness - (warmth / 10))
-        sbc.set_brightness(int(adjusted_brightness))
+        # Adjust brightness as a proxy for color temperature (warmer = slightly dimmer),
+        # reading and writing every display (by its unique key) in one concurrent round
+        manager = get_display_manager()
+        targets = {
+            key: int(max(10, current_brightness - (warmth / 10)))
+            for key, current_brightness in manager.get_brightness().items()
+            if current_brightness is not None
+        }
+        manager.set_brightness(targets)
         
     except Exception as e:
         print(f"Windows color adjustment error: {e}")
@@ -124,16 +128,23 @@ def apply_system_theme(theme):
         print(f"Theme application error: {e}")
         return False
 
+class SystemThemeBackend:
+    """Actuator backend that applies changes to the running OS"""
+
+    def apply_theme(self, theme):
+        return apply_system_theme(theme)
+
+    def apply_blue_light(self, level):
+        return apply_blue_light_filter(level)
+
+# THEME_BACKEND=fake records changes instead of applying them (headless testing)
+if os.environ.get("THEME_BACKEND") == "fake":
+    actuator = ThemeActuator(FakeThemeBackend())
+else:
+    actuator = ThemeActuator(SystemThemeBackend())
+
 def save_preference(theme, blue_light=None):
     """Save theme preference with timestamp"""
-    data = []
-    if os.path.exists(PREF_FILE):
-        try:
-            with open(PREF_FILE, "r") as f:
-                data = json.load(f)
-        except:
-            data = []
-    
     entry = {
         "theme": theme, 
         "timestamp": str(datetime.datetime.now())
@@ -141,10 +152,11 @@ def save_preference(theme, blue_light=None):
     if blue_light is not None:
         entry["blue_light"] = blue_light
         
-    data.append(entry)
-    
-    with open(PREF_FILE, "w") as f:
-        json.dump(data, f, indent=2)
+    return pref_log.append(entry)
+
+@app.route("/health")
+def health():
+    return jsonify({"status": "healthy"})
 
 @app.route("/set_manual_theme", methods=["POST"])
 def set_manual_theme():
@@ -159,15 +171,16 @@ def set_manual_theme():
             current_theme = theme
             blue_light_level = blue_light
             
-            # Apply system changes
-            success = apply_theme_system_changes(current_theme, blue_light_level)
+            # Queue system changes; the actuator applies them in the background
+            state = actuator.request(current_theme, blue_light_level)
             save_preference(current_theme, blue_light_level)
             
             return jsonify({
                 "mode": "manual", 
                 "theme": current_theme,
                 "blue_light": blue_light_level,
-                "applied": success
+                "status": state["status"],
+                "request_id": state["requested_version"]
             })
         return jsonify({"error": "Invalid parameters"}), 400
         
@@ -184,44 +197,111 @@ def set_blue_light():
         
         if 0 <= blue_light <= 100:
             blue_light_level = blue_light
-            success = apply_blue_light_filter(blue_light_level)
+            state = actuator.request(blue_light=blue_light_level)
             save_preference(current_theme, blue_light_level)
             
             return jsonify({
                 "blue_light": blue_light_level,
                 "theme": current_theme,
-                "applied": success
+                "status": state["status"],
+                "request_id": state["requested_version"]
             })
         return jsonify({"error": "Blue light level must be 0-100"}), 400
         
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+def parse_hhmm(value):
+    """Parse 'HH:MM' into minutes after midnight"""
+    if not isinstance(value, str) or len(value) != 5 or value[2] != ":":
+        raise ValueError(f"Invalid time: {value}")
+    hours, minutes = int(value[:2]), int(value[3:])
+    if not (0 <= hours < 24 and 0 <= minutes < 60):
+        raise ValueError(f"Invalid time: {value}")
+    return hours * 60 + minutes
+
+def opposite_theme(theme):
+    return "Dark" if theme == "Light" else "Light"
+
+def scheduled_theme_at(minute):
+    """Theme the schedule wants at a given minute of the day"""
+    for start, end, theme in schedule_rules:
+        if start <= end:
+            inside = start <= minute < end
+        else:
+            # Window crosses midnight, e.g. 22:00 -> 06:00
+            inside = minute >= start or minute < end
+        if inside:
+            return theme
+    return schedule_default_theme
+
+def next_transition_after(now):
+    """Datetime of the next rule boundary strictly after now"""
+    boundaries = sorted({minute for start, end, _ in schedule_rules for minute in (start, end)})
+    now_minute = now.hour * 60 + now.minute
+    midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    for minute in boundaries:
+        if minute > now_minute:
+            return midnight + datetime.timedelta(minutes=minute)
+    return midnight + datetime.timedelta(days=1, minutes=boundaries[0])
+
+def schedule_loop():
+    """Background scheduler: sleeps until the next transition, then applies it"""
+    global next_transition
+    while True:
+        schedule_wakeup.clear()
+        if not schedule_active:
+            next_transition = None
+            schedule_wakeup.wait()
+            continue
+
+        check_and_apply_schedule()
+        now = datetime.datetime.now()
+        next_transition = next_transition_after(now)
+        delay = (next_transition - now).total_seconds()
+        schedule_wakeup.wait(min(max(delay, 0), MAX_SCHEDULE_SLEEP))
+
 @app.route("/set_schedule", methods=["POST"])
 def set_schedule():
-    """Set and activate schedule"""
-    global schedule_active, schedule_settings
+    """Set and activate schedule.
+
+    Accepts a single window ({start, end, theme}) or several
+    ({rules: [{start, end, theme}, ...], default_theme}); windows may cross
+    midnight. Outside every window the default theme applies, which for a
+    single window is the opposite of its theme.
+    """
+    global schedule_active, schedule_settings, schedule_rules, schedule_default_theme
     try:
         data = request.get_json()
         if not data:
             return jsonify({"error": "No JSON data provided"}), 400
-            
-        schedule_settings = {
+
+        raw_rules = data.get("rules") or [{
             "start": data.get("start", "06:00"),
             "end": data.get("end", "16:00"), 
             "theme": data.get("theme", "Light")
-        }
-        schedule_active = True
+        }]
         
-        # Validate time format
+        # Validate and parse once; the scheduler never re-parses
         try:
-            datetime.datetime.strptime(schedule_settings["start"], "%H:%M")
-            datetime.datetime.strptime(schedule_settings["end"], "%H:%M")
-        except ValueError:
+            rules = [(parse_hhmm(rule["start"]), parse_hhmm(rule["end"]), rule.get("theme", "Light"))
+                     for rule in raw_rules]
+        except (KeyError, TypeError, ValueError):
             return jsonify({"error": "Invalid time format. Use HH:MM"}), 400
+        if any(theme not in ["Light", "Dark"] for _, _, theme in rules):
+            return jsonify({"error": "Theme must be Light or Dark"}), 400
+        default_theme = data.get("default_theme", opposite_theme(rules[0][2]))
+        if default_theme not in ["Light", "Dark"]:
+            return jsonify({"error": "Theme must be Light or Dark"}), 400
+
+        schedule_settings = dict(raw_rules[0], rules=raw_rules, default_theme=default_theme)
+        schedule_rules = rules
+        schedule_default_theme = default_theme
+        schedule_active = True
         
-        # Apply schedule immediately
+        # Apply schedule immediately, then let the scheduler plan the next transition
         success = check_and_apply_schedule()
+        schedule_wakeup.set()
         
         return jsonify({
             "status": "schedule_set", 
@@ -238,6 +318,7 @@ def disable_schedule():
     global schedule_active
     try:
         schedule_active = False
+        schedule_wakeup.set()
         return jsonify({"status": "schedule_disabled"})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -251,29 +332,20 @@ def check_and_apply_schedule():
     
     try:
         now = datetime.datetime.now()
-        current_time = now.time()
-        
-        start_time = datetime.datetime.strptime(schedule_settings["start"], "%H:%M").time()
-        end_time = datetime.datetime.strptime(schedule_settings["end"], "%H:%M").time()
-        
-        if start_time <= current_time <= end_time:
-            new_theme = schedule_settings["theme"]
-        else:
-            new_theme = "Dark" if schedule_settings["theme"] == "Light" else "Light"
-        
+        new_theme = scheduled_theme_at(now.hour * 60 + now.minute)
         
         if new_theme != current_theme:
             current_theme = new_theme
-            success = apply_theme_system_changes(current_theme, blue_light_level)
+            actuator.request(current_theme, blue_light_level)
             save_preference(current_theme, blue_light_level)
-            return success
-        else:
-            return True  
+        return True
             
     except Exception as e:
         print(f"Schedule check error: {e}")
         return False
 
+threading.Thread(target=schedule_loop, daemon=True).start()
+
 @app.route("/scheduled_theme", methods=["GET"])
 def scheduled_theme():
     """Check and apply scheduled theme"""
@@ -286,6 +358,7 @@ def scheduled_theme():
             "hour": datetime.datetime.now().hour,
             "schedule_active": schedule_active,
             "schedule": schedule_settings,
+            "next_transition": str(next_transition) if next_transition else None,
             "applied": success
         })
         
@@ -299,6 +372,7 @@ def get_schedule_status():
         return jsonify({
             "schedule_active": schedule_active,
             "schedule_settings": schedule_settings,
+            "next_transition": str(next_transition) if next_transition else None,
             "current_theme": current_theme,
             "blue_light_level": blue_light_level
         })
@@ -307,16 +381,27 @@ def get_schedule_status():
 
 @app.route("/get_theme_history", methods=["GET"])
 def get_theme_history():
-    """Return all past theme choices with timestamps."""
+    """Return past theme choices with timestamps, one page at a time.
+
+    Query params: cursor (id from next_cursor), start/end (timestamp or date),
+    limit (default 100, max 500) and order=desc for newest first.
+    """
     try:
-        if os.path.exists(PREF_FILE):
-            with open(PREF_FILE, "r") as f:
-                try:
-                    data = json.load(f)
-                    return jsonify({"history": data})
-                except:
-                    return jsonify({"error": "Failed to read preferences"}), 500
-        return jsonify({"history": []})
+        cursor = request.args.get("cursor", type=int)
+        limit = min(request.args.get("limit", 100, type=int), HISTORY_PAGE_LIMIT)
+        newest_first = request.args.get("order") == "desc"
+        if limit < 1:
+            return jsonify({"error": "limit must be positive"}), 400
+
+        history, next_cursor = pref_log.page(
+            after=None if newest_first else cursor,
+            before=cursor if newest_first else None,
+            start=request.args.get("start"),
+            end=request.args.get("end"),
+            limit=limit,
+            newest_first=newest_first
+        )
+        return jsonify({"history": history, "next_cursor": next_cursor, "total": len(pref_log)})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -333,6 +418,18 @@ def get_current_theme():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route("/actuator_status", methods=["GET"])
+def actuator_status():
+    """Whether queued theme/blue light changes have reached the system yet.
+
+    A change with request_id n is done once applied_version >= n; status then
+    says whether it was applied or failed.
+    """
+    try:
+        return jsonify(actuator.status())
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
 @app.route("/")
 def home():
     """Home endpoint to check if server is running."""
@@ -347,9 +444,10 @@ def home():
             "/scheduled_theme": "GET - Get scheduled theme",
             "/get_schedule_status": "GET - Get schedule status",
             "/get_theme_history": "GET - Get theme history",
-            "/get_current_theme": "GET - Get current theme"
+            "/get_current_theme": "GET - Get current theme",
+            "/actuator_status": "GET - Get pending/applied state of system changes"
         }
     })
 
 if __name__ == "__main__":
-    app.run(port=5002, debug=True)
\ No newline at end of file
+    app.run(port=5002)
\ No newline at end of file
@@ -0,0 +1,157 @@
+"""Compact time-series store for periodic brightness and theme samples.
+
+app_sessions only keeps one brightness/theme value per session, taken when the
+session ends. SampleStore records a sample every few seconds instead and packs
+them into blocks in the sample_blocks table: each block stores its first epoch
+once, then three bytes per sample, namely the seconds since the previous sample
+(delta encoded), brightness 0-100 (255 = unknown) and a theme code. Samples
+are buffered in memory and written one block per transaction. Blocks older
+than the retention window (SAMPLE_RETENTION_DAYS, 30 days by default) are
+deleted at most once per PRUNE_INTERVAL, on a flush.
+"""
+import os
+import threading
+import time
+import numpy as np
+from metrics import timed_connect
+
+THEME_CODES = {"Unknown": 0, "Light": 1, "Dark": 2}
+THEME_NAMES = {code: name for name, code in THEME_CODES.items()}
+UNKNOWN_BRIGHTNESS = 255
+MAX_DELTA = 255  # a longer gap between samples starts a new block
+RETENTION_DAYS = int(os.environ.get("SAMPLE_RETENTION_DAYS", 30))
+PRUNE_INTERVAL = 3600
+
+
+class SampleStore:
+    """Buffered, delta-encoded brightness/theme samples in SQLite"""
+
+    def __init__(self, db_file, flush_every=20, retention_days=RETENTION_DAYS):
+        self.db_file = db_file
+        self.flush_every = flush_every
+        self.retention_seconds = retention_days * 86400
+        self.last_prune = 0.0
+        self.lock = threading.Lock()
+        self.buffer = []  # (epoch, brightness code, theme code)
+        db = timed_connect(db_file)
+        try:
+            with db:
+                db.execute("""
+                    CREATE TABLE IF NOT EXISTS sample_blocks (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        start_epoch INTEGER,
+                        end_epoch INTEGER,
+                        sample_count INTEGER,
+                        payload BLOB
+                    )
+                """)
+                db.execute("CREATE INDEX IF NOT EXISTS idx_sample_blocks_end ON sample_blocks (end_epoch)")
+        finally:
+            db.close()
+
+    def record(self, epoch, brightness, theme):
+        """Buffer one sample; flushes a block every flush_every samples"""
+        brightness_code = UNKNOWN_BRIGHTNESS if brightness is None else int(max(0, min(100, brightness)))
+        theme_code = THEME_CODES.get(theme, 0)
+        with self.lock:
+            epoch = int(epoch)
+            if self.buffer and epoch < self.buffer[-1][0]:
+                epoch = self.buffer[-1][0]  # clock stepped back; keep the series monotonic
+            self.buffer.append((epoch, brightness_code, theme_code))
+            if len(self.buffer) >= self.flush_every:
+                self._flush()
+
+    def flush(self):
+        with self.lock:
+            self._flush()
+
+    def _flush(self):
+        if not self.buffer:
+            return
+        blocks = []
+        block = [self.buffer[0]]
+        for sample in self.buffer[1:]:
+            if sample[0] - block[-1][0] > MAX_DELTA:
+                blocks.append(block)
+                block = []
+            block.append(sample)
+        blocks.append(block)
+
+        rows = []
+        for block in blocks:
+            payload = bytearray()
+            previous = block[0][0]
+            for epoch, brightness_code, theme_code in block:
+                payload += bytes((epoch - previous, brightness_code, theme_code))
+                previous = epoch
+            rows.append((block[0][0], block[-1][0], len(block), bytes(payload)))
+
+        now = time.time()
+        prune = now - self.last_prune >= PRUNE_INTERVAL
+        db = timed_connect(self.db_file)
+        try:
+            with db:
+                db.executemany(
+                    "INSERT INTO sample_blocks (start_epoch, end_epoch, sample_count, payload) VALUES (?, ?, ?, ?)",
+                    rows
+                )
+                if prune:
+                    db.execute("DELETE FROM sample_blocks WHERE end_epoch < ?", (int(now - self.retention_seconds),))
+        finally:
+            db.close()
+        if prune:
+            self.last_prune = now
+        self.buffer = []
+
+    def samples(self, start_epoch, end_epoch):
+        """Decoded samples in [start_epoch, end_epoch] as (epochs, brightness, theme codes) arrays.
+
+        Unknown brightness comes back as NaN. Unflushed samples are included.
+        """
+        db = timed_connect(self.db_file)
+        try:
+            blocks = db.execute("""
+                SELECT start_epoch, payload FROM sample_blocks
+                WHERE end_epoch >= ? AND start_epoch <= ?
+                ORDER BY start_epoch
+            """, (int(start_epoch), int(end_epoch))).fetchall()
+        finally:
+            db.close()
+        with self.lock:
+            pending = list(self.buffer)
+
+        parts = []
+        for start, payload in blocks:
+            raw = np.frombuffer(payload, dtype=np.uint8).reshape(-1, 3)
+            epochs = start + np.cumsum(raw[:, 0], dtype=np.int64)
+            parts.append((epochs, raw[:, 1], raw[:, 2]))
+        if pending:
+            raw = np.array(pending, dtype=np.int64)
+            parts.append((raw[:, 0], raw[:, 1], raw[:, 2]))
+        if not parts:
+            return np.empty(0, np.int64), np.empty(0), np.empty(0, np.uint8)
+
+        epochs = np.concatenate([p[0] for p in parts])
+        brightness = np.concatenate([p[1] for p in parts]).astype(np.float64)
+        themes = np.concatenate([p[2] for p in parts]).astype(np.uint8)
+        brightness[brightness == UNKNOWN_BRIGHTNESS] = np.nan
+
+        keep = (epochs >= start_epoch) & (epochs <= end_epoch)
+        return epochs[keep], brightness[keep], themes[keep]
+
+    def aggregate(self, start_epoch, end_epoch):
+        """Brightness and theme summary of the samples in a time range"""
+        epochs, brightness, themes = self.samples(start_epoch, end_epoch)
+        known = brightness[~np.isnan(brightness)]
+        counts = np.bincount(themes, minlength=len(THEME_CODES)) if len(themes) else np.zeros(len(THEME_CODES), int)
+        dominant = None
+        if counts[1:].sum():
+            dominant = THEME_NAMES[int(np.argmax(counts[1:])) + 1]
+        return {
+            "samples": int(len(epochs)),
+            "avg_brightness": round(float(known.mean()), 1) if len(known) else None,
+            "min_brightness": int(known.min()) if len(known) else None,
+            "max_brightness": int(known.max()) if len(known) else None,
+            "theme_samples": {THEME_NAMES[code]: int(counts[code]) for code in THEME_NAMES if counts[code]},
+            "dominant_theme": dominant
+        }
@@ -0,0 +1,191 @@
+"""Compiled tree-ensemble inference for the fitted RandomForest models.
+
+sklearn's predict/predict_proba validate input, convert DataFrames and spin up
+joblib for every call, which dominates latency when scoring one session at a
+time. compile_forest() flattens every tree of a fitted forest into contiguous
+NumPy arrays once; CompiledForest then walks all trees for all rows together
+with a handful of vectorized array ops and returns the same outputs as sklearn.
+That wins for single rows and small batches; above BATCH_ROWS rows sklearn's
+Cython traversal is faster again, so larger batches are handed back to the
+fitted forest.
+
+Parity with sklearn is covered by test_tree_engine.py; run `python tree_engine.py`
+to time both paths on the bundled models.
+"""
+import copy
+import time
+import numpy as np
+
+BATCH_ROWS = 1000  # measured crossover on the bundled models; larger batches go to sklearn
+
+
+class CompiledForest:
+    """Flattened RandomForestClassifier: one node table shared by all trees"""
+
+    def __init__(self, feature, threshold, left, right, missing_left, value, roots, classes, fallback=None):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.missing_left = missing_left
+        self.value = value
+        self.roots = roots
+        self.classes_ = classes
+        self.n_trees = len(roots)
+        self.is_leaf = left == np.arange(len(left))
+        self.fallback = fallback  # fitted forest for batches above BATCH_ROWS; None after load()
+
+    def _leaves(self, X):
+        """Leaf index reached by every (row, tree) pair, shape (n_rows, n_trees)"""
+        # sklearn compares float32 features against float64 thresholds
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        n_rows, n_features = X.shape
+        flat_X = X.ravel()
+        has_nan = np.isnan(flat_X).any()
+
+        node = np.tile(self.roots, n_rows)
+        row_offset = np.repeat(np.arange(n_rows) * n_features, self.n_trees)
+        active = np.flatnonzero(~self.is_leaf[node])
+
+        # Step every unfinished path one level down, then drop the ones that hit a leaf
+        while active.size:
+            current = node[active]
+            x = flat_X[row_offset[active] + self.feature[current]]
+            go_left = x <= self.threshold[current]
+            if has_nan:
+                go_left |= np.isnan(x) & self.missing_left[current]
+            nxt = np.where(go_left, self.left[current], self.right[current])
+            node[active] = nxt
+            active = active[~self.is_leaf[nxt]]
+        return node.reshape(n_rows, self.n_trees)
+
+    def predict_proba(self, X):
+        X = np.asarray(X)
+        if self.fallback is not None and X.ndim == 2 and len(X) > BATCH_ROWS:
+            return self.fallback.predict_proba(X)
+        return self.compiled_proba(X)
+
+    def compiled_proba(self, X):
+        leaf_values = self.value[self._leaves(X)]
+        # Accumulate tree by tree like sklearn so results match bit for bit
+        proba = np.zeros((leaf_values.shape[0], leaf_values.shape[2]), dtype=np.float64)
+        for t in range(self.n_trees):
+            proba += leaf_values[:, t]
+        proba /= self.n_trees
+        return proba
+
+    def predict(self, X):
+        return self.classes_.take(np.argmax(self.predict_proba(X), axis=1))
+
+    def save(self, path):
+        np.savez(path, feature=self.feature, threshold=self.threshold, left=self.left,
+                 right=self.right, missing_left=self.missing_left, value=self.value,
+                 roots=self.roots, classes=self.classes_)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(**{name: data[name] for name in data.files})
+
+
+def compile_forest(model):
+    """Flatten a fitted RandomForestClassifier into a CompiledForest"""
+    features, thresholds, lefts, rights, missing, values, roots = [], [], [], [], [], [], []
+    offset = 0
+
+    for estimator in model.estimators_:
+        tree = estimator.tree_
+        n = tree.node_count
+        is_leaf = tree.children_left == -1
+        own = np.arange(offset, offset + n)
+
+        feature = np.where(is_leaf, 0, tree.feature)
+        # Leaves point back to themselves and are recognised by left == own index
+        threshold = np.where(is_leaf, np.inf, tree.threshold)
+        left = np.where(is_leaf, own, tree.children_left + offset)
+        right = np.where(is_leaf, own, tree.children_right + offset)
+        missing_left = getattr(tree, "missing_go_to_left", np.zeros(n, dtype=np.uint8)).astype(bool)
+
+        # Per-tree class probabilities at each node, as DecisionTreeClassifier.predict_proba
+        value = tree.value[:, 0, :].astype(np.float64)
+        normalizer = value.sum(axis=1, keepdims=True)
+        normalizer[normalizer == 0.0] = 1.0
+        value = value / normalizer
+
+        features.append(feature)
+        thresholds.append(threshold)
+        lefts.append(left)
+        rights.append(right)
+        missing.append(missing_left)
+        values.append(value)
+        roots.append(offset)
+        offset += n
+
+    return CompiledForest(
+        feature=np.ascontiguousarray(np.concatenate(features), dtype=np.intp),
+        threshold=np.ascontiguousarray(np.concatenate(thresholds), dtype=np.float64),
+        left=np.ascontiguousarray(np.concatenate(lefts), dtype=np.intp),
+        right=np.ascontiguousarray(np.concatenate(rights), dtype=np.intp),
+        missing_left=np.ascontiguousarray(np.concatenate(missing)),
+        value=np.ascontiguousarray(np.concatenate(values)),
+        roots=np.asarray(roots, dtype=np.intp),
+        classes=np.asarray(model.classes_),
+        fallback=_unnamed(model)
+    )
+
+
+def _unnamed(model):
+    """Shallow copy of a fitted model that accepts plain arrays without a feature-name warning"""
+    model = copy.copy(model)
+    if hasattr(model, "feature_names_in_"):
+        del model.feature_names_in_
+    return model
+
+
+def _time_model(name, model, X):
+    """Time single-row and batch scoring through sklearn, the compiled walk and the dispatcher"""
+    engine = compile_forest(model)
+    print(f"{name}: {len(X)} rows")
+    for label, batch in (("single row", X[:1]), ("batch", X)):
+        timings = {}
+        for path, fn in (("sklearn", model.predict_proba), ("compiled", engine.compiled_proba),
+                         ("dispatched", engine.predict_proba)):
+            fn(batch)
+            runs = 50 if len(batch) == 1 else 5
+            start = time.perf_counter()
+            for _ in range(runs):
+                fn(batch)
+            timings[path] = (time.perf_counter() - start) / runs * 1000
+        print(f"  {label:<10} sklearn {timings['sklearn']:8.3f} ms   compiled {timings['compiled']:8.3f} ms"
+              f"   ({timings['sklearn'] / timings['compiled']:.1f}x)   dispatched {timings['dispatched']:8.3f} ms")
+
+
+def sample_inputs(n, n_apps, seed=0):
+    """Random fatigue and productivity feature rows over the ranges the services produce"""
+    rng = np.random.default_rng(seed)
+    X_fatigue = np.column_stack([
+        rng.uniform(0, 240, n),
+        rng.integers(0, 101, n),
+        rng.integers(0, 2, n)
+    ]).astype(np.float64)
+    X_productivity = np.column_stack([
+        rng.integers(1, 3600, n),
+        rng.integers(0, 101, n),
+        rng.integers(0, 24, n),
+        rng.integers(-1, n_apps, n)
+    ]).astype(np.float64)
+    return X_fatigue, X_productivity
+
+
+if __name__ == "__main__":
+    import joblib
+    import warnings
+    warnings.filterwarnings("ignore")
+
+    fatigue_model = joblib.load("fatigue_model.pkl")
+    productivity_model, le_app = joblib.load("productivity_model.pkl")
+    X_fatigue, X_productivity = sample_inputs(5000, len(le_app.classes_))
+    _time_model("fatigue_model", fatigue_model, X_fatigue)
+    _time_model("productivity_model", productivity_model, X_productivity)
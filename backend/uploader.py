@@ -0,0 +1,202 @@
+"""Uploads this tracker's sessions to a fleet aggregation server.
+
+Sessions are appended to a local spool database as they are logged, so
+nothing is lost while the server is unreachable. Every flush seals the
+pending sessions into batches of up to batch_size, each with the next
+sequence number for this device, and POSTs them in order to the server's
+/ingest endpoint (see ingest.py) as gzip JSON. A batch is removed from the
+spool only once the server has acknowledged it; after a network or server
+error the uploader backs off exponentially and retries the same batch with
+the same sequence number, which the server stores at most once.
+
+The device id is generated once (host name plus a random suffix) and kept in
+the spool, so a fresh spool never reuses an old device's sequence numbers.
+
+Simulate a fleet against a local server with
+
+    python uploader.py --url http://127.0.0.1:5004/ingest [--devices 100] [--sessions 2000]
+"""
+import json
+import os
+import platform
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from ingest import encode_batch, SESSION_FIELDS
+from metrics import timed_connect
+
+SPOOL_FILE = "upload_spool.db"
+BATCH_SIZE = 500
+FLUSH_INTERVAL = 30
+MIN_BACKOFF = 1.0
+MAX_BACKOFF = 300.0
+REQUEST_TIMEOUT = 10
+
+
+class SessionUploader:
+    """Spools sessions locally and ships them to /ingest in sequenced batches"""
+
+    def __init__(self, url, spool_file=SPOOL_FILE, device_id=None, batch_size=BATCH_SIZE,
+                 flush_interval=FLUSH_INTERVAL):
+        self.url = url
+        self.spool_file = spool_file
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.failures = 0
+        self.sent_batches = 0
+        self.last_error = None
+        self.db = timed_connect(spool_file, check_same_thread=False)
+        self.db.execute("CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS pending (id INTEGER PRIMARY KEY AUTOINCREMENT, session TEXT)")
+        # AUTOINCREMENT: sequence numbers never go back, even after sent batches are deleted
+        self.db.execute("CREATE TABLE IF NOT EXISTS outbox (seq INTEGER PRIMARY KEY AUTOINCREMENT, payload BLOB)")
+        self.device_id = device_id or self._stored_device_id()
+        self.db.commit()
+
+    def _stored_device_id(self):
+        row = self.db.execute("SELECT value FROM state WHERE key = 'device_id'").fetchone()
+        if row:
+            return row[0]
+        device_id = f"{platform.node() or 'device'}-{uuid.uuid4().hex[:8]}"
+        self.db.execute("INSERT INTO state (key, value) VALUES ('device_id', ?)", (device_id,))
+        return device_id
+
+    def enqueue(self, session):
+        """Spool one session (a dict with SESSION_FIELDS); wakes the sender once a batch is full"""
+        with self.lock:
+            self.db.execute("INSERT INTO pending (session) VALUES (?)",
+                            (json.dumps({field: session.get(field) for field in SESSION_FIELDS}),))
+            self.db.commit()
+            backlog = self.db.execute("SELECT COUNT(*) FROM pending").fetchone()[0]
+        if backlog >= self.batch_size:
+            self.wake.set()
+
+    def enqueue_many(self, sessions):
+        with self.lock:
+            self.db.executemany("INSERT INTO pending (session) VALUES (?)", [
+                (json.dumps({field: session.get(field) for field in SESSION_FIELDS}),) for session in sessions
+            ])
+            self.db.commit()
+
+    def seal(self):
+        """Turn pending sessions into numbered outbox batches; returns how many were sealed"""
+        sealed = 0
+        with self.lock:
+            while True:
+                rows = self.db.execute("SELECT id, session FROM pending ORDER BY id LIMIT ?",
+                                       (self.batch_size,)).fetchall()
+                if not rows:
+                    return sealed
+                with self.db:
+                    seq = self.db.execute("INSERT INTO outbox (payload) VALUES (NULL)").lastrowid
+                    payload = encode_batch(self.device_id, seq, [json.loads(row[1]) for row in rows])
+                    self.db.execute("UPDATE outbox SET payload = ? WHERE seq = ?", (payload, seq))
+                    self.db.execute("DELETE FROM pending WHERE id <= ?", (rows[-1][0],))
+                sealed += 1
+
+    def send(self):
+        """POST outbox batches oldest first until it is empty; raises on network or server errors"""
+        sent = 0
+        while True:
+            with self.lock:
+                row = self.db.execute("SELECT seq, payload FROM outbox ORDER BY seq LIMIT 1").fetchone()
+            if row is None:
+                return sent
+            seq, payload = row
+            request = urllib.request.Request(self.url, data=payload, method="POST", headers={
+                "Content-Type": "application/json",
+                "Content-Encoding": "gzip"
+            })
+            try:
+                urllib.request.urlopen(request, timeout=REQUEST_TIMEOUT).close()
+            except urllib.error.HTTPError as e:
+                if e.code >= 500 or e.code in (408, 429):
+                    raise
+                # The server will never take this batch; drop it rather than block the rest
+                print(f"Upload of batch {seq} rejected ({e.code}): {e.read()[:200]!r}")
+            with self.lock:
+                with self.db:
+                    self.db.execute("DELETE FROM outbox WHERE seq = ?", (seq,))
+            sent += 1
+            self.sent_batches += 1
+
+    def flush(self):
+        """Seal and send everything; returns the number of batches sent"""
+        self.seal()
+        return self.send()
+
+    def backlog(self):
+        with self.lock:
+            pending, batches = self.db.execute(
+                "SELECT (SELECT COUNT(*) FROM pending), (SELECT COUNT(*) FROM outbox)"
+            ).fetchone()
+        return {"pending_sessions": pending, "outbox_batches": batches}
+
+    def run(self):
+        """Background loop: flush every flush_interval seconds, backing off while offline"""
+        while True:
+            try:
+                self.flush()
+                self.failures = 0
+                delay = self.flush_interval
+            except (urllib.error.URLError, OSError) as e:
+                self.failures += 1
+                self.last_error = str(e)
+                delay = min(MAX_BACKOFF, MIN_BACKOFF * 2 ** (self.failures - 1))
+                delay *= random.uniform(0.5, 1.0)  # spread out a fleet coming back online together
+            self.wake.wait(delay)
+            self.wake.clear()
+
+    def start(self):
+        threading.Thread(target=self.run, daemon=True).start()
+        return self
+
+
+def simulate_fleet(url, devices, sessions, workdir, batch_size=BATCH_SIZE, threads=16):
+    """Upload synthetic sessions from `devices` simulated trackers; returns (sessions, batches, seconds)"""
+    from concurrent.futures import ThreadPoolExecutor
+    from workload import generate_sessions
+
+    columns = SESSION_FIELDS
+
+    def run_device(index):
+        uploader = SessionUploader(url, spool_file=os.path.join(workdir, f"spool_{index}.db"),
+                                   device_id=f"sim-{index:05d}", batch_size=batch_size)
+        for rows in generate_sessions(sessions, seed=index):
+            uploader.enqueue_many([dict(zip(columns, row)) for row in rows])
+        for attempt in range(5):
+            try:
+                uploader.flush()
+                break
+            except (urllib.error.URLError, OSError):
+                time.sleep(MIN_BACKOFF * 2 ** attempt)
+        return uploader.sent_batches
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        batches = sum(pool.map(run_device, range(devices)))
+    return devices * sessions, batches, time.perf_counter() - started
+
+
+if __name__ == "__main__":
+    import argparse
+    import tempfile
+
+    parser = argparse.ArgumentParser(description="Upload synthetic sessions from many simulated devices")
+    parser.add_argument("--url", default="http://127.0.0.1:5004/ingest")
+    parser.add_argument("--devices", type=int, default=100)
+    parser.add_argument("--sessions", type=int, default=2000, help="sessions per device")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--threads", type=int, default=16, help="devices uploading at the same time")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="fleet_") as workdir:
+        total, batches, elapsed = simulate_fleet(args.url, args.devices, args.sessions, workdir,
+                                                 args.batch_size, args.threads)
+    print(f"Uploaded {total} sessions in {batches} batches from {args.devices} devices "
+          f"in {elapsed:.1f}s ({total / elapsed:,.0f} sessions/s)")
@@ -0,0 +1,159 @@
+"""Synthetic app_sessions data for load and scaling tests.
+
+Fills an app usage database with sessions that look like a real tracker's:
+back-to-back sessions through each day starting around the morning, long-tail
+(log-normal) durations, apps that depend on the time of day (work apps in
+office hours, media and games in the evening) and tend to repeat, brightness
+following daylight and a dark theme that is more likely at night. Everything
+is generated with NumPy in chunks, so a million rows take seconds.
+
+    python workload.py bench.db 100000 [--days 365] [--seed 0]
+"""
+import argparse
+import datetime
+import math
+import sqlite3
+import numpy as np
+
+# (app, weight during office hours, weight in the evening)
+APP_MIX = [
+    ("Code.exe", 30, 6),
+    ("explorer.exe", 8, 4),
+    ("electron.exe", 6, 3),
+    ("WINWORD.EXE", 8, 1),
+    ("EXCEL.EXE", 6, 1),
+    ("POWERPNT.EXE", 3, 0.5),
+    ("ShellHost.exe", 2, 2),
+    ("chrome.exe", 18, 20),
+    ("msedge.exe", 6, 5),
+    ("discord.exe", 3, 12),
+    ("spotify.exe", 3, 8),
+    ("vlc.exe", 1, 12),
+    ("steam.exe", 0.5, 10),
+    ("Teams.exe", 10, 1),
+    ("notepad.exe", 3, 2),
+]
+SESSIONS_PER_DAY = 300
+REPEAT_PROBABILITY = 0.35   # chance the next session is the same app again
+MISSING_BRIGHTNESS = 0.05
+CHUNK_SIZE = 50_000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS app_sessions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    app TEXT,
+    start_time TEXT,
+    end_time TEXT,
+    duration_seconds INTEGER,
+    brightness INTEGER,
+    theme_mode TEXT,
+    duration_ms INTEGER
+)
+"""
+
+
+def _format_times(moments):
+    """datetime64[ms] array -> 'YYYY-MM-DD HH:MM:SS.mmm' strings, as the tracker writes them"""
+    return np.char.replace(np.datetime_as_string(moments, unit="ms"), "T", " ")
+
+
+def generate_sessions(count, days=None, seed=0, end_date=None):
+    """Yield lists of row tuples (app, start, end, seconds, brightness, theme, ms), oldest first.
+
+    Sessions are spread over `days` days ending on end_date (default today),
+    about SESSIONS_PER_DAY per day unless days is given.
+    """
+    rng = np.random.default_rng(seed)
+    days = days or max(1, math.ceil(count / SESSIONS_PER_DAY))
+    end_date = end_date or datetime.date.today()
+    first_day = np.datetime64(end_date - datetime.timedelta(days=days - 1), "ms")
+
+    apps = np.array([name for name, _, _ in APP_MIX])
+    office = np.array([w for _, w, _ in APP_MIX], dtype=float)
+    evening = np.array([w for _, _, w in APP_MIX], dtype=float)
+    office_cdf = np.cumsum(office / office.sum())
+    evening_cdf = np.cumsum(evening / evening.sum())
+    day_start_ms = rng.integers(7 * 3600, 13 * 3600, days) * 1000  # first session of each day
+
+    for offset in range(0, count, CHUNK_SIZE):
+        size = min(CHUNK_SIZE, count - offset)
+        index = np.arange(offset, offset + size)
+        day = (index * days) // count
+
+        duration_ms = np.clip(rng.lognormal(np.log(40_000), 1.2, size), 1000, 2 * 3600 * 1000).astype(np.int64)
+        gap_ms = rng.exponential(15_000, size).astype(np.int64)
+        step = duration_ms + gap_ms
+
+        # Sessions follow each other within a day: offset = sum of earlier steps that day
+        elapsed = np.cumsum(step) - step
+        first_of_day = np.r_[True, day[1:] != day[:-1]]
+        elapsed -= np.maximum.accumulate(np.where(first_of_day, elapsed, 0))
+        if offset:
+            elapsed[day == carry_day] += carry_elapsed
+        carry_day, carry_elapsed = day[-1], elapsed[-1] + step[-1]
+
+        start_ms = day.astype(np.int64) * 86_400_000 + day_start_ms[day] + elapsed
+        hour = (start_ms // 3_600_000) % 24
+
+        # Time-of-day app choice, then stick with the previous app some of the time
+        draws = rng.random(size)
+        is_evening = (hour >= 18) | (hour < 6)
+        choice = np.where(is_evening, np.searchsorted(evening_cdf, draws), np.searchsorted(office_cdf, draws))
+        choice = np.minimum(choice, len(apps) - 1)
+        repeat = rng.random(size) < REPEAT_PROBABILITY
+        repeat[0] = False
+        keep = np.maximum.accumulate(np.where(repeat, 0, np.arange(size)))
+        choice = choice[keep]
+
+        # Brightness tracks daylight (peak early afternoon), plus noise and missing reads
+        daylight = np.clip(np.sin(np.pi * (hour + (start_ms % 3_600_000) / 3_600_000 - 6) / 14), 0, 1)
+        brightness = np.clip(np.round(25 + 60 * daylight + rng.normal(0, 8, size)), 0, 100).astype(int)
+        brightness_missing = rng.random(size) < MISSING_BRIGHTNESS
+
+        dark_probability = np.where(is_evening, 0.85, 0.3)
+        theme_draw = rng.random(size)
+        theme = np.where(theme_draw < 0.03, "Unknown", np.where(theme_draw < dark_probability, "Dark", "Light"))
+
+        starts = first_day + start_ms.astype("timedelta64[ms]")
+        ends = starts + duration_ms.astype("timedelta64[ms]")
+        rows = zip(
+            apps[choice].tolist(),
+            _format_times(starts).tolist(),
+            _format_times(ends).tolist(),
+            (duration_ms // 1000).tolist(),
+            [None if missing else value for missing, value in zip(brightness_missing.tolist(), brightness.tolist())],
+            theme.tolist(),
+            duration_ms.tolist()
+        )
+        yield list(rows)
+
+
+def populate(db_file, count, days=None, seed=0, end_date=None):
+    """Append `count` synthetic sessions to db_file, one transaction per chunk"""
+    db = sqlite3.connect(db_file)
+    try:
+        db.execute(SCHEMA)
+        for rows in generate_sessions(count, days=days, seed=seed, end_date=end_date):
+            with db:
+                db.executemany("""
+                    INSERT INTO app_sessions
+                    (app, start_time, end_time, duration_seconds, brightness, theme_mode, duration_ms)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                """, rows)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    import time
+
+    parser = argparse.ArgumentParser(description="Fill an app usage database with synthetic sessions")
+    parser.add_argument("db_file")
+    parser.add_argument("count", type=int)
+    parser.add_argument("--days", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    populate(args.db_file, args.count, days=args.days, seed=args.seed)
+    print(f"Wrote {args.count} sessions to {args.db_file} in {time.perf_counter() - started:.1f}s")